@@ -13,13 +13,25 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import hashlib
 import os
 
 from binascii import hexlify
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 from progress.bar import IncrementalBar
 
+from synnefo.lib.merkle import MerkleTree, hash_blocks
+
+_hash_pool = None
+
+
+def get_hash_pool():
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ThreadPool(cpu_count())
+    return _hash_pool
+
 
 def file_read_iterator(fp, size=1024):
     while True:
@@ -36,28 +48,8 @@ class HashMap(list):
         self.blocksize = blocksize
         self.blockhash = blockhash
 
-    def _hash_raw(self, v):
-        h = hashlib.new(self.blockhash)
-        h.update(v)
-        return h.digest()
-
-    def _hash_block(self, v):
-        return self._hash_raw(v.rstrip('\x00'))
-
     def hash(self):
-        if len(self) == 0:
-            return self._hash_raw('')
-        if len(self) == 1:
-            return self.__getitem__(0)
-
-        h = list(self)
-        s = 2
-        while s < len(h):
-            s = s * 2
-        h += [('\x00' * len(h[0]))] * (s - len(h))
-        while len(h) > 1:
-            h = [self._hash_raw(h[x] + h[x + 1]) for x in range(0, len(h), 2)]
-        return h[0]
+        return MerkleTree(self.blockhash, self).root()
 
     def load(self, fp):
         self.size = 0
@@ -65,9 +57,15 @@ class HashMap(list):
         nblocks = 1 + (file_size - 1) // self.blocksize
         bar = IncrementalBar('Computing', max=nblocks)
         bar.suffix = '%(percent).1f%% - %(eta)ds'
-        for block in bar.iter(file_read_iterator(fp, self.blocksize)):
-            self.append(self._hash_block(block))
-            self.size += len(block)
+
+        def blocks():
+            for block in bar.iter(file_read_iterator(fp, self.blocksize)):
+                self.size += len(block)
+                yield block
+
+        # Blocks are hashed in parallel, as they are read.
+        self.extend(hash_blocks(blocks(), self.blockhash,
+                                pool=get_hash_pool()))
 
 
 def merkle(path, blocksize=4194304, blockhash='sha256'):
@@ -0,0 +1,257 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Merkle trees over block hashes, as used by Pithos.
+
+The top hash of a list of block hashes is computed by padding the list with
+zero hashes up to the next power of two and hashing pairs of hashes, level
+by level, up to a single hash. The top hash of a single block hash is the
+block hash itself and the top hash of no hashes is the hash of ''.
+
+MerkleTree keeps all the levels of the tree, so that changing a few block
+hashes only rehashes the paths from them to the root.
+"""
+
+import hashlib
+import threading
+from collections import deque
+from functools import partial
+from itertools import imap
+
+from synnefo.lib.ordereddict import OrderedDict
+
+_tree_caches = {}
+_tree_caches_lock = threading.Lock()
+
+
+def block_hash(blockhash, data):
+    """Return the hash of a block, ignoring trailing zeros."""
+
+    h = hashlib.new(blockhash)
+    h.update(data.rstrip('\x00'))
+    return h.digest()
+
+
+def hash_blocks(blocks, blockhash, pool=None, window=None):
+    """Return an iterator over the hashes of the given blocks.
+
+    If a thread pool is given, blocks are hashed in parallel, since hashlib
+    releases the GIL while hashing, with at most 'window' blocks (by default
+    twice the pool size) read ahead. Hashes are returned in block order.
+    """
+
+    f = partial(block_hash, blockhash)
+    if pool is None:
+        return imap(f, blocks)
+    if window is None:
+        window = 2 * len(pool._pool)
+    return _hash_blocks_parallel(f, blocks, pool, window)
+
+
+def _hash_blocks_parallel(f, blocks, pool, window):
+    pending = deque()
+    for block in blocks:
+        pending.append(pool.apply_async(f, (block,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _capacity(length):
+    capacity = 2
+    while capacity < length:
+        capacity *= 2
+    return capacity
+
+
+class MerkleTree(object):
+    """The Merkle tree of a list of block hashes."""
+
+    def __init__(self, blockhash, hashes=()):
+        self.blockhash = blockhash
+        self._proto = hashlib.new(blockhash)
+        # The top hash of an all-zero subtree of each height.
+        self._zeros = ['\x00' * self._proto.digest_size]
+        self.build(hashes)
+
+    def __len__(self):
+        return self.length
+
+    def _hash_pair(self, left, right):
+        h = self._proto.copy()
+        h.update(left)
+        h.update(right)
+        return h.digest()
+
+    def _zero(self, height):
+        while len(self._zeros) <= height:
+            z = self._zeros[-1]
+            self._zeros.append(self._hash_pair(z, z))
+        return self._zeros[height]
+
+    def build(self, hashes):
+        """Compute the tree of hashes from scratch."""
+
+        leaves = list(hashes)
+        self.length = len(leaves)
+        self.capacity = _capacity(self.length)
+        level = leaves + [self._zero(0)] * (self.capacity - self.length)
+        self.levels = [level]
+        height, used = 0, self.length
+        pair = self._hash_pair
+        while len(level) > 1:
+            # Subtrees made only of padding need not be hashed.
+            height += 1
+            used = (used + 1) // 2
+            below = level
+            level = [pair(below[i], below[i + 1])
+                     for i in xrange(0, 2 * used, 2)]
+            level += [self._zero(height)] * (len(below) // 2 - used)
+            self.levels.append(level)
+
+    def leaves(self):
+        return self.levels[0][:self.length]
+
+    def root(self):
+        """Return the top hash."""
+
+        if self.length == 0:
+            h = self._proto.copy()
+            return h.digest()
+        if self.length == 1:
+            return self.levels[0][0]
+        return self.levels[-1][0]
+
+    def _grow(self, length):
+        while self.capacity < length:
+            for height, level in enumerate(self.levels):
+                level.extend([self._zero(height)] * len(level))
+            top = self.levels[-1]
+            self.levels.append([self._hash_pair(top[0], top[1])])
+            self.capacity *= 2
+
+    def _rehash(self, indices):
+        dirty = sorted(set(indices))
+        pair = self._hash_pair
+        for below, level in zip(self.levels, self.levels[1:]):
+            parents = []
+            for i in dirty:
+                i //= 2
+                if not parents or parents[-1] != i:
+                    parents.append(i)
+                    level[i] = pair(below[2 * i], below[2 * i + 1])
+            dirty = parents
+
+    def update(self, index, h):
+        """Replace the block hash at index and update the path to the root.
+        """
+
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        self.levels[0][index] = h
+        self._rehash((index,))
+
+    def append(self, h):
+        self._grow(self.length + 1)
+        self.length += 1
+        self.update(self.length - 1, h)
+
+    def update_leaves(self, hashes):
+        """Replace the block hashes of the tree.
+
+        Only the paths from the hashes that actually changed to the root are
+        rehashed, so this is cheap when the new hashes are mostly the same as
+        the old ones (e.g. for a new version of an object).
+        """
+
+        hashes = list(hashes)
+        length = len(hashes)
+        capacity = _capacity(length)
+        if capacity < self.capacity:
+            return self.build(hashes)
+        self._grow(length)
+        leaves = self.levels[0]
+        zero = self._zero(0)
+        dirty = [i for i, h in enumerate(hashes) if leaves[i] != h]
+        dirty.extend(xrange(length, self.length))
+        leaves[:length] = hashes
+        leaves[length:self.length] = [zero] * max(self.length - length, 0)
+        self.length = length
+        self._rehash(dirty)
+
+    def copy(self):
+        tree = MerkleTree.__new__(MerkleTree)
+        tree.blockhash = self.blockhash
+        tree._proto = self._proto
+        tree._zeros = list(self._zeros)
+        tree.length = self.length
+        tree.capacity = self.capacity
+        tree.levels = [list(level) for level in self.levels]
+        return tree
+
+
+def merkle(hashes, blockhash):
+    """Return the top hash of a list of block hashes."""
+
+    return MerkleTree(blockhash, hashes).root()
+
+
+class MerkleTreeCache(object):
+    """A thread-safe LRU cache of Merkle trees keyed by their top hash.
+
+    The cache holds trees with at most 'size' block hashes in total.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.used = 0
+        self.trees = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, root):
+        """Return a copy of the cached tree with the given top hash or None.
+        """
+
+        with self.lock:
+            tree = self.trees.pop(root, None)
+            if tree is None:
+                return None
+            self.trees[root] = tree
+        return tree.copy()
+
+    def put(self, tree):
+        if tree.length > self.size:
+            return
+        root = tree.root()
+        with self.lock:
+            old = self.trees.pop(root, None)
+            if old is not None:
+                self.used -= old.length
+            self.trees[root] = tree
+            self.used += tree.length
+            while self.used > self.size:
+                _, old = self.trees.popitem(last=False)
+                self.used -= old.length
+
+
+def get_merkle_tree_cache(size):
+    """Return the MerkleTreeCache of the process for the given size."""
+
+    with _tree_caches_lock:
+        cache = _tree_caches.get(size)
+        if cache is None:
+            cache = _tree_caches[size] = MerkleTreeCache(size)
+        return cache
@@ -57,6 +57,12 @@ CYCLADES_FORCED_SERVER_NETWORKS = []
 # Maximum allowed network size for private networks.
 MAX_CIDR_BLOCK = 22
 
+# Number of shards in which each IP pool of a new public subnet is split.
+# Concurrent allocations of public IPv4 addresses lock only the shard they
+# allocate from. Existing subnets can be split with 'snf-manage subnet-modify
+# --ip-pool-shards'.
+CYCLADES_PUBLIC_IP_POOL_SHARDS = 1
+
 # Default settings used by network flavors
 DEFAULT_MAC_PREFIX = 'aa:00:0'
 DEFAULT_BRIDGE = 'br0'
@@ -50,3 +50,14 @@ DISPATCHER_LOGGING_SETUP = {
 #    'level': 'INFO',
 #   'propagate': False
 #}
+
+# Number of worker threads that process the messages received by
+# snf-dispatcher. Messages of the same instance or network are always handled
+# by the same worker, in the order they were received. Set to 0 to process the
+# messages in the thread that receives them.
+DISPATCHER_WORKERS = 0
+
+# Maximum number of messages that a worker thread handles at once. Messages
+# made redundant by a later message of the same batch are acknowledged without
+# being processed.
+DISPATCHER_BATCH_SIZE = 50
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0006_add_projectbackend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backend',
+            name='reconciled_job_id',
+            field=models.BigIntegerField(null=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='backend',
+            name='reconciled_backendtime',
+            field=models.DateTimeField(null=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='backend',
+            name='fully_reconciled',
+            field=models.DateTimeField(null=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0007_backend_reconciliation_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bridgepooltable',
+            name='available_count',
+            field=models.IntegerField(null=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='bridgepooltable',
+            name='cursor',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='macprefixpooltable',
+            name='available_count',
+            field=models.IntegerField(null=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='macprefixpooltable',
+            name='cursor',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='ippooltable',
+            name='available_count',
+            field=models.IntegerField(null=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='ippooltable',
+            name='cursor',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '0008_pooltable_available_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backend',
+            name='unreconciled_servers',
+            field=models.TextField(default=''),
+            preserve_default=True,
+        ),
+    ]
@@ -120,6 +120,14 @@ class Backend(models.Model):
     ctotal = models.PositiveIntegerField('Total number of logical processors',
                                          default=0, null=False)
     public = models.BooleanField('Public', null=False)
+    # State of incremental reconciliation: All jobs up to this job ID have
+    # been reconciled, along with all servers whose backendtime is up to the
+    # following time. The last full reconciliation is also kept, along with
+    # the comma-separated IDs of the servers that were left unreconciled.
+    reconciled_job_id = models.BigIntegerField(null=True)
+    reconciled_backendtime = models.DateTimeField(null=True)
+    fully_reconciled = models.DateTimeField(null=True)
+    unreconciled_servers = models.TextField(default="")
 
     HYPERVISORS = (
         ("kvm", "Linux KVM hypervisor"),
@@ -927,14 +935,31 @@ class IPAddress(models.Model):
         unique_together = ("network", "address", "deleted")
 
     def release_address(self):
-        """Release the IPv4 address."""
+        """Release the IPv4 address.
+
+        Only the pool that contains the address is locked. If the pools of
+        the subnet have been split again since they were read, the current
+        pools of the subnet are read again.
+
+        """
         if self.ipversion == 4:
-            for pool_row in self.subnet.ip_pools.all():
-                ip_pool = pool_row.pool
-                if ip_pool.contains(self.address):
-                    ip_pool.put(self.address)
-                    ip_pool.save()
-                    return
+            tried = set()
+            pool_rows = list(self.subnet.ip_pools.all())
+            while pool_rows:
+                pool_row = pool_rows.pop(0)
+                tried.add(pool_row.id)
+                if not pool_row.pool.contains(self.address):
+                    continue
+                try:
+                    ip_pool = self.subnet.ip_pools.select_for_update()\
+                                                  .get(id=pool_row.id).pool
+                except IPPoolTable.DoesNotExist:
+                    pool_rows = list(self.subnet.ip_pools
+                                                .exclude(id__in=tried))
+                    continue
+                ip_pool.put(self.address)
+                ip_pool.save()
+                return
             log.error("Cannot release address %s of NIC %s. Address does not"
                       " belong to any of the IP pools of the subnet %s !",
                       self.address, self.nic, self.subnet_id)
@@ -1100,6 +1125,11 @@ class PoolTable(models.Model):
     available_map = models.TextField(default="", null=False)
     reserved_map = models.TextField(default="", null=False)
     size = models.IntegerField(null=False)
+    # The number of available values, if known, and an index below which no
+    # value is available. They are kept by the PoolManager, so that values
+    # can be allocated without decoding the whole maps.
+    available_count = models.IntegerField(null=True)
+    cursor = models.IntegerField(default=0)
 
     # Optional Fields
     base = models.CharField(null=True, max_length=32)
@@ -30,12 +30,19 @@ class PoolManager(object):
 
     The object that will be used in order to initialize this pool, must have
     two string attributes (available_map and reserved_map) and the size of the
-    pool.
+    pool. It may also keep the number of available values (available_count)
+    and an index below which no value is available (cursor).
 
     Subclasses of PoolManager must implement value_to_index and index_to_value
     method's in order to denote how the value will be mapped to the index in
     the bitarray.
 
+    The maps are kept in their base64 encoding, and only the parts of them
+    that hold the values being read or changed are decoded and encoded again.
+    Getting a value decodes the maps from the cursor on, up to the first
+    available value. The maps are decoded as a whole only when they are asked
+    for, e.g. to count the reserved values or to resize the pool.
+
     Important!!: Updates on a PoolManager object are not reflected to the DB,
     until save() method is called.
 
@@ -43,12 +50,18 @@ class PoolManager(object):
     def __init__(self, pool_table):
         self.pool_table = pool_table
         self.pool_size = pool_table.size
+        self._saved_size = pool_table.size
         if pool_table.available_map:
-            self.available = _bitarray_from_string(pool_table.available_map)
-            self.reserved = _bitarray_from_string(pool_table.reserved_map)
+            self._available = _LazyMap(pool_table.available_map)
+            self._reserved = _LazyMap(pool_table.reserved_map)
+            self._count = getattr(pool_table, 'available_count', None)
+            self._cursor = getattr(pool_table, 'cursor', None) or 0
         else:
-            self.available = self._create_empty_pool(self.pool_size)
-            self.reserved = self._create_empty_pool(self.pool_size)
+            self._available = _LazyMap(bits=self._create_empty_pool(
+                self.pool_size))
+            self._reserved = _LazyMap(bits=self._create_empty_pool(
+                self.pool_size))
+            self._reset()
             self.add_padding(self.pool_size)
 
     def _create_empty_pool(self, size):
@@ -56,19 +69,59 @@ class PoolManager(object):
         ba.setall(AVAILABLE)
         return ba
 
+    def _reset(self):
+        """Forget the count and the cursor after the maps are replaced."""
+        self._count = None
+        self._cursor = 0
+
+    @property
+    def available(self):
+        return self._available.bits()
+
+    @available.setter
+    def available(self, value):
+        self._available = _LazyMap(bits=value)
+        self._reset()
+
+    @property
+    def reserved(self):
+        return self._reserved.bits()
+
+    @reserved.setter
+    def reserved(self, value):
+        self._reserved = _LazyMap(bits=value)
+        self._reset()
+
     def add_padding(self, pool_size):
         bits = find_padding(pool_size)
-        self.available.extend([UNAVAILABLE] * bits)
-        self.reserved.extend([UNAVAILABLE] * bits)
+        self.available = self.available + bitarray([UNAVAILABLE] * bits)
+        self.reserved = self.reserved + bitarray([UNAVAILABLE] * bits)
 
     def cut_padding(self, pool_size):
         bits = find_padding(pool_size)
-        self.available = self.available[:-bits]
-        self.reserved = self.reserved[:-bits]
+        if bits:
+            self.available = self.available[:-bits]
+            self.reserved = self.reserved[:-bits]
 
     @property
     def pool(self):
-        return (self.available & self.reserved)
+        return self.available & self.reserved
+
+    def _is_free(self, index):
+        return (self._available[index] == AVAILABLE and
+                self._reserved[index] == AVAILABLE)
+
+    def _find_free(self):
+        """Return the first available index from the cursor on."""
+        start = self._cursor
+        while start < self.pool_size:
+            group, offset = divmod(start, _GROUP_BITS)
+            bits = self._available.group(group) & self._reserved.group(group)
+            try:
+                return group * _GROUP_BITS + int(bits.index(AVAILABLE, offset))
+            except ValueError:
+                start = (group + 1) * _GROUP_BITS
+        raise EmptyPool
 
     def get(self, value=None):
         """Get a value from the pool."""
@@ -76,9 +129,10 @@ class PoolManager(object):
             if self.empty():
                 raise EmptyPool
             # Get the first available index
-            index = int(self.pool.index(AVAILABLE))
+            index = self._find_free()
             assert(index < self.pool_size)
             self._reserve(index)
+            self._cursor = index + 1
             return self.index_to_value(index)
         else:
             if not self.contains(value):
@@ -108,30 +162,53 @@ class PoolManager(object):
 
     def save(self, db=True):
         """Save changes to the DB."""
-        self.pool_table.available_map = _bitarray_to_string(self.available)
-        self.pool_table.reserved_map = _bitarray_to_string(self.reserved)
-        if db:
-            self.pool_table.save()
+        update_fields = []
+        for field, bits in (('available_map', self._available),
+                            ('reserved_map', self._reserved)):
+            if bits.changed():
+                setattr(self.pool_table, field, bits.encode())
+                update_fields.append(field)
+        for field, value in (('available_count', self.count_available()),
+                             ('cursor', self._cursor)):
+            if getattr(self.pool_table, field, None) != value:
+                setattr(self.pool_table, field, value)
+                update_fields.append(field)
+        if self.pool_table.size != self._saved_size:
+            update_fields.append('size')
+        if db and update_fields:
+            if getattr(self.pool_table, 'pk', None) is None:
+                self.pool_table.save()
+            else:
+                self.pool_table.save(update_fields=update_fields)
+        self._saved_size = self.pool_table.size
 
     def empty(self):
         """Return True when pool is empty."""
-        return not self.pool.any()
+        return self.count_available() == 0
 
     def size(self):
         """Return the size of the bitarray(original size + padding)."""
-        return self.pool.length()
+        return self.pool_size + find_padding(self.pool_size)
 
     def _reserve(self, index, external=False):
+        was_free = self._is_free(index)
         if external:
-            self.reserved[index] = UNAVAILABLE
+            self._reserved[index] = UNAVAILABLE
         else:
-            self.available[index] = UNAVAILABLE
+            self._available[index] = UNAVAILABLE
+        if was_free and self._count is not None:
+            self._count -= 1
 
     def _release(self, index, external=False):
+        was_free = self._is_free(index)
         if external:
-            self.reserved[index] = AVAILABLE
+            self._reserved[index] = AVAILABLE
         else:
-            self.available[index] = AVAILABLE
+            self._available[index] = AVAILABLE
+        if not was_free and self._is_free(index):
+            if self._count is not None:
+                self._count += 1
+            self._cursor = min(self._cursor, index)
 
     def contains(self, value, index=False):
         if index is False:
@@ -139,7 +216,9 @@ class PoolManager(object):
         return index >= 0 and index < self.pool_size
 
     def count_available(self):
-        return self.pool.count(AVAILABLE)
+        if self._count is None:
+            self._count = self.pool.count(AVAILABLE)
+        return self._count
 
     def count_unavailable(self):
         return self.pool_size - self.count_available()
@@ -157,7 +236,7 @@ class PoolManager(object):
             idx = self.value_to_index(value)
         else:
             idx = value
-        return self.pool[idx] == AVAILABLE
+        return self._is_free(idx)
 
     def is_reserved(self, value, index=False):
         if not self.contains(value, index=index):
@@ -166,7 +245,7 @@ class PoolManager(object):
             idx = self.value_to_index(value)
         else:
             idx = value
-        return self.reserved[idx] == UNAVAILABLE
+        return self._reserved[idx] == UNAVAILABLE
 
     def to_01(self):
         return self.pool[:self.pool_size].to01()
@@ -193,8 +272,8 @@ class PoolManager(object):
         self.cut_padding(self.pool_size)
         # Do the resize
         if bits_num > 0:
-            self.available.extend([AVAILABLE] * bits_num)
-            self.reserved.extend([AVAILABLE] * bits_num)
+            self.available = self.available + bitarray([AVAILABLE] * bits_num)
+            self.reserved = self.reserved + bitarray([AVAILABLE] * bits_num)
         else:
             self.available = self.available[:bits_num]
             self.reserved = self.reserved[:bits_num]
@@ -244,8 +323,79 @@ def _bitarray_from_string(bitarray_):
     return ba
 
 
-def _bitarray_to_string(bitarray_):
-    return b64encode(bitarray_.tobytes())
+# Every four characters of the base64 encoding of a map stand for a group of
+# three bytes.
+_GROUP_BITS = 24
+
+
+class _LazyMap(object):
+    """A bitarray that is kept in its base64 encoding.
+
+    Single bits are read and written by decoding only the group of bits that
+    holds them, and only the groups that changed are encoded again. The
+    whole bitarray is decoded only when it is asked for.
+
+    """
+    def __init__(self, encoded=None, bits=None):
+        self._encoded = encoded
+        self._bits = bits
+        self._groups = {}
+        self._dirty = set()
+
+    def bits(self):
+        """Return the whole bitarray."""
+        if self._bits is None:
+            bits = _bitarray_from_string(self._encoded)
+            for group, group_bits in self._groups.iteritems():
+                start = group * _GROUP_BITS
+                bits[start:start + group_bits.length()] = group_bits
+            self._bits = bits
+            self._groups = {}
+        return self._bits
+
+    def group(self, group):
+        """Return the bits of a group. They must not be changed."""
+        if self._bits is not None:
+            return self._bits[group * _GROUP_BITS:(group + 1) * _GROUP_BITS]
+        bits = self._groups.get(group)
+        if bits is None:
+            bits = self._groups[group] = \
+                _bitarray_from_string(self._encoded[4 * group:4 * group + 4])
+        return bits
+
+    def __getitem__(self, index):
+        if self._bits is not None:
+            return self._bits[index]
+        group, offset = divmod(index, _GROUP_BITS)
+        return self.group(group)[offset]
+
+    def __setitem__(self, index, value):
+        group, offset = divmod(index, _GROUP_BITS)
+        if self._bits is not None:
+            self._bits[index] = value
+        else:
+            self.group(group)[offset] = value
+        self._dirty.add(group)
+
+    def changed(self):
+        return self._encoded is None or bool(self._dirty)
+
+    def encode(self):
+        """Return the base64 encoding of the bitarray."""
+        if self._encoded is None or \
+           4 * len(self._dirty) > len(self._encoded) // 2:
+            self._encoded = b64encode(self.bits().tobytes())
+        else:
+            parts = []
+            end = 0
+            for group in sorted(self._dirty):
+                parts.append(self._encoded[end:4 * group])
+                parts.append(b64encode(self.group(group).tobytes()))
+                end = 4 * (group + 1)
+            parts.append(self._encoded[end:])
+            self._encoded = ''.join(parts)
+        self._dirty.clear()
+        return self._encoded
 
 ##
 ## Custom pools
@@ -18,8 +18,9 @@ from django.test import TestCase
 from synnefo.db.pools import (PoolManager, EmptyPool, BridgePool,
                               MacPrefixPool, IPPool, find_padding,
                               bitarray_to_map, ValueNotAvailable,
-                              InvalidValue)
+                              InvalidValue, AVAILABLE)
 from bitarray import bitarray
+from base64 import b64encode
 
 
 class DummyObject():
@@ -138,6 +139,67 @@ class PoolManagerTestCase(TestCase):
         self.assertEqual(pool.count_reserved(), 1)
         self.assertEqual(pool.count_unreserved(), 9)
 
+    def test_get_after_put(self):
+        obj = DummyObject(42)
+        pool = DummyPool(obj)
+        for i in range(0, 10):
+            pool.get()
+        pool.put(3)
+        self.assertEqual(pool.get(), 3)
+        self.assertEqual(pool.get(), 10)
+
+    def test_save_changed_values(self):
+        obj = DummyObject(200)
+        pool = DummyPool(obj)
+        pool.save()
+        for value in (0, 57, 58, 199):
+            pool._reserve(value)
+        pool._reserve(100, external=True)
+        pool.save()
+        b = DummyPool(obj)
+        self.assertEqual(b.available, pool.available)
+        self.assertEqual(b.reserved, pool.reserved)
+        self.assertEqual(obj.available_map,
+                         b64encode(pool.available.tobytes()))
+
+    def test_get_without_decoding(self):
+        obj = DummyObject(100000)
+        pool = DummyPool(obj)
+        for i in range(0, 1000):
+            pool.get()
+        pool.save()
+        self.assertEqual(obj.available_count, 99000)
+        self.assertEqual(obj.cursor, 1000)
+        b = DummyPool(obj)
+        self.assertEqual(b.get(), 1000)
+        b.put(10)
+        self.assertEqual(b.get(), 10)
+        self.assertEqual(b.get(), 1001)
+        self.assertEqual(b.count_available(), 98998)
+        # Only the groups of the values that were used are decoded
+        self.assertEqual(b._available._bits, None)
+        self.assertEqual(b._reserved._bits, None)
+        b.save()
+        c = DummyPool(obj)
+        self.assertEqual(c.available.count(AVAILABLE), 98998)
+        self.assertEqual(obj.available_map,
+                         b64encode(c.available.tobytes()))
+
+    def test_unknown_count(self):
+        obj = DummyObject(42)
+        pool = DummyPool(obj)
+        pool._reserve(5)
+        pool._reserve(7, external=True)
+        pool.save()
+        # Rows saved before the count was kept
+        obj.available_count = None
+        obj.cursor = 0
+        b = DummyPool(obj)
+        self.assertEqual(b.count_available(), 40)
+        self.assertEqual([b.get() for i in range(0, 7)],
+                         [0, 1, 2, 3, 4, 6, 8])
+
+
 
 class HelpersTestCase(TestCase):
     def test_find_padding(self):
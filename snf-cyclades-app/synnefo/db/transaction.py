@@ -25,6 +25,9 @@ functions:
  * commit_manually
  * commit
  * rollback
+ * savepoint
+ * savepoint_rollback
+ * savepoint_commit
 """
 
 
@@ -44,6 +47,21 @@ def rollback(using=None):
     transaction.rollback(using=using)
 
 
+def savepoint(using=None):
+    using = select_db("db") if using is None else using
+    return transaction.savepoint(using=using)
+
+
+def savepoint_rollback(sid, using=None):
+    using = select_db("db") if using is None else using
+    transaction.savepoint_rollback(sid, using=using)
+
+
+def savepoint_commit(sid, using=None):
+    using = select_db("db") if using is None else using
+    transaction.savepoint_commit(sid, using=using)
+
+
 def commit_on_success(using=None):
     method = transaction.commit_on_success
     return _transaction_func("db", method, using)
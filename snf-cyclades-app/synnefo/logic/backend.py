@@ -111,13 +111,16 @@ def handle_vm_quotas(vm, job_id, job_opcode, job_status, job_fields):
 
 @transaction.commit_on_success
 def process_op_status(vm, etime, jobid, opcode, status, logmsg, nics=None,
-                      disks=None, job_fields=None):
+                      disks=None, job_fields=None, flavors=None):
     """Process a job progress notification from the backend
 
     Process an incoming message from the backend (currently Ganeti).
     Job notifications with a terminating status (sucess, error, or canceled),
     also update the operating state of the VM.
 
+    An index of flavors, as returned by 'get_flavor_index', may be given to
+    look up a changed flavor without querying the DB.
+
     """
     # See #1492, #1031, #1111 why this line has been removed
     # if (opcode not in [x[0] for x in VirtualMachine.BACKEND_OPCODES] or
@@ -162,7 +165,8 @@ def process_op_status(vm, etime, jobid, opcode, status, logmsg, nics=None,
         if beparams:
             cpu = beparams.get("vcpus")
             ram = beparams.get("maxmem")
-            new_flavor = find_new_flavor(vm, cpu=cpu, ram=ram)
+            new_flavor = find_new_flavor(vm, cpu=cpu, ram=ram,
+                                         flavors=flavors)
 
         # XXX: Update backendtime only for jobs that have been successfully
         # completed, since only these jobs update the state of the VM. Else a
@@ -233,8 +237,19 @@ def process_op_status(vm, etime, jobid, opcode, status, logmsg, nics=None,
         job(*args, **kwargs)
 
 
-def find_new_flavor(vm, cpu=None, ram=None, disk=None):
-    """Find VM's new flavor based on the new CPU, RAM and disk size"""
+def get_flavor_index():
+    """Return all flavors by their CPU, RAM, disk size and volume type"""
+    return dict(((f.cpu, f.ram, f.disk, f.volume_type_id), f)
+                for f in Flavor.objects.all())
+
+
+def find_new_flavor(vm, cpu=None, ram=None, disk=None, flavors=None):
+    """Find VM's new flavor based on the new CPU, RAM and disk size
+
+    If an index of flavors is given, as returned by 'get_flavor_index', the
+    flavor is looked up in the index instead of the DB.
+
+    """
 
     old_flavor = vm.flavor
     ram = ram if ram is not None else old_flavor.ram
@@ -245,11 +260,16 @@ def find_new_flavor(vm, cpu=None, ram=None, disk=None):
        disk == old_flavor.disk):
         return None
 
-    try:
-        new_flavor = Flavor.objects.get(
-            cpu=cpu, ram=ram, disk=disk,
-            volume_type_id=old_flavor.volume_type_id)
-    except Flavor.DoesNotExist:
+    if flavors is not None:
+        new_flavor = flavors.get((cpu, ram, disk, old_flavor.volume_type_id))
+    else:
+        try:
+            new_flavor = Flavor.objects.get(
+                cpu=cpu, ram=ram, disk=disk,
+                volume_type_id=old_flavor.volume_type_id)
+        except Flavor.DoesNotExist:
+            new_flavor = None
+    if new_flavor is None:
         raise Exception("There is no flavor to match the instance specs!"
                         " Instance: %s CPU: %s RAM %s: Disk: %s VolumeType: %s"
                         % (vm.backend_vm_id, cpu, ram, disk,
@@ -1378,6 +1398,28 @@ def get_jobs(backend, bulk=True):
         return c.GetJobs(bulk=bulk)
 
 
+def get_instance(backend, instance_name):
+    """Get the info of an instance, or None if it does not exist."""
+    with pooled_rapi_client(backend) as c:
+        try:
+            return c.GetInstance(instance_name)
+        except rapi.GanetiApiError as e:
+            if e.code == 404:
+                return None
+            raise e
+
+
+def get_job(backend, job_id):
+    """Get the info of a job, or None if it does not exist."""
+    with pooled_rapi_client(backend) as c:
+        try:
+            return c.GetJobStatus(job_id)
+        except rapi.GanetiApiError as e:
+            if e.code == 404:
+                return None
+            raise e
+
+
 def get_physical_resources(backend):
     """ Get the physical resources of a backend.
 
@@ -322,6 +322,69 @@ def update_cluster(msg):
     backend_mod.update_backend_resources(backend)
 
 
+def superseded_messages(msgs):
+    """Find the messages that are made redundant by later ones.
+
+    'msgs' is a list of decoded messages, in the order they were received.
+    Much like 'if_update_required', a message is redundant when a later
+    message describes a newer state of the same object:
+    - a 'ganeti-op-status' message with a non-final job status, followed by a
+      message for the same job. Such messages only update the job fields of
+      the VM, which the later message overwrites.
+    - an 'image-copy-progress' message, followed by another one for the same
+      instance.
+
+    Return the set of the indices of the superseded messages.
+
+    """
+    superseded = set()
+    jobs = set()
+    progress = set()
+    for index in reversed(range(len(msgs))):
+        msg = msgs[index]
+        if not isinstance(msg, dict) or "instance" not in msg:
+            continue
+        instance = msg["instance"]
+        if msg.get("type") == "ganeti-op-status":
+            job = (instance, msg.get("jobId"))
+            if (job in jobs and
+               msg.get("status") not in rapi.JOB_STATUS_FINALIZED):
+                superseded.add(index)
+            jobs.add(job)
+        elif msg.get("type") == "image-copy-progress":
+            if instance in progress:
+                superseded.add(index)
+            progress.add(instance)
+    return superseded
+
+
+def handle_message_batch(client, deliveries):
+    """Process a batch of messages.
+
+    'deliveries' is a list of (callback, message) tuples, in the order the
+    messages were received. Superseded messages are acknowledged without
+    being processed, and the rest are handed to their callbacks one by one.
+
+    Return the number of superseded messages.
+
+    """
+    msgs = []
+    for callback, message in deliveries:
+        try:
+            msgs.append(json.loads(message['body']))
+        except Exception:
+            msgs.append(None)
+
+    superseded = superseded_messages(msgs)
+    for index, (callback, message) in enumerate(deliveries):
+        if index in superseded:
+            log.debug("Ignoring superseded msg: %s", msgs[index])
+            client.basic_ack(message)
+        else:
+            callback(client, message)
+    return len(superseded)
+
+
 def dummy_proc(client, message, *args, **kwargs):
     try:
         log.debug("Msg: %s", message['body'])
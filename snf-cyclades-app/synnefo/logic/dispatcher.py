@@ -40,6 +40,9 @@ import time
 import json
 import socket
 import traceback
+import threading
+import itertools
+import Queue
 import daemon
 import daemon.runner
 from lockfile import LockTimeout
@@ -73,6 +76,14 @@ DISPATCHER_RECONNECT_TIMEOUT = 600
 # failed.
 DISPATCHER_FAILED_CONNECTION_WAIT = 10
 
+# Seconds between two rounds of acknowledgements of the messages that have been
+# processed by the worker threads.
+DISPATCHER_ACK_INTERVAL = 0.5
+
+# Seconds between two reports of the message processing statistics, when
+# snf-dispatcher runs with worker threads.
+DISPATCHER_STATS_INTERVAL = 60
+
 # Time out after S Seconds while waiting messages from Ganeti clusters to
 # arrive. Warning: During this period snf-dispatcher will not consume any other
 # messages.
@@ -93,30 +104,196 @@ def get_hostname():
     return socket.gethostbyaddr(socket.gethostname())[0]
 
 
+def message_info(message):
+    """Return the routing key and the event time of a message.
+
+    The routing key is the name of the object that the message refers to, as
+    messages of the same object must be processed in the order they were
+    received. The event time is given in seconds since the epoch.
+
+    """
+    key, event_time = None, None
+    try:
+        msg = json.loads(message["body"])
+        for field in ("instance", "network", "cluster"):
+            if field in msg:
+                key = msg[field]
+                break
+        seconds, microseconds = msg["event_time"]
+        event_time = seconds + microseconds / 1000000.0
+    except Exception:
+        pass
+    return key, event_time
+
+
+class DeferredClient(object):
+    """Record how the messages processed by a worker must be acknowledged.
+
+    The AMQP client is not thread-safe, so the worker threads queue the
+    acknowledgements and the dispatcher sends them from its own thread.
+    Each acknowledgement is recorded along with the AMQP connection that the
+    message was delivered over, since delivery tags are only valid within
+    their own connection.
+
+    """
+    def __init__(self, acks, connection):
+        self.acks = acks
+        self.connection = connection
+
+    def basic_ack(self, message):
+        self.acks.put((self.connection, "ack", message))
+
+    def basic_nack(self, message):
+        self.acks.put((self.connection, "nack", message))
+
+    def basic_reject(self, message, requeue=False):
+        self.acks.put((self.connection, "reject", message))
+
+
+class DispatcherStats(object):
+    """Counters of the messages processed by the worker threads."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.start = time.time()
+        self.processed = 0
+        self.superseded = 0
+        self.lags = []
+        self.waits = []
+
+    def add(self, processed, superseded, lags, waits):
+        with self.lock:
+            self.processed += processed
+            self.superseded += superseded
+            self.lags.extend(lags)
+            self.waits.extend(waits)
+
+    def report(self, pending):
+        """Log the statistics since the last report and reset them."""
+        with self.lock:
+            if self.processed:
+                lags = self.lags or [0]
+                waits = self.waits or [0]
+                log.info("Processed %d messages (%d superseded) in %d"
+                         " seconds. Queue lag: avg %.2fs, max %.2fs. Wait"
+                         " in workers: avg %.2fs, max %.2fs. Pending: %d",
+                         self.processed, self.superseded,
+                         time.time() - self.start,
+                         sum(lags) / len(lags), max(lags),
+                         sum(waits) / len(waits), max(waits), pending)
+            self.reset()
+
+
+class DispatcherWorker(threading.Thread):
+    """Thread that processes the messages routed to it in batches.
+
+    The dispatcher routes all the messages of an instance or network to the
+    same worker, which processes them in the order they were received.
+
+    """
+    def __init__(self, acks, stats, batch_size):
+        super(DispatcherWorker, self).__init__()
+        self.daemon = True
+        self.queue = Queue.Queue()
+        self.acks = acks
+        self.stats = stats
+        self.batch_size = batch_size
+
+    def stop(self):
+        self.queue.put(None)
+
+    def run(self):
+        while True:
+            items = [self.queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            stop = None in items
+            items = [item for item in items if item is not None]
+            if items:
+                try:
+                    self.process(items)
+                except Exception as e:
+                    log.exception("Caught unexpected exception: %s", e)
+            if stop:
+                break
+
+    def process(self, items):
+        # Close the Django DB connection before processing every batch, as the
+        # dispatcher does for every message when running without workers.
+        close_connection()
+        now = time.time()
+        waits = [now - received for _, _, _, received, _ in items]
+        lags = [now - event_time for _, _, _, _, event_time in items
+                if event_time is not None]
+        superseded = 0
+        for connection, group in itertools.groupby(items, lambda i: i[0]):
+            client = DeferredClient(self.acks, connection)
+            deliveries = [(callback, message)
+                          for _, callback, message, _, _ in group]
+            superseded += callbacks.handle_message_batch(client, deliveries)
+        self.stats.add(len(items), superseded, lags, waits)
+
+
 class Dispatcher:
     debug = False
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, workers=0, batch_size=1):
         self.debug = debug
+        self.batch_size = batch_size
+        # Acknowledgements of messages that have been processed by the
+        # workers. Acknowledgements of messages that were received over an
+        # older connection to the AMQP broker are discarded.
+        self.acks = Queue.Queue()
+        self.stats = DispatcherStats()
+        self.workers = [DispatcherWorker(self.acks, self.stats, batch_size)
+                        for _ in range(workers)]
         self._init()
+        for worker in self.workers:
+            worker.start()
+        if self.workers:
+            log.info("Processing messages with %d workers in batches of %d",
+                     len(self.workers), batch_size)
 
     def wait(self):
         log.info("Waiting for messages..")
-        timeout = DISPATCHER_RECONNECT_TIMEOUT
+        if self.workers:
+            timeout = DISPATCHER_ACK_INTERVAL
+        else:
+            timeout = DISPATCHER_RECONNECT_TIMEOUT
+        last_msg = last_ack = last_report = time.time()
         while True:
             try:
-                # Close the Django DB connection before processing
-                # every incoming message. This plays nicely with
-                # DB connection pooling, if enabled and allows
-                # the dispatcher to recover from broken connections
-                # gracefully.
-                close_connection()
+                if not self.workers:
+                    # Close the Django DB connection before processing
+                    # every incoming message. This plays nicely with
+                    # DB connection pooling, if enabled and allows
+                    # the dispatcher to recover from broken connections
+                    # gracefully.
+                    close_connection()
                 msg = self.client.basic_wait(timeout=timeout)
-                if not msg:
+                now = time.time()
+                if msg:
+                    last_msg = now
+                if self.workers:
+                    if (now - last_ack >= DISPATCHER_ACK_INTERVAL or
+                       self.acks.qsize() >= self.batch_size):
+                        self.send_acks()
+                        last_ack = now
+                    if now - last_report >= DISPATCHER_STATS_INTERVAL:
+                        self.stats.report(self.pending())
+                        last_report = now
+                if now - last_msg >= DISPATCHER_RECONNECT_TIMEOUT:
                     log.warning("Idle connection for %d seconds. Will connect"
                                 " to a different host. Verify that"
-                                " snf-ganeti-eventd is running!!", timeout)
+                                " snf-ganeti-eventd is running!!",
+                                DISPATCHER_RECONNECT_TIMEOUT)
                     self.client.reconnect(timeout=1)
+                    last_msg = time.time()
             except AMQPConnectionError as e:
                 log.error("AMQP connection failed: %s" % e)
                 log.warning("Sleeping for %d seconds before retrying to "
@@ -141,13 +318,65 @@ class Dispatcher:
                             DISPATCHER_FAILED_CONNECTION_WAIT)
                 time.sleep(DISPATCHER_FAILED_CONNECTION_WAIT)
 
+        if self.workers:
+            log.info("Waiting for workers to finish")
+            for worker in self.workers:
+                worker.stop()
+            for worker in self.workers:
+                worker.join()
+            try:
+                self.send_acks()
+            except Exception as e:
+                log.exception("Failed to acknowledge messages: %s", e)
+
         log.info("Clean up AMQP connection before exit")
         self.client.basic_cancel(timeout=1)
         self.client.close(timeout=1)
 
+    def route(self, callback):
+        """Return a consumer that routes messages to the worker threads."""
+        if not self.workers:
+            return callback
+
+        def route_message(client, message):
+            key, event_time = message_info(message)
+            worker = self.workers[hash(key) % len(self.workers)]
+            # The AMQP client reconnects on its own when the connection
+            # fails, so keep the connection that the message was received
+            # over.
+            worker.queue.put((self.client.client, callback, message,
+                              time.time(), event_time))
+        return route_message
+
+    def pending(self):
+        """Return the number of messages waiting in the worker queues."""
+        return sum(worker.queue.qsize() for worker in self.workers)
+
+    def send_acks(self):
+        """Acknowledge all the messages processed by the workers."""
+        while True:
+            try:
+                connection, action, message = self.acks.get_nowait()
+            except Queue.Empty:
+                break
+            if connection is not self.client.client:
+                # The message was delivered over a connection that has been
+                # closed and will be redelivered by the AMQP broker.
+                continue
+            if action == "ack":
+                self.client.basic_ack(message)
+            elif action == "nack":
+                self.client.basic_nack(message)
+            else:
+                self.client.basic_reject(message)
+
     def _init(self):
         log.info("Initializing")
 
+        # Keep enough unacknowledged messages to fill the batches of all the
+        # workers.
+        prefetch_count = max(5, len(self.workers) * self.batch_size)
+
         # Set confirm buffer to 1 for heartbeat messages
         self.client = AMQPClient(logger=log_amqp, confirm_buffer=1)
         # Connect to AMQP host
@@ -183,8 +412,8 @@ class Dispatcher:
                                    routing_key=routing_key)
 
             self.client.basic_consume(queue=binding[0],
-                                      callback=callback,
-                                      prefetch_count=5)
+                                      callback=self.route(callback),
+                                      prefetch_count=prefetch_count)
 
             queue_dl = queues.convert_queue_to_dead(queue)
             exchange_dl = queues.convert_exchange_to_dead(exchange)
@@ -307,6 +536,16 @@ def parse_arguments(args):
                       default=False, dest="purge_exchanges",
                       help=("Remove all exchanges. Implies deleting all queues"
                             " first (DANGEROUS!)"))
+    parser.add_option("--workers", dest="workers", type="int",
+                      default=settings.DISPATCHER_WORKERS,
+                      help=("Number of threads that process the messages in"
+                            " batches. Set to 0 to process them one by one"
+                            " (default: %d)" % settings.DISPATCHER_WORKERS))
+    parser.add_option("--batch-size", dest="batch_size", type="int",
+                      default=settings.DISPATCHER_BATCH_SIZE,
+                      help=("Maximum number of messages that a worker"
+                            " processes at once (default: %d)"
+                            % settings.DISPATCHER_BATCH_SIZE))
     parser.add_option("--drain-queue", dest="drain_queue",
                       help="Drain a queue from all outstanding messages")
     parser.add_option("--status-check", dest="status_check",
@@ -471,13 +710,15 @@ def get_user_confirmation():
     return True
 
 
-def debug_mode():
-    disp = Dispatcher(debug=True)
+def debug_mode(opts):
+    disp = Dispatcher(debug=True, workers=opts.workers,
+                      batch_size=opts.batch_size)
     disp.wait()
 
 
 def daemon_mode(opts):
-    disp = Dispatcher(debug=False)
+    disp = Dispatcher(debug=False, workers=opts.workers,
+                      batch_size=opts.batch_size)
     disp.wait()
 
 
@@ -521,7 +762,7 @@ def main():
 
     # Debug mode, process messages without daemonizing
     if opts.debug:
-        debug_mode()
+        debug_mode(opts)
         return
 
     # Create pidfile,
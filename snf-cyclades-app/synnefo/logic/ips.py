@@ -15,6 +15,7 @@
 
 import logging
 import functools
+import random
 
 from snf_django.lib.api import faults
 from synnefo.db import transaction
@@ -82,6 +83,44 @@ def ip_command(action):
     return decorator
 
 
+def order_ip_pools(pool_rows):
+    """Return the order in which to try a number of IP pools.
+
+    The IP pools of a subnet may be split in shards, in order to spread
+    concurrent allocations over more than one row. The subnets are kept in
+    the order of the given pool rows, while the pools of each subnet are
+    shuffled. Pools that are found empty are left out.
+
+    """
+    subnets = []
+    subnet_pools = {}
+    for pool_row in pool_rows:
+        if pool_row.pool.empty():
+            continue
+        if pool_row.subnet_id not in subnet_pools:
+            subnets.append(pool_row.subnet_id)
+            subnet_pools[pool_row.subnet_id] = []
+        subnet_pools[pool_row.subnet_id].append(pool_row)
+    ordered = []
+    for subnet_id in subnets:
+        shards = subnet_pools[subnet_id]
+        random.shuffle(shards)
+        ordered.extend(shards)
+    return ordered
+
+
+def filter_ip_pools(pool_rows, address):
+    """Return the IP pools that may contain an address."""
+    candidates = []
+    for pool_row in pool_rows:
+        try:
+            if pool_row.pool.contains(address):
+                candidates.append(pool_row)
+        except pools.InvalidValue:
+            pass
+    return candidates
+
+
 def allocate_ip_from_pools(pool_rows, userid, address=None, floating_ip=False):
     """Try to allocate a value from a number of pools.
 
@@ -90,24 +129,59 @@ def allocate_ip_from_pools(pool_rows, userid, address=None, floating_ip=False):
     If an address is specified and does not belong to any of the pools,
     InvalidValue is raised.
 
+    The pool rows are not expected to be locked. Each pool is locked only
+    when a value is about to be allocated from it, so that allocations from
+    different shards of a subnet do not wait for each other. Each pool is
+    locked in a savepoint of its own, which is rolled back if no value can
+    be allocated from the pool. This way, at most one pool is locked at any
+    time, and concurrent allocations cannot deadlock on the pools, whatever
+    order they try them in. Pools that have been split again since they
+    were read are replaced by the current pools of their subnet.
+
     """
-    for pool_row in pool_rows:
+    if address is None:
+        candidates = order_ip_pools(pool_rows)
+    else:
+        # Only the pools that may contain the address need to be locked
+        candidates = filter_ip_pools(pool_rows, address)
+    tried = set()
+    while candidates:
+        pool_row = candidates.pop(0)
+        tried.add(pool_row.id)
+        sid = transaction.savepoint()
+        try:
+            pool_row = IPPoolTable.objects.select_for_update()\
+                                          .select_related("subnet__network")\
+                                          .get(id=pool_row.id)
+        except IPPoolTable.DoesNotExist:
+            transaction.savepoint_rollback(sid)
+            subnet_id = pool_row.subnet_id
+            subnet_rows = IPPoolTable.objects.filter(subnet=subnet_id)\
+                                             .exclude(id__in=tried)
+            if address is None:
+                subnet_rows = [r for r in subnet_rows if not r.pool.empty()]
+            else:
+                subnet_rows = filter_ip_pools(subnet_rows, address)
+            candidates = [r for r in candidates if r.subnet_id != subnet_id]
+            candidates = subnet_rows + candidates
+            continue
         pool = pool_row.pool
         try:
             value = pool.get(value=address)
-            pool.save()
-            subnet = pool_row.subnet
-            ipaddress = IPAddress.objects.create(subnet=subnet,
-                                                 network=subnet.network,
-                                                 userid=userid,
-                                                 address=value,
-                                                 floating_ip=floating_ip,
-                                                 ipversion=4)
-            return ipaddress
-        except pools.EmptyPool:
-            pass
-        except pools.InvalidValue:
-            pass
+        except (pools.EmptyPool, pools.InvalidValue):
+            # Release the lock of the pool before trying the next one
+            transaction.savepoint_rollback(sid)
+            continue
+        pool.save()
+        transaction.savepoint_commit(sid)
+        subnet = pool_row.subnet
+        ipaddress = IPAddress.objects.create(subnet=subnet,
+                                             network=subnet.network,
+                                             userid=userid,
+                                             address=value,
+                                             floating_ip=floating_ip,
+                                             ipversion=4)
+        return ipaddress
     if address is None:
         raise pools.EmptyPool("No more IP addresses available on pools %s" %
                               pool_rows)
@@ -125,8 +199,8 @@ def allocate_ip(network, userid, address=None, floating_ip=False):
         raise faults.Conflict("Can not allocate IP while network '%s' is in"
                               " 'SNF:DRAINED' status" % network.id)
 
-    ip_pools = IPPoolTable.objects.select_for_update()\
-        .filter(subnet__network=network).order_by('id')
+    ip_pools = IPPoolTable.objects.filter(subnet__network=network)\
+                                  .order_by('id')
     try:
         return allocate_ip_from_pools(ip_pools, userid, address=address,
                                       floating_ip=floating_ip)
@@ -150,7 +224,7 @@ def allocate_public_ip(userid, floating_ip=False, backend=None, networks=None):
     be used.
 
     """
-    ip_pool_rows = IPPoolTable.objects.select_for_update()\
+    ip_pool_rows = IPPoolTable.objects\
         .prefetch_related("subnet__network")\
         .filter(subnet__deleted=False)\
         .filter(subnet__network__deleted=False)\
@@ -20,7 +20,7 @@ from synnefo.db.pools import bitarray_to_map
 from synnefo.management import pprint, common
 from snf_django.management.commands import SynnefoCommand
 
-POOL_CHOICES = ['bridge', 'mac-prefix']
+POOL_CHOICES = ['bridge', 'mac-prefix', 'ip']
 
 
 class Command(SynnefoCommand):
@@ -60,6 +60,16 @@ class Command(SynnefoCommand):
             'available': pool.count_available(),
             'reserved': pool.count_reserved(),
         }
+        if type_ == 'ip':
+            # The IP pools of a subnet may be split in shards
+            shards = list(pool_row.subnet.ip_pools.order_by('offset')
+                                                  .values_list('id',
+                                                               flat=True))
+            kv['subnet'] = pool_row.subnet_id
+            kv['shard'] = '%d of %d' % (shards.index(pool_row.id) + 1,
+                                        len(shards))
+            kv['first ip'] = pool.return_start()
+            kv['last ip'] = pool.return_end()
 
         for key, val in sorted(kv.items()):
             line = '%s: %s\n' % (key.rjust(16), val)
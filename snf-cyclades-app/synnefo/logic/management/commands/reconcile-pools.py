@@ -30,7 +30,10 @@ that the reserved values are only the ones that are currently used.
 The pools for the following resources are checked:
     * Pool of bridges
     * Pool of MAC prefixes
-    * Pool of IPv4 addresses for each network"""
+    * Pool of IPv4 addresses for each network
+
+The IPv4 address pools of a subnet may be split in shards. Each shard is
+checked on its own, and the shards of a subnet are checked not to overlap."""
 
 
 class Command(SynnefoCommand):
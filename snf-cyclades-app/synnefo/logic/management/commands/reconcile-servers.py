@@ -20,14 +20,14 @@ the state of the Ganeti backend. See docstring on top of
 logic/reconciliation.py for a description of reconciliation rules.
 
 """
-import sys
 import logging
-import subprocess
+from multiprocessing.pool import ThreadPool
 from optparse import make_option
 
+from django.db import connection
 from snf_django.management.commands import SynnefoCommand
 from synnefo.management.common import get_resource
-from synnefo.logic import reconciliation
+from synnefo.logic import reconciliation, backend as backend_mod
 from snf_django.management.utils import parse_bool
 
 
@@ -44,8 +44,21 @@ class Command(SynnefoCommand):
                     default="True",
                     choices=["True", "False"],
                     metavar="True|False",
-                    help="Perform server reconciliation for each backend"
+                    help="Get the state of each backend from Ganeti in"
                          " parallel."),
+        make_option('--incremental', action='store_true',
+                    dest='incremental', default=False,
+                    help='Reconcile only the servers that changed since the'
+                         ' last incremental reconciliation of each backend.'
+                         ' A full reconciliation is performed if there is no'
+                         ' such reconciliation, or the last full one is'
+                         ' older than --full-sweep-interval.'),
+        make_option('--full-sweep-interval', type='int', default=None,
+                    dest='full_sweep_interval', metavar='HOURS',
+                    help='Maximum time between full reconciliations in'
+                         ' incremental mode (default: %d hours)' %
+                         (reconciliation.FULL_SWEEP_INTERVAL.total_seconds()
+                          // 3600)),
         make_option('--fix-stale', action='store_true', dest='fix_stale',
                     default=False, help='Fix (remove) stale DB entries in DB'),
         make_option('--fix-orphans', action='store_true', dest='fix_orphans',
@@ -86,15 +99,6 @@ class Command(SynnefoCommand):
             backends = reconciliation.get_online_backends()
 
         parallel = parse_bool(options["parallel"])
-        if parallel and len(backends) > 1:
-            cmd = sys.argv
-            processes = []
-            for backend in backends:
-                p = subprocess.Popen(cmd + ["--backend-id=%s" % backend.id])
-                processes.append(p)
-            for p in processes:
-                p.wait()
-            return
 
         verbosity = int(options["verbosity"])
 
@@ -106,7 +110,7 @@ class Command(SynnefoCommand):
         log_handler.setFormatter(formatter)
         if verbosity == 2:
             formatter =\
-                logging.Formatter("%(asctime)s [%(process)d]: %(message)s")
+                logging.Formatter("%(asctime)s [%(threadName)s]: %(message)s")
             log_handler.setFormatter(formatter)
             logger.setLevel(logging.DEBUG)
         elif verbosity == 1:
@@ -118,8 +122,55 @@ class Command(SynnefoCommand):
 
         self._process_args(options)
 
-        for backend in backends:
-            r = reconciliation.BackendReconciler(backend=backend,
-                                                 logger=logger,
-                                                 options=options)
-            r.reconcile()
+        # The flavors are loaded once and shared by all reconcilers
+        flavors = backend_mod.get_flavor_index()
+        reconcilers = [reconciliation.BackendReconciler(backend=backend,
+                                                        logger=logger,
+                                                        options=options,
+                                                        flavors=flavors)
+                       for backend in backends]
+
+        def get_state(r):
+            # The state of the DB is read right before the state of Ganeti,
+            # so that the servers created meanwhile are not taken for orphans
+            try:
+                r.get_state()
+                return True
+            except Exception:
+                logger.exception("Failed to get the state of backend %s",
+                                 r.backend)
+                return False
+
+        def get_state_in_thread(r):
+            try:
+                return get_state(r)
+            finally:
+                # Each thread has a DB connection of its own
+                connection.close()
+
+        if parallel and len(reconcilers) > 1:
+            pool = ThreadPool(len(reconcilers))
+            try:
+                fetched = pool.map(get_state_in_thread, reconcilers)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            fetched = map(get_state, reconcilers)
+
+        for r, ok in zip(reconcilers, fetched):
+            if not ok:
+                r.close()
+                continue
+            try:
+                r.reconcile()
+            except Exception:
+                logger.exception("Failed to reconcile backend %s", r.backend)
+                r.close()
+
+        if verbosity >= 1:
+            for r in reconcilers:
+                timings = ", ".join("%s: %.2fs" % t for t in r.timings.items())
+                mode = "incremental" if r.incremental else "full"
+                self.stdout.write("Backend %s (%s): %s\n" %
+                                  (r.backend, mode, timings))
@@ -27,6 +27,10 @@ HELP_MSG = """
 
 Update a subnet without authenticating the user. Only the name of a subnet can
 be updated.
+
+The IP pools of an IPv4 subnet can also be split in a number of shards, so that
+concurrent allocations of IP addresses lock different rows. Adjacent pools are
+merged before being split, so a value of 1 merges the shards again.
 """
 
 
@@ -36,6 +40,10 @@ class Command(SynnefoCommand):
     option_list = SynnefoCommand.option_list + (
         make_option("--name", dest="name",
                     help="The new subnet name."),
+        make_option("--ip-pool-shards", dest="ip_pool_shards",
+                    type="int",
+                    help="Split the IP pools of the subnet in this number of"
+                         " shards."),
     )
 
     @transaction.commit_on_success
@@ -48,13 +56,23 @@ class Command(SynnefoCommand):
 
         subnet_id = args[0]
         name = options["name"]
+        shards = options["ip_pool_shards"]
 
-        if not name:
-            raise CommandError("--name is mandatory")
+        if not name and shards is None:
+            raise CommandError("One of --name or --ip-pool-shards is"
+                               " mandatory")
 
         subnet = common.get_resource("subnet", subnet_id, for_update=True)
         user_id = common.get_resource("network", subnet.network.id).userid
 
-        subnets.update_subnet(sub_id=subnet_id,
-                              name=name,
-                              user_id=user_id)
+        if name:
+            subnets.update_subnet(sub_id=subnet_id,
+                                  name=name,
+                                  user_id=user_id)
+
+        if shards is not None:
+            if shards < 1:
+                raise CommandError("--ip-pool-shards must be positive")
+            if subnet.ipversion != 4:
+                raise CommandError("Only IPv4 subnets have IP pools")
+            subnets.shard_ip_pools(subnet, shards)
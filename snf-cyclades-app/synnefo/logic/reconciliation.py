@@ -39,15 +39,19 @@ For G, the operating state is True if the machine is up, False otherwise.
 
 
 from django.conf import settings
+from django.db.models import Max
 
+import time
 import logging
 import itertools
 import bitarray
 import json
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 from synnefo.db import transaction
-from synnefo.db.models import (Backend, VirtualMachine, Flavor,
+from synnefo.db.models import (Backend, VirtualMachine,
                                pooled_rapi_client, Network,
                                BackendNetwork, BridgePoolTable,
                                MacPrefixPoolTable)
@@ -62,9 +66,41 @@ logging.basicConfig()
 
 BUILDING_NIC_TIMEOUT = timedelta(seconds=120)
 
+# Number of fixes that are applied in each transaction
+FIX_BATCH_SIZE = 100
+
+# Maximum time between full reconciliations of a backend in incremental mode
+FULL_SWEEP_INTERVAL = timedelta(hours=24)
+
+# Above this number of jobs or instances, incremental reconciliation gets all
+# of them from Ganeti with a single bulk query, instead of one by one.
+BULK_QUERY_THRESHOLD = 50
+
 
 class BackendReconciler(object):
-    def __init__(self, backend, logger, options=None):
+    """Reconcile the servers of a backend.
+
+    Reconciliation is split in phases. The state of the DB is read first,
+    right before the state of Ganeti. The reconcilers of different backends
+    may read their state in parallel threads, with get_state().
+    The differences that are found are then reported, and the fixes are
+    applied in batches, each one in a transaction of its own. The time spent
+    in each phase is kept in 'timings'.
+
+    With the 'incremental' option, only the servers that have changed since
+    the last reconciliation are checked. These are the servers whose
+    backendtime is newer than the one of the last reconciliation, and the
+    instances of the Ganeti jobs that came after the last reconciled job.
+    Each incremental reconciliation records how far it got in the backend,
+    along with the servers that it left unreconciled, e.g. because their
+    inconsistencies were not fixed or their NICs were being built. These
+    servers are checked again by the next reconciliation.
+    If there is no such record, or the last full reconciliation is older
+    than the 'full_sweep_interval' option (in hours), a full reconciliation
+    is performed instead.
+
+    """
+    def __init__(self, backend, logger, options=None, flavors=None):
         self.backend = backend
         self.log = logger
         self.client = backend.get_client()
@@ -72,34 +108,214 @@ class BackendReconciler(object):
             self.options = {}
         else:
             self.options = options
+        # Index of flavors, that may be shared by reconcilers. If it is not
+        # given, it is loaded along with the state of the DB.
+        self.shared_flavors = flavors
+        self.flavors = flavors
+        self.timings = OrderedDict()
+        self.db_servers = None
+        self.gnt_servers = None
+        self.fixes = []
+        self.pending = set()
 
     def close(self):
         self.backend.put_client(self.client)
 
-    @transaction.commit_on_success
+    @contextmanager
+    def timed(self, phase):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0) +\
+                time.time() - start
+
+    def use_incremental(self):
+        """Return whether an incremental reconciliation can be performed."""
+        backend = self.backend
+        if not self.options.get("incremental"):
+            return False
+        if backend.reconciled_job_id is None or\
+           backend.reconciled_backendtime is None or\
+           backend.fully_reconciled is None:
+            return False
+        interval = self.options.get("full_sweep_interval")
+        interval = timedelta(hours=interval) if interval is not None\
+            else FULL_SWEEP_INTERVAL
+        return self.event_time - backend.fully_reconciled < interval
+
+    def get_database_state(self):
+        self.event_time = datetime.now()
+        self.pending = set()
+        self.incremental = self.use_incremental()
+        with self.timed("database"):
+            self.backendtime_mark = get_backendtime_mark(self.backend)
+            if self.incremental:
+                self.last_job_id = self.backend.reconciled_job_id
+                self.recheck = get_unreconciled_servers(self.backend)
+                self.db_servers = get_database_servers(
+                    self.backend,
+                    updated_since=self.backend.reconciled_backendtime)
+                if self.recheck:
+                    self.db_servers.update(get_database_servers(
+                        self.backend, server_ids=self.recheck))
+            else:
+                self.last_job_id = 0
+                self.recheck = set()
+                self.db_servers = get_database_servers(self.backend)
+            self.db_servers_keys = set(self.db_servers.keys())
+            if self.shared_flavors is None:
+                self.flavors = backend_mod.get_flavor_index()
+        self.log.debug("Got servers info from database.")
+
+    def get_ganeti_state(self):
+        with self.timed("ganeti"):
+            if self.incremental:
+                self.gnt_jobs = get_ganeti_jobs(self.backend,
+                                                after=self.last_job_id)
+                self.log.debug("Got %d new jobs from Ganeti backend",
+                               len(self.gnt_jobs))
+                # Get the instances of the changed servers
+                self.job_servers = get_job_servers(self.gnt_jobs)
+                server_ids = self.db_servers_keys | self.job_servers |\
+                    self.recheck
+                self.gnt_servers = get_ganeti_servers(self.backend,
+                                                      server_ids=server_ids)
+                self.gnt_servers_keys = set(self.gnt_servers.keys())
+                self.log.debug("Got info of %d servers from Ganeti backend.",
+                               len(server_ids))
+                return
+
+            self.gnt_servers = get_ganeti_servers(self.backend)
+            self.gnt_servers_keys = set(self.gnt_servers.keys())
+            self.log.debug("Got servers info from Ganeti backend.")
+
+            self.gnt_jobs = get_ganeti_jobs(self.backend)
+            self.log.debug("Got jobs from Ganeti backend")
+
+    def complete_incremental_state(self):
+        """Get the servers and the jobs missing from an incremental state.
+
+        The servers of the new jobs are read from the DB, after their
+        instances have been read from Ganeti, since a server is created in
+        the DB before any job for it is submitted. The jobs of the servers
+        that are building or have a pending task are also read, if they are
+        not among the new jobs.
+
+        """
+        with self.timed("database"):
+            missing = self.job_servers - self.db_servers_keys
+            if missing:
+                self.db_servers.update(
+                    get_database_servers(self.backend, server_ids=missing))
+                self.db_servers_keys = set(self.db_servers.keys())
+        with self.timed("ganeti"):
+            job_ids = set()
+            for db_server in self.db_servers.values():
+                if db_server.operstate == "BUILD":
+                    job_ids.add(db_server.backendjobid)
+                if db_server.task is not None:
+                    job_ids.add(db_server.task_job_id)
+            job_ids = set(int(j) for j in job_ids if j is not None) -\
+                set(self.gnt_jobs.keys())
+            if job_ids:
+                self.gnt_jobs.update(
+                    get_ganeti_jobs(self.backend, job_ids=job_ids))
+
+    def get_state(self):
+        """Read the state of the DB and then the state of Ganeti."""
+        self.get_database_state()
+        self.get_ganeti_state()
+        if self.incremental:
+            self.complete_incremental_state()
+
+    def save_reconciliation_state(self):
+        """Record how far reconciliation got in the backend."""
+        fields = {
+            "reconciled_job_id": get_job_mark(self.gnt_jobs,
+                                              self.last_job_id),
+            "reconciled_backendtime": self.backendtime_mark,
+            "unreconciled_servers": ",".join(map(str, sorted(self.pending))),
+        }
+        if not self.incremental:
+            fields["fully_reconciled"] = self.event_time
+        Backend.objects.filter(id=self.backend.id).update(**fields)
+        for field, value in fields.items():
+            setattr(self.backend, field, value)
+
     def reconcile(self):
         log = self.log
         backend = self.backend
         log.debug("Reconciling backend %s", backend)
 
-        self.event_time = datetime.now()
+        if self.gnt_servers is None:
+            self.get_state()
+        log.debug("Reconciling %d servers of backend %s (%s)",
+                  len(self.db_servers_keys | self.gnt_servers_keys), backend,
+                  "incremental" if self.incremental else "full")
+
+        with self.timed("detect"):
+            self.stale_servers = self.reconcile_stale_servers()
+            self.orphan_servers = self.reconcile_orphan_servers()
+            self.unsynced_servers = self.reconcile_unsynced_servers()
+        with self.timed("fix"):
+            self.apply_fixes()
+        with self.timed("snapshots"):
+            self.unsynced_snapshots = self.reconcile_unsynced_snapshots()
+        if self.options.get("incremental"):
+            if self.pending:
+                log.info("Servers %s of backend %s were left unreconciled"
+                         " and will be checked again.",
+                         ", ".join(map(str, sorted(self.pending))), backend)
+            self.save_reconciliation_state()
+        self.db_servers = None
+        self.gnt_servers = None
+        self.close()
 
-        self.db_servers = get_database_servers(backend)
-        self.db_servers_keys = set(self.db_servers.keys())
-        log.debug("Got servers info from database.")
+    def fixing(self, option, *server_ids):
+        """Return whether the inconsistencies of an option are fixed.
 
-        self.gnt_servers = get_ganeti_servers(backend)
-        self.gnt_servers_keys = set(self.gnt_servers.keys())
-        log.debug("Got servers info from Ganeti backend.")
+        The servers whose inconsistencies are not fixed are remembered, so
+        that the next reconciliation checks them again.
 
-        self.gnt_jobs = get_ganeti_jobs(backend)
-        log.debug("Got jobs from Ganeti backend")
+        """
+        if self.options[option]:
+            return True
+        self.pending.update(server_ids)
+        return False
 
-        self.stale_servers = self.reconcile_stale_servers()
-        self.orphan_servers = self.reconcile_orphan_servers()
-        self.unsynced_servers = self.reconcile_unsynced_servers()
-        self.unsynced_snapshots = self.reconcile_unsynced_snapshots()
-        self.close()
+    def add_fix(self, server_id, fix, *args, **kwargs):
+        """Add a fix to be applied on a locked server."""
+        self.fixes.append((server_id, fix, args, kwargs))
+
+    def apply_fixes(self):
+        """Apply the fixes that have been found.
+
+        The fixes are applied in batches, each one in a transaction of its
+        own. The servers of each batch are locked with a single query. The
+        fixes of a server that changed since its state was read are skipped,
+        and the server is checked again by the next reconciliation.
+
+        """
+        fixes, self.fixes = self.fixes, []
+        for i in range(0, len(fixes), FIX_BATCH_SIZE):
+            batch = fixes[i:i + FIX_BATCH_SIZE]
+            with transaction.commit_on_success():
+                servers = get_locked_servers(set(f[0] for f in batch))
+                changed = set(server_id for server_id, vm in servers.items()
+                              if server_id in self.db_servers and
+                              server_changed(self.db_servers[server_id], vm))
+                for server_id, fix, args, kwargs in batch:
+                    if server_id not in servers:
+                        self.log.warning("Server '%s' does not exist."
+                                         " Skipping fix.", server_id)
+                        continue
+                    if server_id in changed:
+                        self.log.info("Server '%s' changed since its state"
+                                      " was read. Skipping fix.", server_id)
+                        self.pending.add(server_id)
+                        continue
+                    fix(servers[server_id], *args, **kwargs)
 
     def get_build_status(self, db_server):
         """Return the status of the build job.
@@ -153,16 +369,19 @@ class BackendReconciler(object):
             self.log.debug("No stale servers at backend %s", self.backend)
 
         # Fix them
-        if stale and self.options["fix_stale"]:
+        if stale and self.fixing("fix_stale", *stale):
             for server_id in stale:
-                vm = get_locked_server(server_id)
-                backend_mod.process_op_status(
-                    vm=vm,
-                    etime=self.event_time,
-                    jobid=-0,
-                    opcode='OP_INSTANCE_REMOVE', status='success',
-                    logmsg='Reconciliation: simulated Ganeti event')
-            self.log.debug("Simulated Ganeti removal for stale servers.")
+                self.add_fix(server_id, self.fix_stale_server)
+
+    def fix_stale_server(self, vm):
+        backend_mod.process_op_status(
+            vm=vm,
+            etime=self.event_time,
+            jobid=-0,
+            opcode='OP_INSTANCE_REMOVE', status='success',
+            logmsg='Reconciliation: simulated Ganeti event')
+        self.log.debug("Simulated Ganeti removal for stale server '%s'.",
+                       vm.id)
 
     def reconcile_orphan_servers(self):
         orphans = self.gnt_servers_keys - self.db_servers_keys
@@ -172,7 +391,7 @@ class BackendReconciler(object):
         else:
             self.log.debug("No orphan servers at backend %s", self.backend)
 
-        if orphans and self.options["fix_orphans"]:
+        if orphans and self.fixing("fix_orphans", *orphans):
             for server_id in orphans:
                 server_name = utils.id_to_instance_name(server_id)
                 self.client.DeleteInstance(server_name)
@@ -209,40 +428,45 @@ class BackendReconciler(object):
     def reconcile_building_server(self, db_server):
         self.log.info("Server '%s' is BUILD in DB, but 'ERROR' in Ganeti.",
                       db_server.id)
-        if self.options["fix_unsynced"]:
-            fix_opcode = "OP_INSTANCE_CREATE"
-            vm = get_locked_server(db_server.id)
-            backend_mod.process_op_status(
-                vm=vm,
-                etime=self.event_time,
-                jobid=-0,
-                opcode=fix_opcode, status='error',
-                logmsg='Reconciliation: simulated Ganeti event')
-            self.log.debug("Simulated Ganeti error build event for"
-                           " server '%s'", db_server.id)
+        if self.fixing("fix_unsynced", db_server.id):
+            self.add_fix(db_server.id, self.fix_building_server)
+
+    def fix_building_server(self, vm):
+        fix_opcode = "OP_INSTANCE_CREATE"
+        backend_mod.process_op_status(
+            vm=vm,
+            etime=self.event_time,
+            jobid=-0,
+            opcode=fix_opcode, status='error',
+            logmsg='Reconciliation: simulated Ganeti event')
+        self.log.debug("Simulated Ganeti error build event for"
+                       " server '%s'", vm.id)
 
     def reconcile_unsynced_operstate(self, server_id, db_server, gnt_server):
         if db_server.operstate != gnt_server["state"]:
             self.log.info("Server '%s' is '%s' in DB and '%s' in Ganeti.",
                           server_id, db_server.operstate, gnt_server["state"])
-            if self.options["fix_unsynced"]:
-                vm = get_locked_server(server_id)
-                # If server is in building state, you will have first to
-                # reconcile it's creation, to avoid wrong quotas
-                if db_server.operstate == "BUILD":
-                    backend_mod.process_op_status(
-                        vm=vm, etime=self.event_time, jobid=-0,
-                        opcode="OP_INSTANCE_CREATE", status='success',
-                        logmsg='Reconciliation: simulated Ganeti event')
-                fix_opcode = "OP_INSTANCE_STARTUP"\
-                    if gnt_server["state"] == "STARTED"\
-                    else "OP_INSTANCE_SHUTDOWN"
-                backend_mod.process_op_status(
-                    vm=vm, etime=self.event_time, jobid=-0,
-                    opcode=fix_opcode, status='success',
-                    logmsg='Reconciliation: simulated Ganeti event')
-                self.log.debug("Simulated Ganeti state event for server '%s'",
-                               server_id)
+            if self.fixing("fix_unsynced", server_id):
+                self.add_fix(server_id, self.fix_unsynced_operstate,
+                             db_server.operstate, gnt_server["state"])
+
+    def fix_unsynced_operstate(self, vm, db_state, gnt_state):
+        # If server is in building state, you will have first to
+        # reconcile it's creation, to avoid wrong quotas
+        if db_state == "BUILD":
+            backend_mod.process_op_status(
+                vm=vm, etime=self.event_time, jobid=-0,
+                opcode="OP_INSTANCE_CREATE", status='success',
+                logmsg='Reconciliation: simulated Ganeti event')
+        fix_opcode = "OP_INSTANCE_STARTUP"\
+            if gnt_state == "STARTED"\
+            else "OP_INSTANCE_SHUTDOWN"
+        backend_mod.process_op_status(
+            vm=vm, etime=self.event_time, jobid=-0,
+            opcode=fix_opcode, status='success',
+            logmsg='Reconciliation: simulated Ganeti event')
+        self.log.debug("Simulated Ganeti state event for server '%s'",
+                       vm.id)
 
     def reconcile_unsynced_flavor(self, server_id, db_server, gnt_server):
         db_flavor = db_server.flavor
@@ -250,37 +474,38 @@ class BackendReconciler(object):
         if (db_flavor.ram != gnt_flavor["ram"] or
            db_flavor.cpu != gnt_flavor["vcpus"] or
            db_flavor.disk != gnt_flavor["disk"]):
-            try:
-                gnt_flavor = Flavor.objects.get(
-                    ram=gnt_flavor["ram"],
-                    cpu=gnt_flavor["vcpus"],
-                    disk=gnt_flavor["disk"],
-                    volume_type_id=db_flavor.volume_type_id)
-            except Flavor.DoesNotExist:
+            gnt_flavor = self.flavors.get((gnt_flavor["vcpus"],
+                                           gnt_flavor["ram"],
+                                           gnt_flavor["disk"],
+                                           db_flavor.volume_type_id))
+            if gnt_flavor is None:
                 self.log.warning("Server '%s' has unknown flavor.", server_id)
+                self.pending.add(server_id)
                 return
 
             self.log.info("Server '%s' has flavor '%s' in DB and '%s' in"
                           " Ganeti", server_id, db_flavor, gnt_flavor)
-            if self.options["fix_unsynced_flavors"]:
-                vm = get_locked_server(server_id)
-                old_state = vm.operstate
-                opcode = "OP_INSTANCE_SET_PARAMS"
-                beparams = {"vcpus": gnt_flavor.cpu,
-                            "minmem": gnt_flavor.ram,
-                            "maxmem": gnt_flavor.ram}
-                backend_mod.process_op_status(
-                    vm=vm, etime=self.event_time, jobid=-0,
-                    opcode=opcode, status='success',
-                    job_fields={"beparams": beparams},
-                    logmsg='Reconciliation: simulated Ganeti event')
-                # process_op_status with beparams will set the vmstate to
-                # shutdown. Fix this be returning it to old state
-                vm = VirtualMachine.objects.get(pk=server_id)
-                vm.operstate = old_state
-                vm.save()
-                self.log.debug("Simulated Ganeti flavor event for server '%s'",
-                               server_id)
+            if self.fixing("fix_unsynced_flavors", server_id):
+                self.add_fix(server_id, self.fix_unsynced_flavor, gnt_flavor)
+
+    def fix_unsynced_flavor(self, vm, gnt_flavor):
+        old_state = vm.operstate
+        opcode = "OP_INSTANCE_SET_PARAMS"
+        beparams = {"vcpus": gnt_flavor.cpu,
+                    "minmem": gnt_flavor.ram,
+                    "maxmem": gnt_flavor.ram}
+        backend_mod.process_op_status(
+            vm=vm, etime=self.event_time, jobid=-0,
+            opcode=opcode, status='success',
+            job_fields={"beparams": beparams},
+            logmsg='Reconciliation: simulated Ganeti event',
+            flavors=self.flavors)
+        # process_op_status with beparams will set the vmstate to
+        # shutdown. Fix this be returning it to old state
+        vm.operstate = old_state
+        vm.save()
+        self.log.debug("Simulated Ganeti flavor event for server '%s'",
+                       vm.id)
 
     def reconcile_unsynced_nics(self, server_id, db_server, gnt_server):
         building_time = self.event_time - BUILDING_NIC_TIMEOUT
@@ -293,7 +518,12 @@ class BackendReconciler(object):
         except Network.InvalidBackendIdError as e:
             self.log.warning("Server %s is connected to unknown network %s"
                              " Cannot reconcile server." % (server_id, str(e)))
+            self.pending.add(server_id)
             return
+        if any(nic.state == "BUILD" for nic in db_server.nics.all()):
+            # The NICs that are being built are checked again by the next
+            # reconciliation
+            self.pending.add(server_id)
         nics_changed = len(db_nics) != len(gnt_nics)
         for db_nic, gnt_nic in zip(db_nics, sorted(gnt_nics_parsed.items())):
             gnt_nic_id, gnt_nic = gnt_nic
@@ -310,20 +540,26 @@ class BackendReconciler(object):
             gnt_nics_str = "\n\t\t".join(map(format_gnt_nic,
                                          sorted(gnt_nics_parsed.items())))
             self.log.info(msg, server_id, db_nics_str, gnt_nics_str)
-            if self.options["fix_unsynced_nics"]:
-                vm = get_locked_server(server_id)
-                backend_mod.process_op_status(
-                    vm=vm, etime=self.event_time, jobid=-0,
-                    opcode="OP_INSTANCE_SET_PARAMS", status='success',
-                    logmsg="Reconciliation: simulated Ganeti event",
-                    nics=gnt_nics)
+            if self.fixing("fix_unsynced_nics", server_id):
+                self.add_fix(server_id, self.fix_unsynced_params,
+                             nics=gnt_nics)
+
+    def fix_unsynced_params(self, vm, nics=None, disks=None):
+        backend_mod.process_op_status(
+            vm=vm, etime=self.event_time, jobid=-0,
+            opcode="OP_INSTANCE_SET_PARAMS", status='success',
+            logmsg="Reconciliation: simulated Ganeti event",
+            nics=nics, disks=disks)
 
     def reconcile_unsynced_disks(self, server_id, db_server, gnt_server):
         building_time = self.event_time - BUILDING_NIC_TIMEOUT
-        db_disks = db_server.volumes.exclude(status="CREATING",
-                                             created__lte=building_time) \
-                                    .filter(deleted=False)\
-                                    .order_by("id")
+        volumes = db_server.volumes.filter(deleted=False).order_by("id")
+        db_disks = [v for v in volumes if v.status != "CREATING" or
+                    v.created > building_time]
+        if any(v.status == "CREATING" for v in volumes):
+            # The disks that are being created are checked again by the next
+            # reconciliation
+            self.pending.add(server_id)
         gnt_disks = gnt_server["disks"]
         gnt_disks_parsed = backend_mod.parse_instance_disks(gnt_disks)
         disks_changed = len(db_disks) != len(gnt_disks)
@@ -343,13 +579,9 @@ class BackendReconciler(object):
             gnt_disks_str = "\n\t\t".join(map(format_gnt_disk,
                                           sorted(gnt_disks_parsed.items())))
             self.log.info(msg, server_id, db_disks_str, gnt_disks_str)
-            if self.options["fix_unsynced_disks"]:
-                vm = get_locked_server(server_id)
-                backend_mod.process_op_status(
-                    vm=vm, etime=self.event_time, jobid=-0,
-                    opcode="OP_INSTANCE_SET_PARAMS", status='success',
-                    logmsg="Reconciliation: simulated Ganeti event",
-                    disks=gnt_disks)
+            if self.fixing("fix_unsynced_disks", server_id):
+                self.add_fix(server_id, self.fix_unsynced_params,
+                             disks=gnt_disks)
 
     def reconcile_pending_task(self, server_id, db_server):
         job_id = db_server.task_job_id
@@ -362,17 +594,19 @@ class BackendReconciler(object):
                 pending_task = True
 
         if pending_task:
-            db_server = get_locked_server(server_id)
-            if db_server.task_job_id != job_id:
-                # task has changed!
-                return
             self.log.info("Found server '%s' with pending task: '%s'",
                           server_id, db_server.task)
-            if self.options["fix_pending_tasks"]:
-                db_server.task = None
-                db_server.task_job_id = None
-                db_server.save()
-                self.log.info("Cleared pending task for server '%s", server_id)
+            if self.fixing("fix_pending_tasks", server_id):
+                self.add_fix(server_id, self.fix_pending_task, job_id)
+
+    def fix_pending_task(self, vm, job_id):
+        if vm.task_job_id != job_id:
+            # task has changed!
+            return
+        vm.task = None
+        vm.task_job_id = None
+        vm.save()
+        self.log.info("Cleared pending task for server '%s", vm.id)
 
     def reconcile_unsynced_snapshots(self):
         # Find the biggest ID of the retrieved Ganeti jobs. Reconciliation
@@ -396,7 +630,10 @@ class BackendReconciler(object):
             backend_id = job_info["ganeti_backend_id"]
             job_id = job_info["ganeti_job_id"]
 
-            if backend_id == self.backend.id and job_id <= max_job_id:
+            # In incremental mode, the snapshots of older jobs have already
+            # been reconciled
+            if backend_id == self.backend.id and\
+               self.last_job_id < job_id <= max_job_id:
                 if job_id in self.gnt_jobs:
                     job_status = self.gnt_jobs[job_id]["status"]
                     state = \
@@ -409,7 +646,7 @@ class BackendReconciler(object):
 
                 self.log.info("Snapshot '%s' is '%s' in Pithos DB but should"
                               " be '%s'", uuid, snapshot["status"], state)
-                if self.options["fix_unsynced_snapshots"]:
+                if self.fixing("fix_unsynced_snapshots"):
                     backend_mod.update_snapshot(uuid, snapshot["owner"],
                                                 job_id=-1,
                                                 job_status=job_status,
@@ -489,21 +726,49 @@ def get_online_backends():
     return Backend.objects.filter(offline=False)
 
 
-def get_database_servers(backend):
+def get_database_servers(backend, server_ids=None, updated_since=None):
     servers = backend.virtual_machines.select_related("flavor")\
                                       .prefetch_related("nics__ips__subnet")\
                                       .filter(deleted=False)
+    if server_ids is not None:
+        servers = servers.filter(id__in=server_ids)
+    if updated_since is not None:
+        servers = servers.filter(backendtime__gt=updated_since)
     return dict([(s.id, s) for s in servers])
 
 
-def get_ganeti_servers(backend):
-    gnt_instances = backend_mod.get_instances(backend)
+def get_backendtime_mark(backend):
+    """Return the latest backendtime of the servers of a backend."""
+    return backend.virtual_machines.aggregate(
+        mark=Max("backendtime"))["mark"] or datetime.min
+
+
+def get_unreconciled_servers(backend):
+    """Return the IDs of the servers left unreconciled in a backend."""
+    return set(int(i) for i in backend.unreconciled_servers.split(",") if i)
+
+
+def get_ganeti_servers(backend, server_ids=None):
+    """Return the instances of a backend, indexed by their server ID.
+
+    If 'server_ids' is given, only these instances are returned. They are got
+    one by one, unless there are more than BULK_QUERY_THRESHOLD of them.
+
+    """
+    if server_ids is None or len(server_ids) > BULK_QUERY_THRESHOLD:
+        gnt_instances = backend_mod.get_instances(backend)
+    else:
+        gnt_instances = [
+            backend_mod.get_instance(backend, utils.id_to_instance_name(i))
+            for i in server_ids]
+        gnt_instances = filter(None, gnt_instances)
     # Filter out non-synnefo instances
     snf_backend_prefix = settings.BACKEND_PREFIX_ID
     gnt_instances = filter(lambda i: i["name"].startswith(snf_backend_prefix),
                            gnt_instances)
     gnt_instances = map(parse_gnt_instance, gnt_instances)
-    return dict([(i["id"], i) for i in gnt_instances if i["id"] is not None])
+    return dict([(i["id"], i) for i in gnt_instances if i["id"] is not None
+                 and (server_ids is None or i["id"] in server_ids)])
 
 
 def parse_gnt_instance(instance):
@@ -579,9 +844,52 @@ def disks_from_instance(i):
     return disks
 
 
-def get_ganeti_jobs(backend):
-    gnt_jobs = backend_mod.get_jobs(backend)
-    return dict([(int(j["id"]), j) for j in gnt_jobs])
+def get_ganeti_jobs(backend, after=None, job_ids=None):
+    """Return the jobs of a backend, indexed by their ID.
+
+    If 'after' is given, only the jobs after this job ID are returned, and if
+    'job_ids' is given, only these jobs. They are got one by one, unless
+    there are more than BULK_QUERY_THRESHOLD of them.
+
+    """
+    if after is not None:
+        job_ids = [j for j in backend_mod.get_jobs(backend, bulk=False)
+                   if int(j) > after]
+    if job_ids is None or len(job_ids) > BULK_QUERY_THRESHOLD:
+        gnt_jobs = backend_mod.get_jobs(backend)
+    else:
+        gnt_jobs = [backend_mod.get_job(backend, j) for j in job_ids]
+        gnt_jobs = filter(None, gnt_jobs)
+    gnt_jobs = dict([(int(j["id"]), j) for j in gnt_jobs])
+    if job_ids is not None:
+        job_ids = set(int(j) for j in job_ids)
+        gnt_jobs = dict((i, j) for i, j in gnt_jobs.items() if i in job_ids)
+    return gnt_jobs
+
+
+def get_job_servers(gnt_jobs):
+    """Return the IDs of the servers that the given jobs refer to."""
+    prefix = settings.BACKEND_PREFIX_ID
+    server_ids = set()
+    for job in gnt_jobs.values():
+        for op in job.get("ops") or []:
+            name = op.get("instance_name")
+            if name is None or not name.startswith(prefix):
+                continue
+            try:
+                server_ids.add(utils.id_from_instance_name(name))
+            except Exception:
+                logger.error("Ignoring instance with malformed name %s", name)
+    return server_ids
+
+
+def get_job_mark(gnt_jobs, last_job_id):
+    """Return the ID up to which all jobs have finished."""
+    running = [job_id for job_id, job in gnt_jobs.items()
+               if job["status"] not in rapi.JOB_STATUS_FINALIZED]
+    if running:
+        return min(running) - 1
+    return max(gnt_jobs.keys() + [last_job_id])
 
 
 class NetworkReconciler(object):
@@ -824,7 +1132,9 @@ class PoolReconciler(object):
         nics = network.ips.exclude(address__isnull=True).all()
         check_unique_values(objects=nics, field="address", logger=self.log)
 
-        for ip_pool in network.get_ip_pools():
+        ip_pools = network.get_ip_pools()
+        check_ip_pools_disjoint(ip_pools, logger=self.log)
+        for ip_pool in ip_pools:
             # IP pool is now locked, so no new IPs may be created
             used_ips = ip_pool.pool_table.subnet\
                               .ips.exclude(address__isnull=True)\
@@ -851,6 +1161,23 @@ def check_unique_values(objects, field, logger):
     return True
 
 
+def check_ip_pools_disjoint(ip_pools, logger):
+    """Check that the IP pools, or shards, of a subnet do not overlap."""
+    disjoint = True
+    last = {}
+    for ip_pool in sorted(ip_pools, key=lambda p: (p.pool_table.subnet_id,
+                                                   p.offset)):
+        subnet_id = ip_pool.pool_table.subnet_id
+        prev = last.get(subnet_id)
+        if prev is not None and prev.offset + prev.pool_size > ip_pool.offset:
+            logger.error("IP pools '%s' and '%s' of subnet '%s' overlap!",
+                         prev.pool_table.id, ip_pool.pool_table.id,
+                         subnet_id)
+            disjoint = False
+        last[subnet_id] = ip_pool
+    return disjoint
+
+
 def check_pool_consistent(pool, pool_class, used_values, fix, logger):
     dummy_pool = create_empty_pool(pool, pool_class)
     [dummy_pool.reserve(value) for value in used_values]
@@ -877,5 +1204,14 @@ def create_empty_pool(pool, pool_class):
     return pool_class(pool_row)
 
 
-def get_locked_server(server_id):
-    return VirtualMachine.objects.select_for_update().get(id=server_id)
+def server_changed(db_server, vm):
+    """Return whether a server changed since its state was read."""
+    return (db_server.backendtime != vm.backendtime or
+            db_server.operstate != vm.operstate or
+            db_server.task_job_id != vm.task_job_id)
+
+
+def get_locked_servers(server_ids):
+    servers = VirtualMachine.objects.select_for_update()\
+                                    .filter(id__in=server_ids).order_by("id")
+    return dict((s.id, s) for s in servers)
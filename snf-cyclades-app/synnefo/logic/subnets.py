@@ -14,6 +14,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import ipaddr
+from bitarray import bitarray
 from logging import getLogger
 from functools import wraps
 
@@ -124,7 +125,9 @@ def _create_subnet(network_id, user_id, cidr, name, ipversion=4, gateway=None,
     if allocation_pools:
         # Validate the allocation pools
         validate_pools(allocation_pools, cidr_ip, gateway_ip)
-        create_ip_pools(allocation_pools, cidr_ip, sub)
+        shards = settings.CYCLADES_PUBLIC_IP_POOL_SHARDS if network.public\
+            else 1
+        create_ip_pools(allocation_pools, cidr_ip, sub, shards=shards)
 
     return sub
 
@@ -177,9 +180,70 @@ def update_subnet(sub_id, name, user_id):
 
 
 #Utility functions
-def create_ip_pools(pools, cidr, subnet):
-    """Create IP Pools in the database"""
-    return [_create_ip_pool(pool, cidr, subnet) for pool in pools]
+def create_ip_pools(pools, cidr, subnet, shards=1):
+    """Create IP Pools in the database
+
+    Each pool is split in up to `shards` pools of consecutive addresses, so
+    that concurrent allocations from the subnet do not all lock the same row.
+
+    """
+    return [_create_ip_pool(shard, cidr, subnet) for pool in pools
+            for shard in split_pool_range(pool, shards)]
+
+
+def split_pool_range(pool, shards):
+    """Split an IP pool range in up to `shards` ranges of almost equal size"""
+    start, end = pool
+    size = int(end) - int(start) + 1
+    shards = max(1, min(shards, size))
+    return [(start + size * i // shards, start + size * (i + 1) // shards - 1)
+            for i in range(shards)]
+
+
+def shard_ip_pools(subnet, shards):
+    """Split the IP pools of a subnet in shards
+
+    Pools of adjacent addresses are merged in a single range, which is then
+    split in up to `shards` pools. The state of each address, either used or
+    externally reserved, is kept. Returns the new pools.
+
+    """
+    pool_rows = list(subnet.ip_pools.select_for_update().order_by("offset"))
+    # Group the pools into ranges of adjacent addresses
+    ranges = []
+    for pool_row in pool_rows:
+        if ranges and ranges[-1][-1].offset + ranges[-1][-1].size ==\
+                pool_row.offset:
+            ranges[-1].append(pool_row)
+        else:
+            ranges.append([pool_row])
+
+    new_rows = []
+    for range_rows in ranges:
+        base = range_rows[0].base
+        offset = range_rows[0].offset
+        available = bitarray()
+        reserved = bitarray()
+        for pool_row in range_rows:
+            pool = pool_row.pool
+            available.extend(pool.available[:pool_row.size])
+            reserved.extend(pool.reserved[:pool_row.size])
+        for first, last in split_pool_range((0, available.length() - 1),
+                                            shards):
+            new_row = IPPoolTable(size=last - first + 1,
+                                  offset=offset + first, base=base,
+                                  subnet=subnet)
+            new_pool = new_row.pool
+            padding = new_pool.available[new_row.size:]
+            new_pool.available = available[first:last + 1] + padding
+            new_pool.reserved = reserved[first:last + 1] + padding
+            new_pool.save()
+            new_rows.append(new_row)
+
+    IPPoolTable.objects.filter(id__in=[r.id for r in pool_rows]).delete()
+    log.info("Split the IP pools of subnet %s in %d shards", subnet.id,
+             len(new_rows))
+    return new_rows
 
 
 def _create_ip_pool(pool, cidr, subnet):
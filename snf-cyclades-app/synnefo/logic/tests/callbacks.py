@@ -28,7 +28,8 @@ from datetime import datetime
 from mock import patch
 from synnefo.api.util import allocate_resource
 from synnefo.logic.callbacks import (update_db, update_network,
-                                     update_build_progress)
+                                     update_build_progress,
+                                     handle_message_batch)
 from snf_django.utils.testing import mocked_quotaholder
 from synnefo.logic.rapi import GanetiApiError
 
@@ -744,3 +745,42 @@ class UpdateBuildProgressTest(TestCase):
             self.assertTrue(client.basic_ack.called)
             vm = self.get_db_vm()
             self.assertEqual(vm.buildpercentage, old)
+
+
+@patch('synnefo.lib.amqp.AMQPClient')
+class MessageBatchTest(TestCase):
+    def create_msg(self, vm, delay, **kwargs):
+        msg = {'event_time': split_time(time() + delay),
+               'instance': vm.backend_vm_id}
+        for key, val in kwargs.items():
+            msg[key] = val
+        return {'body': json.dumps(msg)}
+
+    def test_superseded(self, client):
+        vm = mfactory.VirtualMachineFactory(operstate='BUILD')
+        other_vm = mfactory.VirtualMachineFactory(operstate='BUILD')
+        op_status = dict(type='ganeti-op-status', jobId=1, logmsg='Dummy Log',
+                         operation='OP_INSTANCE_CREATE')
+        progress = dict(type='image-copy-progress')
+        messages = [
+            (update_db, self.create_msg(vm, 0, status='queued', **op_status)),
+            (update_db, self.create_msg(vm, 1, status='running',
+                                        **op_status)),
+            (update_build_progress, self.create_msg(vm, 2, progress=10,
+                                                    **progress)),
+            (update_build_progress, self.create_msg(other_vm, 3, progress=20,
+                                                    **progress)),
+            (update_build_progress, self.create_msg(vm, 4, progress=50,
+                                                    **progress)),
+            (update_db, self.create_msg(vm, 5, status='success',
+                                        **op_status)),
+        ]
+        superseded = handle_message_batch(client, messages)
+        self.assertEqual(superseded, 3)
+        self.assertEqual(client.basic_ack.call_count, 6)
+        db_vm = VirtualMachine.objects.get(id=vm.id)
+        self.assertEqual(db_vm.operstate, 'STARTED')
+        self.assertEqual(db_vm.buildpercentage, 50)
+        self.assertEqual(db_vm.backendjobstatus, 'success')
+        db_vm = VirtualMachine.objects.get(id=other_vm.id)
+        self.assertEqual(db_vm.buildpercentage, 20)
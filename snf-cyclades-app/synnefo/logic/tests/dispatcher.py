@@ -0,0 +1,87 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+from django.test import TestCase
+from mock import Mock, patch
+
+from synnefo.lib.utils import split_time
+from synnefo.logic import dispatcher
+
+from time import time
+
+
+@patch("synnefo.logic.dispatcher.Dispatcher._init")
+class DispatcherWorkersTest(TestCase):
+    def create_dispatcher(self, workers):
+        d = dispatcher.Dispatcher(workers=workers, batch_size=10)
+        d.client = Mock()
+        d.client.client = object()
+        self.addCleanup(self.stop_workers, d)
+        return d
+
+    def stop_workers(self, d):
+        for worker in d.workers:
+            worker.stop()
+        for worker in d.workers:
+            worker.join()
+
+    def create_msg(self, instance, delivery_tag):
+        msg = {"event_time": split_time(time()), "instance": instance}
+        return {"body": json.dumps(msg), "delivery_tag": delivery_tag}
+
+    def test_route(self, _init):
+        d = self.create_dispatcher(4)
+        # Keep the messages in the queues of the workers
+        self.stop_workers(d)
+        route = d.route(Mock())
+        for tag in range(8):
+            route(d.client, self.create_msg("instance-%d" % (tag % 2), tag))
+        # The messages of an instance are routed to the same worker, in the
+        # order they were received
+        owners = {}
+        for worker in d.workers:
+            tags = []
+            while not worker.queue.empty():
+                tags.append(worker.queue.get()[2]["delivery_tag"])
+            self.assertEqual(tags, sorted(tags))
+            for tag in tags:
+                owners.setdefault(tag % 2, set()).add(worker)
+        self.assertEqual([len(w) for w in owners.values()], [1, 1])
+
+    def test_deferred_acks(self, _init):
+        d = self.create_dispatcher(2)
+
+        def callback(client, message):
+            client.basic_ack(message)
+
+        route = d.route(callback)
+        messages = [self.create_msg("instance-%d" % i, i) for i in range(4)]
+        for message in messages[:2]:
+            route(d.client, message)
+        # The client reconnects before the rest of the messages arrive
+        d.client.client = object()
+        for message in messages[2:]:
+            route(d.client, message)
+        self.stop_workers(d)
+        # The workers do not use the client of the dispatcher
+        self.assertFalse(d.client.basic_ack.called)
+        d.send_acks()
+        # Only the messages of the current connection are acknowledged
+        acked = [c[0][0]["delivery_tag"]
+                 for c in d.client.basic_ack.call_args_list]
+        self.assertEqual(sorted(acked), [2, 3])
+        self.assertTrue(d.acks.empty())
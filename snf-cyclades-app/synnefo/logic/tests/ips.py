@@ -15,13 +15,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # Provides automated tests for logic module
+import ipaddr
 from django.test import TestCase
 from django.core.exceptions import ObjectDoesNotExist
 from snf_django.lib.api import faults
 from snf_django.utils.testing import mocked_quotaholder
-from synnefo.logic import ips
+from synnefo.logic import ips, subnets
 from synnefo.db import models_factory as mfactory
-from synnefo.db.models import IPAddress
+from synnefo.db.models import IPAddress, IPPoolTable
 
 
 class IPTest(TestCase):
@@ -90,3 +91,63 @@ class IPTest(TestCase):
             ips.delete_floating_ip(ip)
         with self.assertRaises(ObjectDoesNotExist):
             IPAddress.objects.get(id=ip.id)
+
+
+class ShardedIPPoolTest(TestCase):
+
+    """Test suite for allocations from IP pools split in shards."""
+
+    def setUp(self):
+        self.subnet = mfactory.IPv4SubnetFactory()
+        self.network = self.subnet.network
+
+    def test_split_pool_range(self):
+        ranges = subnets.split_pool_range((2, 11), 3)
+        self.assertEqual(ranges, [(2, 4), (5, 7), (8, 11)])
+        # No more shards than addresses
+        self.assertEqual(subnets.split_pool_range((2, 3), 4),
+                         [(2, 2), (3, 3)])
+
+    def test_shard_ip_pools(self):
+        ip = ips.allocate_ip(self.network, "user")
+        reserved = str(ipaddr.IPNetwork(self.subnet.cidr)[100])
+        self.network.reserve_address(reserved, external=True)
+        subnets.shard_ip_pools(self.subnet, 4)
+        pools = self.subnet.get_ip_pools(locked=False)
+        self.assertEqual(len(pools), 4)
+        self.assertEqual(sum(p.pool_size for p in pools), 253)
+        self.assertEqual(sum(p.count_available() for p in pools), 251)
+        for pool in pools:
+            if pool.contains(ip.address):
+                self.assertFalse(pool.is_available(ip.address))
+            if pool.contains(reserved):
+                self.assertTrue(pool.is_reserved(reserved))
+        # Merge the shards again
+        subnets.shard_ip_pools(self.subnet, 1)
+        pools = self.subnet.get_ip_pools(locked=False)
+        self.assertEqual(len(pools), 1)
+        self.assertEqual(pools[0].count_available(), 251)
+
+    def test_allocate_from_shards(self):
+        subnets.shard_ip_pools(self.subnet, 4)
+        addresses = set()
+        for i in range(253):
+            addresses.add(ips.allocate_ip(self.network, "user").address)
+        self.assertEqual(len(addresses), 253)
+        self.assertRaises(faults.Conflict, ips.allocate_ip, self.network,
+                          "user")
+        ip = IPAddress.objects.all()[0]
+        ip.release_address()
+        ip.delete()
+        self.assertEqual(ips.allocate_ip(self.network, "user").address,
+                         ip.address)
+
+    def test_allocate_from_resharded_pools(self):
+        # The pools are split again after they have been read
+        pool_rows = list(IPPoolTable.objects.filter(subnet=self.subnet))
+        subnets.shard_ip_pools(self.subnet, 4)
+        ip = ips.allocate_ip_from_pools(pool_rows, "user")
+        self.assertEqual(ip.subnet, self.subnet)
+        address = str(ipaddr.IPNetwork(self.subnet.cidr)[200])
+        ip = ips.allocate_ip_from_pools(pool_rows, "user", address=address)
+        self.assertEqual(ip.address, address)
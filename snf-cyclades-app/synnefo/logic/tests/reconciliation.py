@@ -16,12 +16,14 @@
 import logging
 from django.test import TestCase
 
-from synnefo.db.models import VirtualMachine, Network, BackendNetwork
+from synnefo.db.models import (VirtualMachine, Network, BackendNetwork,
+                               Backend)
 from synnefo.db import models_factory as mfactory
-from synnefo.logic import reconciliation
+from synnefo.logic import reconciliation, rapi
 from mock import patch
 from snf_django.utils.testing import mocked_quotaholder
 from time import time
+from datetime import datetime
 from synnefo import settings
 
 
@@ -101,6 +103,123 @@ class ServerReconciliationTest(TestCase):
         vm3 = VirtualMachine.objects.get(id=vm3.id)
         self.assertTrue(vm3.deleted)
 
+    @patch("synnefo.logic.reconciliation.FIX_BATCH_SIZE", 1)
+    def test_stale_servers_in_batches(self, mrapi):
+        mrapi().GetInstances.return_value = []
+        vms = [mfactory.VirtualMachineFactory(backend=self.backend,
+                                              deleted=False,
+                                              operstate="STOPPED")
+               for i in range(3)]
+        with mocked_quotaholder():
+            self.reconciler.reconcile()
+        for vm in vms:
+            self.assertTrue(VirtualMachine.objects.get(id=vm.id).deleted)
+        self.assertEqual(self.reconciler.timings.keys(),
+                         ["database", "ganeti", "detect", "fix", "snapshots"])
+
+    def test_changed_server(self, mrapi):
+        mrapi().GetInstances.return_value = []
+        vm1 = mfactory.VirtualMachineFactory(backend=self.backend,
+                                             deleted=False,
+                                             operstate="STOPPED")
+        self.reconciler.get_state()
+        # The server changes after its state was read
+        VirtualMachine.objects.filter(id=vm1.id)\
+                              .update(operstate="STARTED",
+                                      backendtime=datetime.now())
+        with mocked_quotaholder():
+            self.reconciler.reconcile()
+        vm1 = VirtualMachine.objects.get(id=vm1.id)
+        self.assertFalse(vm1.deleted)
+        self.assertEqual(vm1.operstate, "STARTED")
+        self.assertEqual(self.reconciler.pending, set([vm1.id]))
+
+    def test_incremental(self, mrapi):
+        self.reconciler.options["incremental"] = True
+        mrapi().GetInstances.return_value = []
+        mrapi().GetJobs.return_value = []
+        mrapi().GetInstance.side_effect =\
+            rapi.GanetiApiError("Not found", code=404)
+        # No reconciliation state, so a full one is performed
+        with mocked_quotaholder():
+            self.reconciler.reconcile()
+        self.assertFalse(self.reconciler.incremental)
+        backend = Backend.objects.get(id=self.backend.id)
+        self.assertEqual(backend.reconciled_job_id, 0)
+        self.assertNotEqual(backend.fully_reconciled, None)
+
+        # Servers that have not changed are not checked
+        vm1 = mfactory.VirtualMachineFactory(backend=self.backend,
+                                             deleted=False,
+                                             operstate="STOPPED")
+        with mocked_quotaholder():
+            self.reconciler.reconcile()
+        self.assertTrue(self.reconciler.incremental)
+        self.assertFalse(VirtualMachine.objects.get(id=vm1.id).deleted)
+
+        vm1.backendtime = datetime.now()
+        vm1.save()
+        with mocked_quotaholder():
+            self.reconciler.reconcile()
+        self.assertTrue(VirtualMachine.objects.get(id=vm1.id).deleted)
+
+        # A full sweep is performed when the last one is too old
+        self.reconciler.options["full_sweep_interval"] = 0
+        with mocked_quotaholder():
+            self.reconciler.reconcile()
+        self.assertFalse(self.reconciler.incremental)
+
+    def test_incremental_unfixed(self, mrapi):
+        self.reconciler.options["incremental"] = True
+        self.reconciler.options["fix_stale"] = False
+        mrapi().GetInstances.return_value = []
+        mrapi().GetJobs.return_value = []
+        mrapi().GetInstance.side_effect =\
+            rapi.GanetiApiError("Not found", code=404)
+        with mocked_quotaholder():
+            self.reconciler.reconcile()
+        backend = Backend.objects.get(id=self.backend.id)
+        backendtime = backend.reconciled_backendtime
+
+        # The state moves on, but the stale server is remembered
+        vm1 = mfactory.VirtualMachineFactory(backend=self.backend,
+                                             deleted=False,
+                                             operstate="STOPPED",
+                                             backendtime=datetime.now())
+        with mocked_quotaholder():
+            self.reconciler.reconcile()
+        self.assertTrue(self.reconciler.incremental)
+        self.assertFalse(VirtualMachine.objects.get(id=vm1.id).deleted)
+        backend = Backend.objects.get(id=self.backend.id)
+        self.assertNotEqual(backend.reconciled_backendtime, backendtime)
+        self.assertEqual(backend.unreconciled_servers, str(vm1.id))
+
+        # The server is checked again, although it has not changed since
+        self.reconciler.options["fix_stale"] = True
+        with mocked_quotaholder():
+            self.reconciler.reconcile()
+        self.assertTrue(self.reconciler.incremental)
+        self.assertTrue(VirtualMachine.objects.get(id=vm1.id).deleted)
+        backend = Backend.objects.get(id=self.backend.id)
+        self.assertEqual(backend.unreconciled_servers, "")
+
+    @patch("synnefo.logic.reconciliation.BULK_QUERY_THRESHOLD", 0)
+    def test_incremental_bulk_queries(self, mrapi):
+        self.reconciler.options["incremental"] = True
+        mrapi().GetInstances.return_value = []
+        mrapi().GetJobs.return_value = []
+        with mocked_quotaholder():
+            self.reconciler.reconcile()
+        vm1 = mfactory.VirtualMachineFactory(backend=self.backend,
+                                             deleted=False,
+                                             operstate="STOPPED",
+                                             backendtime=datetime.now())
+        with mocked_quotaholder():
+            self.reconciler.reconcile()
+        self.assertTrue(self.reconciler.incremental)
+        self.assertTrue(VirtualMachine.objects.get(id=vm1.id).deleted)
+        self.assertFalse(mrapi().GetInstance.called)
+
     def test_orphan_server(self, mrapi):
         cmrapi = self.reconciler.client
         mrapi().GetInstances.return_value =\
@@ -17,8 +17,8 @@ from django.core.management import CommandError
 from synnefo.db.models import (Backend, VirtualMachine, Network,
                                Flavor, IPAddress, Subnet,
                                BridgePoolTable, MacPrefixPoolTable,
-                               NetworkInterface, Volume, VolumeType,
-                               ProjectBackend)
+                               IPPoolTable, NetworkInterface, Volume,
+                               VolumeType, ProjectBackend)
 from functools import wraps
 
 from django.conf import settings
@@ -165,7 +165,7 @@ def pool_table_from_type(type_):
         return MacPrefixPoolTable
     elif type_ == "bridge":
         return BridgePoolTable
-    # elif type == "ip":
-    #     return IPPoolTable
+    elif type_ == "ip":
+        return IPPoolTable
     else:
         raise ValueError("Invalid pool type")
@@ -147,9 +147,13 @@ def pprint_ippool(subnet, stdout=None, title=None):
 
     stdout.write("IP Pools of subnet %s:\n\n" % subnet.id)
 
-    for pool in subnet.get_ip_pools():
+    ip_pools = sorted(subnet.get_ip_pools(locked=False),
+                      key=lambda pool: pool.offset)
+    for shard, pool in enumerate(ip_pools, 1):
         size = pool.pool_size
-        info = OrderedDict([("First_IP", pool.return_start()),
+        info = OrderedDict([("ID", pool.pool_table.id),
+                            ("Shard", "%d of %d" % (shard, len(ip_pools))),
+                            ("First_IP", pool.return_start()),
                             ("Last_IP", pool.return_end()),
                             ("Size", size),
                             ("Available", pool.count_available()),
@@ -46,7 +46,8 @@ from django.conf import settings
 from django.utils import importlib
 from django.utils.encoding import smart_unicode, smart_str
 from pithos.backends.exceptions import (NotAllowedError, VersionNotExists,
-                                        QuotaError, LimitExceeded)
+                                        QuotaError, LimitExceeded,
+                                        ItemNotExists)
 from pithos.backends.modular import MAP_AVAILABLE, MAP_UNAVAILABLE, MAP_ERROR
 from pithos.backends.util import PithosBackendPool
 from snf_django.lib.api import faults
@@ -63,6 +64,18 @@ PROPERTY_PREFIX = 'property:'
 PLANKTON_META = ('container_format', 'disk_format', 'name',
                  'status', 'created_at', 'volume_id', 'description')
 
+# Image fields the Pithos backend can sort images by, mapped to the
+# corresponding object property or metadata key. Images are sorted by the
+# other fields here.
+BACKEND_SORT_KEYS = {
+    'id': 'uuid',
+    'name': PLANKTON_PREFIX + 'name',
+    'size': 'size',
+    'updated_at': 'mtime',
+    'disk_format': PLANKTON_PREFIX + 'disk_format',
+    'container_format': PLANKTON_PREFIX + 'container_format',
+}
+
 SNAPSHOTS_CONTAINER = "snapshots"
 SNAPSHOTS_TYPE = "application/octet-stream"
 
@@ -399,33 +412,56 @@ class PlanktonBackend(object):
     def _list_images(self, user=None, filters=None, params=None,
                      check_permissions=True):
         filters = filters or {}
-
-        # TODO: Use filters
-        # # Fix keys
-        # keys = [PLANKTON_PREFIX + 'name']
-        # size_range = (None, None)
-        # for key, val in filters.items():
-        #     if key == 'size_min':
-        #         size_range = (val, size_range[1])
-        #     elif key == 'size_max':
-        #         size_range = (size_range[0], val)
-        #     else:
-        #         keys.append('%s = %s' % (PLANKTON_PREFIX + key, val))
-        _images = self.backend.get_domain_objects(
-            domain=PLANKTON_DOMAIN, user=user,
-            check_permissions=check_permissions)
+        params = params or {}
+
+        meta = {}
+        for key in ('name', 'container_format', 'disk_format'):
+            if key in filters:
+                meta[PLANKTON_PREFIX + key] = filters[key]
+        for key, val in filters.get('properties', {}).items():
+            meta[PLANKTON_PREFIX + PROPERTY_PREFIX + key] = val
+        size_range = (filters.get('size_min'), filters.get('size_max'))
+        status = filters.get('status')
+
+        sort_key = params.get('sort_key', 'created_at')
+        reverse = params.get('sort_dir', 'desc') == 'desc'
+        marker = params.get('marker')
+        limit = params.get('limit')
+
+        # Let the backend sort and page the images, unless they have to be
+        # sorted or filtered by fields that are not stored as such.
+        paged = sort_key in BACKEND_SORT_KEYS and status is None
+        kwargs = {}
+        if paged:
+            kwargs = {'sort_key': BACKEND_SORT_KEYS[sort_key],
+                      'reverse': reverse, 'marker': marker, 'limit': limit}
+        try:
+            _images = self.backend.get_domain_objects(
+                domain=PLANKTON_DOMAIN, user=user,
+                check_permissions=check_permissions, filters=meta,
+                size_range=size_range, **kwargs)
+        except ItemNotExists:
+            raise faults.BadRequest("Invalid marker")
 
         images = []
         for (location, metadata, permissions) in _images:
             location = Location(*location.split("/", 2))
             images.append(image_to_dict(location, metadata, permissions))
+        if paged:
+            return images
 
-        if params is None:
-            params = {}
-
-        key = itemgetter(params.get('sort_key', 'created_at'))
-        reverse = params.get('sort_dir', 'desc') == 'desc'
+        if status is not None:
+            images = [i for i in images
+                      if i["status"].upper() == status.upper()]
+        key = itemgetter(sort_key)
         images.sort(key=key, reverse=reverse)
+        if marker is not None:
+            ids = [i["id"] for i in images]
+            if marker not in ids:
+                raise faults.BadRequest("Invalid marker")
+            images = images[ids.index(marker) + 1:]
+        if limit is not None:
+            images = images[:limit]
         return images
 
     @handle_pithos_backend
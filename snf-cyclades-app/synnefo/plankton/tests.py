@@ -322,3 +322,20 @@ class PlanktonTest(BaseAPITest):
     def test_list_images_filters_error_1(self, backend):
         response = self.get(join_urls(IMAGES_URL, "?size_max="))
         self.assertBadRequest(response)
+
+    def test_list_images_filters(self, backend):
+        backend().get_domain_objects.return_value = []
+        response = self.get(join_urls(
+            IMAGES_URL, "?name=foo&size_min=10&property-os=debian"
+                        "&sort_key=name&sort_dir=asc&marker=uuid&limit=5"))
+        self.assertSuccess(response)
+        backend().get_domain_objects.assert_called_once_with(
+            domain="plankton", user="user", check_permissions=True,
+            filters={"plankton:name": "foo",
+                     "plankton:property:os": "debian"},
+            size_range=(10, None), sort_key="plankton:name", reverse=False,
+            marker="uuid", limit=5)
+
+    def test_list_images_filters_error_2(self, backend):
+        response = self.get(join_urls(IMAGES_URL, "?limit=-1"))
+        self.assertBadRequest(response)
@@ -34,7 +34,10 @@ from synnefo.plankton.backend import split_url
 FILTERS = ('name', 'container_format', 'disk_format', 'status', 'size_min',
            'size_max')
 
-PARAMS = ('sort_key', 'sort_dir')
+PARAMS = ('sort_key', 'sort_dir', 'marker', 'limit')
+
+# Prefix of the filters on image properties, e.g. 'property-os=debian'.
+PROPERTY_FILTER_PREFIX = 'property-'
 
 SORT_KEY_OPTIONS = ('id', 'name', 'status', 'size', 'disk_format',
                     'container_format', 'created_at', 'updated_at')
@@ -308,6 +311,11 @@ def list_images(request, detail=False):
 
     filters = get_request_params(FILTERS)
     params = get_request_params(PARAMS)
+    properties = dict((key[len(PROPERTY_FILTER_PREFIX):], val)
+                      for key, val in request.GET.items()
+                      if key.startswith(PROPERTY_FILTER_PREFIX))
+    if properties:
+        filters['properties'] = properties
 
     params.setdefault('sort_key', 'created_at')
     params.setdefault('sort_dir', 'desc')
@@ -329,6 +337,14 @@ def list_images(request, detail=False):
         except ValueError:
             raise faults.BadRequest("Malformed request.")
 
+    if 'limit' in params:
+        try:
+            params['limit'] = int(params['limit'])
+        except ValueError:
+            raise faults.BadRequest("Malformed request.")
+        if params['limit'] < 0:
+            raise faults.BadRequest("Malformed request.")
+
     with PlanktonBackend(request.user_uniq) as backend:
         images = backend.list_images(filters, params)
 
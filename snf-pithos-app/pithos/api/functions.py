@@ -33,9 +33,10 @@ from pithos.api.util import (
     validate_matching_preconditions, split_container_object_string,
     copy_or_move_object, get_int_parameter, get_content_length,
     get_content_range, socket_read_iterator, SaveToBackendHandler,
-    object_data_response, put_object_block, hashmap_md5, simple_list_response,
-    api_method, is_uuid, retrieve_uuid, retrieve_uuids,
-    retrieve_displaynames, Checksum, NoChecksum
+    BlockUploader, object_data_response, put_object_block, update_object_md5,
+    simple_list_response, api_method, is_uuid, retrieve_uuid, retrieve_uuids,
+    retrieve_displaynames, get_displayname_resolver, listing_response,
+    Checksum, NoChecksum
 )
 
 from pithos.api.settings import (UPDATE_MD5, TRANSLATE_UUIDS,
@@ -261,9 +262,12 @@ def account_meta(request, v_account):
         request.user_uniq, v_account)
 
     if TRANSLATE_UUIDS:
+        resolver = get_displayname_resolver(request)
+        for members in groups.itervalues():
+            resolver.add(members)
+        resolver.resolve()
         for k in groups:
-            groups[k] = retrieve_displaynames(
-                getattr(request, 'token', None), groups[k])
+            groups[k] = map(resolver.get, groups[k])
     policy = request.backend.get_account_policy(
         request.user_uniq, v_account)
 
@@ -383,14 +387,9 @@ def container_list(request, v_account):
                 meta['X-Container-Policy'] = printable_header_dict(
                     dict([(k, v) for k, v in policy.iteritems()]))
             container_meta.append(printable_header_dict(meta))
-    if request.serialization == 'xml':
-        data = render_to_string('containers.xml', {'account':
-                                v_account, 'containers': container_meta})
-    elif request.serialization == 'json':
-        data = json.dumps(container_meta)
-    response.status_code = 200
-    response.content = data
-    return response
+    return listing_response(request, response, container_meta,
+                            len(container_meta), 'account', v_account,
+                            'container')
 
 
 @api_method('HEAD', user_required=True, logger=logger)
@@ -483,12 +482,14 @@ def container_update(request, v_account, v_container):
         request.backend.can_write_container(request.user_uniq, v_account,
                                             v_container)
 
+        uploader = BlockUploader(request.backend)
         for data in socket_read_iterator(request, content_length,
                                          request.backend.block_size):
             # TODO: Raise 408 (Request Timeout) if this takes too long.
             # TODO: Raise 499 (Client Disconnect) if a length is defined
             #       and we stop before getting this much data.
-            hashmap.append(request.backend.put_block(data))
+            uploader.put(data)
+        hashmap = uploader.hashmap()
 
     response = HttpResponse(status=202)
     if hashmap:
@@ -636,19 +637,25 @@ def object_list(request, v_account, v_container):
                     v_container, prefix).iteritems():
                     object_public[k[name_idx:]] = v
 
-    object_meta = []
-    for meta in objects:
+    if TRANSLATE_UUIDS:
+        # Translate all the uuids of the listing at once.
+        resolver = get_displayname_resolver(request)
+        resolver.add(meta['modified_by'] for meta in objects
+                     if meta.get('modified_by'))
+        for _, _, perms in object_permissions.itervalues():
+            resolver.add_holders(perms.get('read', []))
+            resolver.add_holders(perms.get('write', []))
+        resolver.resolve()
+
+    def format_object_meta(meta):
         if TRANSLATE_UUIDS:
             modified_by = meta.get('modified_by')
             if modified_by:
-                l = retrieve_displaynames(
-                    getattr(request, 'token', None), [meta['modified_by']])
-                if l is not None and len(l) == 1:
-                    meta['modified_by'] = l[0]
+                meta['modified_by'] = resolver.get(modified_by)
 
         if len(meta) == 1:
             # Virtual objects/directories.
-            object_meta.append(meta)
+            return meta
         else:
             rename_meta_key(
                 meta, 'hash', 'x_object_hash')  # Will be replaced by checksum.
@@ -672,16 +679,12 @@ def object_list(request, v_account, v_container):
                 # Return public information only if the request user
                 # is the object owner
                 update_public_meta(public_url, meta)
-            object_meta.append(printable_header_dict(meta))
+            return printable_header_dict(meta)
 
-    if request.serialization == 'xml':
-        data = render_to_string(
-            'objects.xml', {'container': v_container, 'objects': object_meta})
-    elif request.serialization == 'json':
-        data = json.dumps(object_meta, default=json_encode_decimal)
-    response.status_code = 200
-    response.content = data
-    return response
+    # The listing is formatted lazily, while it is serialized.
+    object_meta = (format_object_meta(meta) for meta in objects)
+    return listing_response(request, response, object_meta, len(objects),
+                            'container', v_container, 'object')
 
 
 @api_method('HEAD', user_required=True, logger=logger)
@@ -939,15 +942,16 @@ def object_write(request, v_account, v_container, v_object):
         etag = request.META.get('HTTP_ETAG')
         checksum_compute = Checksum() if etag or UPDATE_MD5 else NoChecksum()
         size = 0
-        hashmap = []
+        uploader = BlockUploader(request.backend)
         for data in socket_read_iterator(request, content_length,
                                          request.backend.block_size):
             # TODO: Raise 408 (Request Timeout) if this takes too long.
             # TODO: Raise 499 (Client Disconnect) if a length is defined
             #       and we stop before getting this much data.
             size += len(data)
-            hashmap.append(request.backend.put_block(data))
+            uploader.put(data)
             checksum_compute.update(data)
+        hashmap = uploader.hashmap()
 
         checksum = checksum_compute.hexdigest()
         if etag and parse_etags(etag)[0].lower() != checksum:
@@ -966,11 +970,9 @@ def object_write(request, v_account, v_container, v_object):
 
     if not checksum and UPDATE_MD5:
         # Update the MD5 after the hashmap, as there may be missing hashes.
-        checksum = hashmap_md5(request.backend, hashmap, size)
-        request.backend.update_object_checksum(request.user_uniq,
-                                               v_account, v_container,
-                                               v_object, version_id,
-                                               checksum)
+        checksum = update_object_md5(request, v_account, v_container,
+                                     v_object, version_id, merkle, hashmap,
+                                     size)
     if public is not None:
         request.backend.update_object_public(request.user_uniq, v_account,
                                              v_container, v_object, public)
@@ -1262,12 +1264,13 @@ def object_update(request, v_account, v_container, v_object):
     if dest_bytes is not None and dest_bytes < size:
         size = dest_bytes
         hashmap = hashmap[:(int((size - 1) / request.backend.block_size) + 1)]
-    checksum = hashmap_md5(
-        request.backend, hashmap, size) if UPDATE_MD5 else ''
     version_id, merkle = request.backend.update_object_hashmap(
         request.user_uniq, v_account, v_container, v_object, size,
-        prev_meta['type'], hashmap, checksum, 'pithos', meta, replace,
+        prev_meta['type'], hashmap, '', 'pithos', meta, replace,
         permissions)
+    checksum = update_object_md5(
+        request, v_account, v_container, v_object, version_id, merkle,
+        hashmap, size) if UPDATE_MD5 else ''
 
     if public is not None:
         request.backend.update_object_public(request.user_uniq, v_account,
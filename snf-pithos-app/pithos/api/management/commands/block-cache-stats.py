@@ -0,0 +1,40 @@
+# Copyright (C) 2010-2016 GRNET S.A.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import CommandError
+
+from snf_django.management.commands import SynnefoCommand
+from snf_django.management import utils
+
+from pithos.api.util import get_backend
+
+
+class Command(SynnefoCommand):
+    help = """Show the counters of the node's shared block cache
+
+The counters are aggregated over all the Pithos processes of the node
+using the cache, since the cache file was created."""
+
+    def handle(self, *args, **options):
+        b = get_backend()
+        try:
+            stats = b.get_block_cache_stats()
+        finally:
+            b.close()
+        if stats is None:
+            raise CommandError("The block cache is disabled. Set "
+                               "PITHOS_BACKEND_BLOCK_CACHE_SIZE to enable it.")
+        utils.pprint_table(self.stdout, [stats.values()], stats.keys(),
+                           options["output_format"], vertical=True)
@@ -0,0 +1,69 @@
+# Copyright (C) 2010-2016 GRNET S.A.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import CommandError
+
+from optparse import make_option
+
+from snf_django.management.commands import SynnefoCommand
+
+from pithos.api.util import get_backend
+
+
+class Command(SynnefoCommand):
+    args = "<account> <container>"
+    help = """Purge a container.
+
+    Delete all the objects of the container along with their history and
+    remove the container, or, if --until is specified, purge only the
+    history of the objects up to that time.
+
+    The objects and versions are purged in chunks, each in a transaction of
+    its own, and the progress is reported after every chunk. An interrupted
+    purge may be resumed by running the command again.
+
+    """
+
+    option_list = SynnefoCommand.option_list + (
+        make_option("--until", dest="until",
+                    default=None,
+                    type="int",
+                    help="Purge the history up to this UNIX timestamp"),
+        make_option("--chunk-size", dest="chunk_size",
+                    default=None,
+                    type="int",
+                    help="The number of objects or versions purged in each "
+                         "transaction"),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError("Invalid number of arguments")
+        account, container = args
+
+        kwargs = {}
+        if options['chunk_size']:
+            kwargs['chunk_size'] = options['chunk_size']
+        b = get_backend()
+        try:
+            for deleted, purged in b.purge_container(
+                    account, account, container, until=options['until'],
+                    **kwargs):
+                self.stdout.write("Deleted %d objects, purged %d versions\n"
+                                  % (deleted, purged))
+        except Exception as e:
+            raise CommandError(e)
+        finally:
+            b.close()
@@ -0,0 +1,66 @@
+# Copyright (C) 2010-2016 GRNET S.A.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import CommandError
+
+from optparse import make_option
+
+from snf_django.management.commands import SynnefoCommand
+
+from pithos.api.util import get_backend
+
+
+class Command(SynnefoCommand):
+    args = ("<account> <container> <path> "
+            "<dest account> <dest container> <dest path>")
+    help = """Copy or move a folder and everything under it.
+
+    The objects are copied in chunks, each in a transaction of its own, and
+    the progress is reported after every chunk. An interrupted move may be
+    resumed by running the command again.
+
+    """
+
+    option_list = SynnefoCommand.option_list + (
+        make_option("--move", dest="move",
+                    default=False,
+                    action="store_true",
+                    help="Move the objects instead of copying them"),
+        make_option("--chunk-size", dest="chunk_size",
+                    default=None,
+                    type="int",
+                    help="The number of objects copied in each transaction"),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 6:
+            raise CommandError("Invalid number of arguments")
+        account, container, name, dest_account, dest_container, dest_name = \
+            args
+
+        kwargs = {}
+        if options['chunk_size']:
+            kwargs['chunk_size'] = options['chunk_size']
+        b = get_backend()
+        try:
+            for done, total in b.copy_tree(
+                    account, account, container, name, dest_account,
+                    dest_container, dest_name, is_move=options['move'],
+                    **kwargs):
+                self.stdout.write("Copied %d of %d objects\n" % (done, total))
+        except Exception as e:
+            raise CommandError(e)
+        finally:
+            b.close()
@@ -0,0 +1,81 @@
+# Copyright (C) 2010-2014 GRNET S.A.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import CommandError
+
+from optparse import make_option
+
+from pithos.api.util import get_backend
+
+from snf_django.management import utils
+
+from snf_django.management.commands import SynnefoCommand
+
+CLUSTERS = ('normal', 'history', 'deleted')
+
+
+class Command(SynnefoCommand):
+    help = """Reconcile the statistics kept in Pithos DB.
+
+    The number of objects, the bytes and the last modification time of every
+    account and container are kept up to date along with their contents.
+    Detect statistics that do not match the object versions they account for
+    and rebuild them if specified so.
+
+    """
+    option_list = SynnefoCommand.option_list + (
+        make_option("--user", dest="userid",
+                    default=None,
+                    help="Reconcile statistics only for this user"),
+        make_option("--fix", dest="fix",
+                    default=False,
+                    action="store_true",
+                    help="Rebuild the unsynchronized statistics."),
+    )
+
+    def handle(self, **options):
+        write = self.stdout.write
+        userid = options['userid']
+        backend = get_backend()
+        try:
+            backend.pre_exec()
+            if userid and backend.node.node_lookup(userid) is None:
+                write("User '%s' does not exist in DB!\n" % userid)
+                return
+
+            accounts = [userid] if userid else []
+            unsynced = backend.reconcile_statistics(accounts,
+                                                    fix=options["fix"])
+            if not unsynced:
+                write("Everything in sync.\n")
+                return
+
+            headers = ("Path", "Cluster", "Objects", "Bytes",
+                       "Actual objects", "Actual bytes")
+            table = [(path, CLUSTERS[cluster], population, size,
+                      actual_population, actual_size)
+                     for path, cluster, (population, size),
+                     (actual_population, actual_size) in unsynced]
+            utils.pprint_table(self.stdout, table, headers,
+                               options["output_format"])
+            if options["fix"]:
+                write("Fixed unsynced statistics\n")
+        except BaseException as e:
+            backend.post_exec(False)
+            raise CommandError(e)
+        else:
+            backend.post_exec(True)
+        finally:
+            backend.close()
@@ -139,10 +139,27 @@ BACKEND_POOL_SIZE = getattr(settings, 'PITHOS_BACKEND_POOL_SIZE', 5)
 # Update object checksums.
 UPDATE_MD5 = getattr(settings, 'PITHOS_UPDATE_MD5', False)
 
+# Compute the checksums of objects created from a hashmap or copied, which
+# are not already known, in the background instead of during the request
+UPDATE_MD5_ASYNC = getattr(settings, 'PITHOS_UPDATE_MD5_ASYNC', False)
+
+# The number of threads per process computing checksums in the background
+UPDATE_MD5_WORKERS = getattr(settings, 'PITHOS_UPDATE_MD5_WORKERS', 2)
+
 # This enables a ui compatibility layer for the introduction of UUIDs in
 # identity management.  WARNING: Setting to True will break your installation.
 TRANSLATE_UUIDS = getattr(settings, 'PITHOS_TRANSLATE_UUIDS', False)
 
+# The number of seconds the displaynames of users are cached by each process
+# when translating uuids (0 disables the cache), the number of seconds unknown
+# uuids are cached and the maximum number of cached uuids
+USER_CATALOG_CACHE_TTL = getattr(settings, 'PITHOS_USER_CATALOG_CACHE_TTL',
+                                 300)
+USER_CATALOG_CACHE_NEGATIVE_TTL = getattr(
+    settings, 'PITHOS_USER_CATALOG_CACHE_NEGATIVE_TTL', 60)
+USER_CATALOG_CACHE_SIZE = getattr(settings, 'PITHOS_USER_CATALOG_CACHE_SIZE',
+                                  10000)
+
 # Set how many random bytes to use for constructing the URL
 # of Pithos public files
 PUBLIC_URL_SECURITY = getattr(settings, 'PITHOS_PUBLIC_URL_SECURITY', 16)
@@ -155,6 +172,11 @@ PUBLIC_URL_ALPHABET = getattr(
 # The maximum number or items returned by the listing api methods
 API_LIST_LIMIT = getattr(settings, 'PITHOS_API_LIST_LIMIT', 10000)
 
+# Listings with more items than this are streamed to the client one item at
+# a time, instead of being serialized in memory as a whole
+API_LIST_STREAM_THRESHOLD = getattr(settings,
+                                    'PITHOS_API_LIST_STREAM_THRESHOLD', 1000)
+
 # The backend block size
 BACKEND_BLOCK_SIZE = getattr(
     settings, 'PITHOS_BACKEND_BLOCK_SIZE', 4 * 1024 * 1024)
@@ -163,6 +185,50 @@ BACKEND_BLOCK_SIZE = getattr(
 BACKEND_HASH_ALGORITHM = getattr(
     settings, 'PITHOS_BACKEND_HASH_ALGORITHM', 'sha256')
 
+# The number of blocks fetched ahead of the one being sent when serving
+# object data (0 disables read-ahead)
+BACKEND_BLOCK_PREFETCH = getattr(settings, 'PITHOS_BACKEND_BLOCK_PREFETCH', 2)
+
+# The number of threads per process fetching blocks ahead
+BACKEND_BLOCK_PREFETCH_WORKERS = getattr(
+    settings, 'PITHOS_BACKEND_BLOCK_PREFETCH_WORKERS', 8)
+
+# The number of uploaded blocks stored in the background while the next
+# ones are being received (0 stores each block before reading the next one)
+BACKEND_BLOCK_UPLOAD_WINDOW = getattr(settings,
+                                      'PITHOS_BACKEND_BLOCK_UPLOAD_WINDOW', 2)
+
+# The number of threads per process storing uploaded blocks
+BACKEND_BLOCK_UPLOAD_WORKERS = getattr(
+    settings, 'PITHOS_BACKEND_BLOCK_UPLOAD_WORKERS', 8)
+
+# The size in bytes of the block cache shared by the processes of a node
+# (0 disables the cache) and the file backing it, preferably on a tmpfs
+BACKEND_BLOCK_CACHE_SIZE = getattr(settings, 'PITHOS_BACKEND_BLOCK_CACHE_SIZE',
+                                   0)
+BACKEND_BLOCK_CACHE_PATH = getattr(settings, 'PITHOS_BACKEND_BLOCK_CACHE_PATH',
+                                   '/dev/shm/pithos-block-cache')
+
+# The number of block hashes in the Merkle trees of recently updated objects
+# kept by each process, so that updating a few blocks of an object does not
+# rehash its whole hashmap (0 disables the cache)
+BACKEND_MERKLE_CACHE_SIZE = getattr(settings,
+                                    'PITHOS_BACKEND_MERKLE_CACHE_SIZE', 65536)
+
+# Resolve the quota commissions of write requests in a background thread of
+# each process, in batches of up to PITHOS_BACKEND_COMMISSION_BATCH_SIZE
+# serials, instead of before responding to each request
+BACKEND_ASYNC_COMMISSIONS = getattr(settings,
+                                    'PITHOS_BACKEND_ASYNC_COMMISSIONS', False)
+BACKEND_COMMISSION_BATCH_SIZE = getattr(
+    settings, 'PITHOS_BACKEND_COMMISSION_BATCH_SIZE', 1000)
+
+# The number of (user, account) pairs whose permissions on the shared paths
+# of the account are kept by each process, so that checking access to shared
+# objects needs no permission queries (0 disables the cache)
+BACKEND_ACL_CACHE_SIZE = getattr(settings, 'PITHOS_BACKEND_ACL_CACHE_SIZE',
+                                 10000)
+
 # Set the credentials (client identifier, client secret) issued for
 # authenticating the views with astakos during the resource access token
 # generation procedure
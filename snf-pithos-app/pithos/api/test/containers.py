@@ -22,6 +22,8 @@ from pithos.api.test.util import strnextling, get_random_data, get_random_name
 
 from synnefo.lib import join_urls
 
+from mock import patch
+
 import json
 from django.utils.http import urlencode
 
@@ -651,6 +653,37 @@ class ContainerGet(PithosAPITest):
         self.assertEqual(len(objects), 1)
         self.assertEqual(objects[0].childNodes[0].data, 'photos/me.jpg')
 
+    def test_list_streamed(self):
+        url = join_urls(self.pithos_path, self.user, 'apples')
+
+        def xml_listing(content):
+            xml = minidom.parseString(content)
+            objects = xml.getElementsByTagName('object')
+            return [dict((n.tagName, n.toxml()) for n in o.childNodes
+                         if n.nodeType == n.ELEMENT_NODE) for o in objects]
+
+        r = self.get('%s?format=json' % url)
+        self.assertFalse(r.streaming)
+        listing = r.content
+        r = self.get('%s?format=xml' % url)
+        self.assertFalse(r.streaming)
+        xml_objects = xml_listing(r.content)
+        self.assertEqual(len(xml_objects), len(self.objects['apples']))
+
+        with patch('pithos.api.util.API_LIST_STREAM_THRESHOLD', 2):
+            r = self.get('%s?format=json' % url)
+            self.assertEqual(r.status_code, 200)
+            self.assertTrue(r.streaming)
+            self.assertEqual(r['Content-Type'],
+                             'application/json; charset=UTF-8')
+            self.assertEqual(''.join(r.streaming_content), listing)
+
+            r = self.get('%s?format=xml' % url)
+            self.assertEqual(r.status_code, 200)
+            self.assertTrue(r.streaming)
+            self.assertEqual(
+                xml_listing(''.join(r.streaming_content)), xml_objects)
+
     def test_list_meta_double_matching(self):
         # update object meta
         cname = 'apples'
@@ -14,6 +14,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from pithos.api.test import PithosAPITest
+from pithos.api.util import DisplaynameCache
+
+from mock import patch
 
 from synnefo.lib import join_urls
 
@@ -212,3 +215,47 @@ class ListSharing(PithosAPITest):
         shared_objects = [i.get('name', i.get('subdir')) for i in
                           json.loads(r.content)]
         self.assertEqual(shared_objects, ['f1/f2/f3/obj'])
+
+
+class ListTranslateUUIDs(PithosAPITest):
+    def _translate_uuids(self):
+        self.create_patch('pithos.api.functions.TRANSLATE_UUIDS', True)
+        self.create_patch('pithos.api.util.TRANSLATE_UUIDS', True)
+        patcher = patch('pithos.api.util._displayname_cache',
+                        DisplaynameCache(60, 60, 100))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        get_usernames = self.create_patch('pithos.api.util._get_usernames')
+        get_usernames.side_effect = lambda token, uuids: dict(
+            (u, 'name-%s' % u) for u in uuids if u != 'nobody')
+        return get_usernames
+
+    def test_list_objects(self):
+        self.create_container('c1')
+        names = ['obj%d' % i for i in range(5)]
+        for name in names:
+            self.upload_object('c1', name)
+        url = join_urls(self.pithos_path, self.user, 'c1', names[0])
+        r = self.post(url, content_type='', HTTP_CONTENT_RANGE='bytes */*',
+                      HTTP_X_OBJECT_SHARING='read=alice,nobody;write=bob')
+        self.assertEqual(r.status_code, 202)
+
+        get_usernames = self._translate_uuids()
+        url = join_urls(self.pithos_path, self.user, 'c1')
+        for _ in range(2):
+            r = self.get('%s?format=json' % url)
+            self.assertEqual(r.status_code, 200)
+            objects = json.loads(r.content)
+            self.assertEqual([o['name'] for o in objects], names)
+            for o in objects:
+                self.assertEqual(o['x_object_modified_by'],
+                                 'name-%s' % self.user)
+            read, write = objects[0]['x_object_sharing'].split('; ')
+            self.assertEqual(set(read[5:].split(',')),
+                             set(['name-alice', 'nobody']))
+            self.assertEqual(write, 'write=name-bob')
+
+        # All the uuids are translated at once and then cached.
+        self.assertEqual(get_usernames.call_count, 1)
+        self.assertEqual(sorted(get_usernames.call_args[0][1]),
+                         sorted(['alice', 'bob', 'nobody', self.user]))
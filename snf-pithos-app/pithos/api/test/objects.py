@@ -21,6 +21,7 @@ from collections import defaultdict
 from urllib import quote, unquote
 from functools import partial
 from unittest import skipIf
+from mock import patch
 
 from pithos.api.test import (PithosAPITest, pithos_settings,
                              AssertMappingInvariant, AssertUUidInvariant,
@@ -406,6 +407,24 @@ class ObjectGet(PithosAPITest):
             self.assertEquals(fdata, sdata)
             i += 1
 
+    def test_get_with_prefetch(self):
+        cname = self.containers[0]
+        length = random.randint(3, 5) * TEST_BLOCK_SIZE + 100
+        oname, odata = self.upload_object(cname, length=length)[:-1]
+        url = join_urls(self.pithos_path, self.user, cname, oname)
+
+        for prefetch in (0, 1, 3):
+            with patch('pithos.api.util.BACKEND_BLOCK_PREFETCH', prefetch):
+                r = self.get(url)
+                self.assertEqual(r.status_code, 200)
+                self.assertEqual("".join(r.streaming_content), odata)
+
+                offset = TEST_BLOCK_SIZE / 2
+                r = self.get(url, HTTP_RANGE='bytes=%s-' % offset)
+                self.assertEqual(r.status_code, 206)
+                self.assertEqual("".join(r.streaming_content),
+                                 odata[offset:])
+
     def test_multiple_range_not_satisfiable(self):
         # perform get with multiple range
         cname = self.containers[0]
@@ -700,6 +719,21 @@ class ObjectPut(PithosAPITest):
         self.assertEqual(r.status_code, 200)
         self.assertEqual("".join(r.streaming_content), data)
 
+    def test_upload_block_window(self):
+        cname = self.container
+        data = get_random_data(random.randint(3, 5) * TEST_BLOCK_SIZE + 100)
+        for window in (0, 1, 3):
+            oname = get_random_name()
+            url = join_urls(self.pithos_path, self.user, cname, oname)
+            with patch('pithos.api.util.BACKEND_BLOCK_UPLOAD_WINDOW', window):
+                r = self.put(url, data=data, HTTP_ETAG=md5_hash(data))
+            self.assertEqual(r.status_code, 201)
+
+            info = self.get_object_info(cname, oname)
+            self.assertEqual(info['x-object-hash'], merkle(data))
+            r = self.get(url)
+            self.assertEqual("".join(r.streaming_content), data)
+
     def test_upload_limit_metadata(self):
         cname = self.container
         oname = get_random_name()
@@ -20,10 +20,12 @@ from urlparse import urlunsplit, urlsplit, parse_qsl
 
 from django.http import (StreamingHttpResponse, Http404, HttpResponseRedirect,
                          HttpResponseNotAllowed)
-from django.template.loader import render_to_string
+from django.template import Context
+from django.template.loader import render_to_string, get_template
 import json
 from django.utils.http import http_date, parse_etags, urlunquote, urlquote
 from django.utils.encoding import smart_unicode, smart_str
+from django.utils.html import escape
 smart_unicode_ = partial(smart_unicode, strings_only=True)
 smart_str_ = partial(smart_str, strings_only=True)
 
@@ -46,16 +48,30 @@ from pithos.api.settings import (BACKEND_DB_MODULE, BACKEND_DB_CONNECTION,
                                  BACKEND_VERSIONING, BACKEND_FREE_VERSIONING,
                                  BACKEND_POOL_ENABLED, BACKEND_POOL_SIZE,
                                  BACKEND_BLOCK_SIZE, BACKEND_HASH_ALGORITHM,
+                                 BACKEND_BLOCK_PREFETCH,
+                                 BACKEND_BLOCK_PREFETCH_WORKERS,
+                                 BACKEND_BLOCK_CACHE_SIZE,
+                                 BACKEND_BLOCK_CACHE_PATH,
+                                 BACKEND_BLOCK_UPLOAD_WINDOW,
+                                 BACKEND_BLOCK_UPLOAD_WORKERS,
+                                 BACKEND_MERKLE_CACHE_SIZE,
+                                 BACKEND_ASYNC_COMMISSIONS,
+                                 BACKEND_COMMISSION_BATCH_SIZE,
+                                 BACKEND_ACL_CACHE_SIZE,
                                  BACKEND_ARCHIPELAGO_CONF,
                                  BACKEND_XSEG_POOL_SIZE,
                                  BACKEND_MAP_CHECK_INTERVAL,
                                  BACKEND_MAPFILE_PREFIX,
-                                 TRANSLATE_UUIDS,
+                                 TRANSLATE_UUIDS, USER_CATALOG_CACHE_TTL,
+                                 USER_CATALOG_CACHE_NEGATIVE_TTL,
+                                 USER_CATALOG_CACHE_SIZE,
                                  PUBLIC_URL_SECURITY, PUBLIC_URL_ALPHABET,
-                                 BASE_HOST, UPDATE_MD5, VIEW_PREFIX,
+                                 BASE_HOST, UPDATE_MD5, UPDATE_MD5_ASYNC,
+                                 UPDATE_MD5_WORKERS, VIEW_PREFIX,
                                  OAUTH2_CLIENT_CREDENTIALS, UNSAFE_DOMAIN,
                                  RESOURCE_MAX_METADATA, ACC_MAX_GROUPS,
-                                 ACC_MAX_GROUP_MEMBERS)
+                                 ACC_MAX_GROUP_MEMBERS,
+                                 API_LIST_STREAM_THRESHOLD)
 
 from pithos.backends import connect_backend
 from pithos.backends.exceptions import (NotAllowedError, QuotaError,
@@ -68,13 +84,17 @@ from pithos.backends.exceptions import (NotAllowedError, QuotaError,
 from synnefo.lib import join_urls
 
 from astakosclient import AstakosClient
-from astakosclient.errors import NoUserName, NoUUID, AstakosClientException
+from astakosclient.errors import NoUUID, AstakosClientException
 
 import logging
 import re
 import hashlib
 import uuid
 import decimal
+import threading
+from time import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 logger = logging.getLogger(__name__)
 
@@ -305,13 +325,75 @@ def is_uuid(str):
 # USER CATALOG utilities #
 ##########################
 
-def retrieve_displayname(token, uuid, fail_silently=True):
+class DisplaynameCache(object):
+    """A thread-safe cache of the displaynames of uuids.
+
+    Displaynames are kept for 'ttl' seconds and uuids without a displayname
+    for 'negative_ttl' seconds. At most 'size' uuids are kept, evicting the
+    least recently added ones.
+    """
+
+    def __init__(self, ttl, negative_ttl, size):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, uuids):
+        """Return the cached catalog of the uuids and the uuids not cached.
+
+        Unknown uuids are mapped to None in the catalog.
+        """
+
+        catalog = {}
+        missing = []
+        now = time()
+        with self.lock:
+            for uuid in uuids:
+                entry = self.entries.get(uuid)
+                if entry is None or entry[1] < now:
+                    missing.append(uuid)
+                else:
+                    catalog[uuid] = entry[0]
+        return catalog, missing
+
+    def put_many(self, uuids, catalog):
+        """Cache the catalog of the given uuids."""
+
+        now = time()
+        with self.lock:
+            for uuid in uuids:
+                displayname = catalog.get(uuid)
+                ttl = self.ttl if displayname is not None else \
+                    self.negative_ttl
+                self.entries.pop(uuid, None)
+                self.entries[uuid] = (displayname, now + ttl)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+_displayname_cache = DisplaynameCache(USER_CATALOG_CACHE_TTL,
+                                      USER_CATALOG_CACHE_NEGATIVE_TTL,
+                                      USER_CATALOG_CACHE_SIZE)
+
+
+def _get_usernames(token, uuids):
+    if SERVICE_TOKEN:
+        astakos = AstakosClient(SERVICE_TOKEN, ASTAKOS_AUTH_URL,
+                                retry=2, use_pool=True,
+                                logger=logger)
+        return astakos.service_get_usernames(uuids) or {}
     astakos = AstakosClient(token, ASTAKOS_AUTH_URL,
                             retry=2, use_pool=True,
                             logger=logger)
-    try:
-        displayname = astakos.get_username(uuid)
-    except NoUserName:
+    return astakos.get_usernames(uuids) or {}
+
+
+def retrieve_displayname(token, uuid, fail_silently=True):
+    displayname = retrieve_displaynames(token, [uuid], return_dict=True).get(
+        uuid)
+    if displayname is None:
         if not fail_silently:
             raise ItemNotExists(uuid)
         else:
@@ -321,10 +403,21 @@ def retrieve_displayname(token, uuid, fail_silently=True):
 
 
 def retrieve_displaynames(token, uuids, return_dict=False, fail_silently=True):
-    astakos = AstakosClient(token, ASTAKOS_AUTH_URL,
-                            retry=2, use_pool=True,
-                            logger=logger)
-    catalog = astakos.get_usernames(uuids) or {}
+    """Return the displaynames of the uuids.
+
+    The displaynames not found in the cache of the process are retrieved
+    from Astakos with a single request.
+    """
+
+    if USER_CATALOG_CACHE_TTL > 0:
+        catalog, missing = _displayname_cache.get_many(set(uuids))
+        if missing:
+            fetched = _get_usernames(token, missing)
+            _displayname_cache.put_many(missing, fetched)
+            catalog.update(fetched)
+        catalog = dict((k, v) for k, v in catalog.iteritems() if v is not None)
+    else:
+        catalog = _get_usernames(token, list(set(uuids))) if uuids else {}
     missing = list(set(uuids) - set(catalog))
     if missing and not fail_silently:
         raise ItemNotExists('Unknown displaynames: %s' %
@@ -332,6 +425,62 @@ def retrieve_displaynames(token, uuids, return_dict=False, fail_silently=True):
     return catalog if return_dict else [catalog.get(i) for i in uuids]
 
 
+class DisplaynameResolver(object):
+    """Translate the uuids of a response to displaynames.
+
+    The uuids are first collected with add() or add_holders() and then
+    retrieved all at once by resolve(), instead of once per object.
+    """
+
+    def __init__(self, token):
+        self.token = token
+        self.catalog = {}
+        self.pending = set()
+
+    def add(self, uuids):
+        self.pending.update(u for u in uuids if u not in self.catalog)
+
+    def add_holders(self, holders):
+        """Add the accounts of permission holders (see get_sharing)."""
+
+        self.add(h.split(':', 1)[0] for h in holders if h != '*')
+
+    def resolve(self):
+        if not self.pending:
+            return
+        uuids = list(self.pending)
+        self.pending = set()
+        catalog = retrieve_displaynames(self.token, uuids, return_dict=True)
+        for uuid in uuids:
+            self.catalog[uuid] = catalog.get(uuid)
+
+    def get(self, uuid):
+        """Return the displayname of the uuid or None if it is unknown."""
+
+        if uuid not in self.catalog:
+            self.add([uuid])
+            self.resolve()
+        return self.catalog[uuid]
+
+    def get_holder(self, holder):
+        """Return the permission holder with the account translated."""
+
+        if holder == '*':
+            return holder
+        account, sep, group = holder.partition(':')
+        return (self.get(account) or account) + sep + group
+
+
+def get_displayname_resolver(request):
+    """Return the DisplaynameResolver of the request."""
+
+    resolver = getattr(request, 'displaynames', None)
+    if resolver is None:
+        resolver = request.displaynames = DisplaynameResolver(
+            getattr(request, 'token', None))
+    return resolver
+
+
 def retrieve_uuid(token, displayname):
     if is_uuid(displayname):
         return displayname
@@ -392,12 +541,13 @@ def update_sharing_meta(request, permissions, v_account,
 
     # replace uuid with displayname
     if TRANSLATE_UUIDS:
-        perms['read'] = [replace_permissions_uuid(
-            getattr(request, 'token', None), x)
-            for x in perms.get('read', [])]
-        perms['write'] = [replace_permissions_uuid(
-            getattr(request, 'token', None), x)
-            for x in perms.get('write', [])]
+        resolver = get_displayname_resolver(request)
+        resolver.add_holders(perms.get('read', []))
+        resolver.add_holders(perms.get('write', []))
+        resolver.resolve()
+        perms = {
+            'read': map(resolver.get_holder, perms.get('read', [])),
+            'write': map(resolver.get_holder, perms.get('write', []))}
 
     ret = []
 
@@ -504,6 +654,14 @@ def copy_or_move_object(request, src_account, src_container, src_name,
         request.backend.update_object_public(
             request.user_uniq, dest_account,
             dest_container, dest_name, public)
+
+    if UPDATE_MD5 and UPDATE_MD5_ASYNC and not move and delimiter is None:
+        meta = request.backend.get_object_meta(
+            request.user_uniq, dest_account, dest_container, dest_name,
+            'pithos', version_id, include_user_defined=False)
+        if not meta['checksum']:
+            schedule_object_md5(request, dest_account, dest_container,
+                                dest_name, version_id)
     return version_id
 
 
@@ -702,28 +860,58 @@ def raw_input_socket(request):
 MAX_UPLOAD_SIZE = 5 * (1024 * 1024 * 1024)  # 5GB
 
 
+def _read_into(sock, buf, length):
+    """Fill buf (a memoryview) with up to length bytes read from sock.
+
+    Return the number of bytes read, which is less than length only if the
+    input ended.
+    """
+
+    readinto = getattr(sock, 'readinto', None)
+    n = 0
+    while n < length:
+        if readinto is not None:
+            r = readinto(buf[n:length])
+        else:
+            data = sock.read(length - n)
+            r = len(data)
+            buf[n:n + r] = data
+        if not r:
+            break
+        n += r
+    return n
+
+
 def socket_read_iterator(request, length=0, blocksize=4096):
     """Return maximum of blocksize data read from the socket in each iteration
 
     Read up to 'length'. If 'length' is negative, will attempt a chunked read.
     The maximum ammount of data read is controlled by MAX_UPLOAD_SIZE.
+    Data are read into a preallocated buffer of blocksize bytes, so that
+    every chunk returned is a full block, except for the last one.
     """
 
     sock = raw_input_socket(request)
+    buf = memoryview(bytearray(blocksize))
     if length < 0:  # Chunked transfers
         # Small version (server does the dechunking).
         if (request.environ.get('mod_wsgi.input_chunked', None)
                 or request.META['SERVER_SOFTWARE'].startswith('gunicorn')):
-            while length < MAX_UPLOAD_SIZE:
-                data = sock.read(blocksize)
-                if data == '':
+            total = 0
+            while total < MAX_UPLOAD_SIZE:
+                n = _read_into(sock, buf, blocksize)
+                if n == 0:
+                    return
+                total += n
+                yield buf[:n].tobytes()
+                if n < blocksize:
                     return
-                yield data
             raise faults.BadRequest('Maximum size is reached')
 
         # Long version (do the dechunking).
-        data = ''
-        while length < MAX_UPLOAD_SIZE:
+        total = 0
+        filled = 0
+        while total < MAX_UPLOAD_SIZE:
             # Get chunk size.
             if hasattr(sock, 'readline'):
                 chunk_length = sock.readline()
@@ -742,31 +930,79 @@ def socket_read_iterator(request, length=0, blocksize=4096):
                 raise faults.BadRequest('Bad chunk size')
             # Check if done.
             if chunk_length == 0:
-                if len(data) > 0:
-                    yield data
+                if filled > 0:
+                    yield buf[:filled].tobytes()
                 return
             # Get the actual data.
             while chunk_length > 0:
-                chunk = sock.read(min(chunk_length, blocksize))
-                chunk_length -= len(chunk)
-                if length > 0:
-                    length += len(chunk)
-                data += chunk
-                if len(data) >= blocksize:
-                    ret = data[:blocksize]
-                    data = data[blocksize:]
-                    yield ret
+                n = _read_into(sock, buf[filled:],
+                               min(chunk_length, blocksize - filled))
+                if n == 0:
+                    raise faults.BadRequest('Incomplete chunk')
+                chunk_length -= n
+                total += n
+                filled += n
+                if filled == blocksize:
+                    yield buf.tobytes()
+                    filled = 0
             sock.read(2)  # CRLF
         raise faults.BadRequest('Maximum size is reached')
     else:
         if length > MAX_UPLOAD_SIZE:
             raise faults.BadRequest('Maximum size is reached')
         while length > 0:
-            data = sock.read(min(length, blocksize))
-            if not data:
+            wanted = min(length, blocksize)
+            n = _read_into(sock, buf, wanted)
+            if n < wanted:
                 raise faults.BadRequest()
-            length -= len(data)
-            yield data
+            length -= n
+            yield buf[:n].tobytes()
+
+
+_block_upload_pool = None
+
+
+def get_block_upload_pool():
+    """Return the process-wide thread pool storing uploaded blocks."""
+
+    global _block_upload_pool
+    if _block_upload_pool is None:
+        _block_upload_pool = ThreadPool(BACKEND_BLOCK_UPLOAD_WORKERS)
+    return _block_upload_pool
+
+
+class BlockUploader(object):
+    """Store blocks in the backend in the background.
+
+    Hashing and storing a block runs on a worker thread, while the caller
+    goes on reading the next block from the client. At most 'window'
+    blocks are kept in flight. Use hashmap() to get the hashes of the
+    stored blocks, in the order they were given.
+    """
+
+    def __init__(self, backend, window=None, pool=None):
+        self.backend = backend
+        self.window = BACKEND_BLOCK_UPLOAD_WINDOW if window is None \
+            else window
+        self.pool = pool or get_block_upload_pool()
+        self.hashes = []
+        self.pending = []
+
+    def put(self, data):
+        if self.window <= 0:
+            self.hashes.append(self.backend.put_block(data))
+            return
+        self.pending.append(self.pool.apply_async(self.backend.put_block,
+                                                  (data,)))
+        while len(self.pending) > self.window:
+            self.hashes.append(self.pending.pop(0).get())
+
+    def hashmap(self):
+        """Wait for the pending blocks and return the list of hashes."""
+
+        while self.pending:
+            self.hashes.append(self.pending.pop(0).get())
+        return self.hashes
 
 
 class SaveToBackendHandler(FileUploadHandler):
@@ -777,43 +1013,109 @@ class SaveToBackendHandler(FileUploadHandler):
         self.backend = request.backend
 
     def put_data(self, length):
-        if len(self.data) >= length:
-            block = self.data[:length]
-            self.file.hashmap.append(self.backend.put_block(block))
+        if self.filled >= length:
+            block = self.buf[:length].tobytes()
+            self.uploader.put(block)
             self.checksum_compute.update(block)
-            self.data = self.data[length:]
+            self.buf[:self.filled - length] = self.buf[length:self.filled]
+            self.filled -= length
 
     def new_file(self, field_name, file_name, content_type,
                  content_length, charset=None):
         self.checksum_compute = NoChecksum() if not UPDATE_MD5 else Checksum()
-        self.data = ''
+        self.buf = memoryview(bytearray(self.backend.block_size))
+        self.filled = 0
+        self.uploader = BlockUploader(self.backend)
         self.file = UploadedFile(
             name=file_name, content_type=content_type, charset=charset)
         self.file.size = 0
         self.file.hashmap = []
 
     def receive_data_chunk(self, raw_data, start):
-        self.data += raw_data
+        block_size = self.backend.block_size
         self.file.size += len(raw_data)
-        self.put_data(self.request.backend.block_size)
+        offset = 0
+        while offset < len(raw_data):
+            n = min(len(raw_data) - offset, block_size - self.filled)
+            self.buf[self.filled:self.filled + n] = \
+                raw_data[offset:offset + n]
+            self.filled += n
+            offset += n
+            self.put_data(block_size)
         return None
 
     def file_complete(self, file_size):
-        l = len(self.data)
+        l = self.filled
         if l > 0:
             self.put_data(l)
+        self.file.hashmap = self.uploader.hashmap()
         self.file.etag = self.checksum_compute.hexdigest()
         return self.file
 
 
+_block_prefetch_pool = None
+
+
+def get_block_prefetch_pool():
+    """Return the process-wide thread pool used for block read-ahead.
+
+    The pool is created lazily, so that each forked worker gets its own.
+    """
+
+    global _block_prefetch_pool
+    if _block_prefetch_pool is None:
+        _block_prefetch_pool = ThreadPool(BACKEND_BLOCK_PREFETCH_WORKERS)
+    return _block_prefetch_pool
+
+
+class BlockPrefetcher(object):
+    """Fetch blocks from the backend ahead of the one being consumed.
+
+    At most 'window' blocks are requested in advance, so memory usage is
+    bounded by (window + 1) blocks per response.
+    """
+
+    def __init__(self, backend, window, pool=None):
+        self.backend = backend
+        self.window = window
+        self.pool = pool or get_block_prefetch_pool()
+        self.pending = {}
+
+    def get(self, block_hash, following=()):
+        """Return the block with the given hash.
+
+        Start fetching up to 'window' of the hashes in 'following',
+        which are the hashes that are going to be requested next.
+        Raises ItemNotExists if the block does not exist.
+        """
+
+        ahead = [h for h in following[:self.window] if h != block_hash]
+        for h in ahead:
+            if h not in self.pending:
+                self.pending[h] = self.pool.apply_async(
+                    self.backend.get_block, (h,))
+        result = self.pending.pop(block_hash, None)
+        # Forget blocks that are no longer ahead of the current position
+        # (e.g. when moving to another range).
+        for h in self.pending.keys():
+            if h not in ahead:
+                del self.pending[h]
+        if result is None:
+            return self.backend.get_block(block_hash)
+        return result.get()
+
+
 class ObjectWrapper(object):
     """Return the object's data block-per-block in each iteration.
 
     Read from the object using the offset and length provided
-    in each entry of the range list.
+    in each entry of the range list. If 'prefetch' is positive, up to that
+    many of the following blocks of the range are fetched in the background
+    while the current one is being sent.
     """
 
-    def __init__(self, backend, ranges, sizes, hashmaps, boundary, meta):
+    def __init__(self, backend, ranges, sizes, hashmaps, boundary, meta,
+                 prefetch=0):
         self.backend = backend
         self.ranges = ranges
         self.sizes = sizes
@@ -826,10 +1128,24 @@ class ObjectWrapper(object):
         self.block_index = 0
         self.block_hash = -1
         self.block = ''
+        self.prefetcher = None
+        if prefetch > 0:
+            self.prefetcher = BlockPrefetcher(backend, prefetch)
 
         self.range_index = -1
         self.offset, self.length = self.ranges[0]
 
+    def _get_block(self, hashmap, block_index):
+        block_hash = hashmap[block_index]
+        if self.prefetcher is None:
+            return self.backend.get_block(block_hash)
+        # Only read ahead the blocks the current range still needs.
+        bs = self.backend.block_size
+        bo = self.offset % bs
+        last = block_index + (bo + self.length - 1) / bs
+        following = hashmap[block_index + 1:last + 1]
+        return self.prefetcher.get(block_hash, following)
+
     def __iter__(self):
         return self
 
@@ -849,7 +1165,8 @@ class ObjectWrapper(object):
                 self.block_hash = self.hashmaps[
                     self.file_index][self.block_index]
                 try:
-                    self.block = self.backend.get_block(self.block_hash)
+                    self.block = self._get_block(
+                        self.hashmaps[self.file_index], self.block_index)
                 except ItemNotExists:
                     raise faults.ItemNotFound('Block does not exist')
 
@@ -860,7 +1177,11 @@ class ObjectWrapper(object):
                     self.sizes[self.file_index] % self.backend.block_size):
                 bs = self.sizes[self.file_index] % self.backend.block_size
             bl = min(self.length, bs - bo)
-            data = self.block[bo:bo + bl]
+            if bo == 0 and bl == len(self.block):
+                # Send whole blocks as they are, without copying them.
+                data = self.block
+            else:
+                data = self.block[bo:bo + bl]
             self.offset += bl
             self.length -= bl
             return data
@@ -937,7 +1258,7 @@ def object_data_response(request, sizes, hashmaps, meta, public=False):
     else:
         boundary = ''
     wrapper = ObjectWrapper(request.backend, ranges, sizes, hashmaps,
-                            boundary, meta)
+                            boundary, meta, prefetch=BACKEND_BLOCK_PREFETCH)
     response = StreamingHttpResponse(wrapper, status=ret)
     put_object_headers(
         response, meta, restricted=public,
@@ -977,18 +1298,79 @@ def put_object_block(request, hashmap, data, offset, is_snapshot):
 def hashmap_md5(backend, hashmap, size):
     """Produce the MD5 sum from the data in the hashmap."""
 
-    # TODO: Search backend for the MD5 of another object
-    #       with the same hashmap and size...
     md5 = hashlib.md5()
     bs = backend.block_size
     for bi, hash in enumerate(hashmap):
         data = backend.get_block(hash)  # Blocks come in padded.
         if bi == len(hashmap) - 1:
-            data = data[:size % bs]
+            data = data[:size - bi * bs]
         md5.update(data)
     return md5.hexdigest().lower()
 
 
+_md5_pool = None
+
+
+def get_md5_pool():
+    """Return the process-wide thread pool computing checksums."""
+
+    global _md5_pool
+    if _md5_pool is None:
+        _md5_pool = ThreadPool(UPDATE_MD5_WORKERS)
+    return _md5_pool
+
+
+def _update_object_md5(user, account, container, name, version):
+    backend = get_backend()
+    try:
+        size, hashmap = backend.get_object_hashmap(user, account, container,
+                                                   name, version)
+        checksum = hashmap_md5(backend, hashmap, size)
+        backend.update_object_checksum(user, account, container, name,
+                                       version, checksum)
+    except:
+        logger.exception("Failed to compute the checksum of %s/%s/%s (%s)",
+                         account, container, name, version)
+    finally:
+        backend.close()
+
+
+def schedule_object_md5(request, account, container, name, version):
+    """Compute the checksum of an object version in the background.
+
+    The computation starts once the request's transaction is committed.
+    """
+
+    request.on_commit.append(
+        lambda: get_md5_pool().apply_async(
+            _update_object_md5,
+            (request.user_uniq, account, container, name, version)))
+
+
+def update_object_md5(request, account, container, name, version, hash,
+                      hashmap, size):
+    """Set the checksum of an object version created from a hashmap.
+
+    The checksum of other objects with the same content is reused, if there
+    is one. Otherwise, the blocks are read and the checksum is computed,
+    in the background if UPDATE_MD5_ASYNC is set. Return the checksum,
+    or '' if it is not known yet.
+    """
+
+    backend = request.backend
+    checksum = backend.lookup_object_checksum(hash, size)
+    if checksum:
+        # The backend has already set it, when creating the version.
+        return checksum
+    if UPDATE_MD5_ASYNC:
+        schedule_object_md5(request, account, container, name, version)
+        return ''
+    checksum = hashmap_md5(backend, hashmap, size)
+    backend.update_object_checksum(request.user_uniq, account, container,
+                                   name, version, checksum)
+    return checksum
+
+
 def simple_list_response(request, l):
     if request.serialization == 'text':
         return '\n'.join(l) + '\n'
@@ -1022,7 +1404,13 @@ BACKEND_KWARGS = dict(
     mapfile_prefix=BACKEND_MAPFILE_PREFIX,
     resource_max_metadata=RESOURCE_MAX_METADATA,
     acc_max_groups=ACC_MAX_GROUPS,
-    acc_max_group_members=ACC_MAX_GROUP_MEMBERS)
+    acc_max_group_members=ACC_MAX_GROUP_MEMBERS,
+    block_cache_size=BACKEND_BLOCK_CACHE_SIZE,
+    block_cache_path=BACKEND_BLOCK_CACHE_PATH,
+    merkle_cache_size=BACKEND_MERKLE_CACHE_SIZE,
+    async_commissions=BACKEND_ASYNC_COMMISSIONS,
+    commission_batch_size=BACKEND_COMMISSION_BATCH_SIZE,
+    acl_cache_size=BACKEND_ACL_CACHE_SIZE)
 
 _pithos_backend_pool = PithosBackendPool(size=BACKEND_POOL_SIZE,
                                          **BACKEND_KWARGS)
@@ -1058,6 +1446,72 @@ def update_request_headers(request):
             raise faults.BadRequest('Bad character in headers.')
 
 
+# The number of items serialized in each chunk of a streamed listing.
+LIST_STREAM_CHUNK_SIZE = 100
+
+
+def _join_chunks(strings, size=LIST_STREAM_CHUNK_SIZE):
+    chunk = []
+    for s in strings:
+        chunk.append(s)
+        if len(chunk) >= size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _json_listing(items):
+    yield '['
+    for i, item in enumerate(items):
+        data = json.dumps(item, default=json_encode_decimal)
+        yield data if i == 0 else ', ' + data
+    yield ']'
+
+
+def _xml_listing(items, root, root_name, item):
+    template = get_template('%s.xml' % item)
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<%s name="%s">\n' % (root, escape(root_name)))
+    for x in items:
+        yield template.render(Context({item: x}))
+    yield '</%s>\n' % root
+
+
+def listing_response(request, response, items, count, root, root_name, item):
+    """Return response with the JSON or XML serialization of a listing.
+
+    The listing has count items, each a dict. In XML they are rendered with
+    the item template (eg. object.xml) under a root element named root_name
+    (eg. <container name="...">), as in the template named after the plural
+    of item.
+
+    Listings of more than API_LIST_STREAM_THRESHOLD items are serialized
+    lazily, one item at a time, into a StreamingHttpResponse with the
+    headers of response. The items may then be a generator, as long as it
+    does not use the backend, which is closed before the response is sent.
+    """
+
+    if count <= API_LIST_STREAM_THRESHOLD:
+        if request.serialization == 'xml':
+            response.content = render_to_string(
+                '%ss.xml' % item, {root: root_name, item + 's': list(items)})
+        else:
+            response.content = json.dumps(list(items),
+                                          default=json_encode_decimal)
+        response.status_code = 200
+        return response
+
+    if request.serialization == 'xml':
+        data = _xml_listing(items, root, root_name, item)
+    else:
+        data = _json_listing(items)
+    streaming = StreamingHttpResponse(_join_chunks(data), status=200)
+    for header, value in response.items():
+        streaming[header] = value
+    return streaming
+
+
 def update_response_headers(request, response):
     # URL-encode unicode in headers.
     meta = response.items()
@@ -1089,6 +1543,8 @@ def api_method(http_method=None, token_required=True, user_required=True,
                 raise faults.BadRequest('Object name too large.')
 
             success_status = False
+            # Callables to run once the backend transaction is committed
+            request.on_commit = []
             try:
                 # Add a PithosBackend as attribute of the request object
                 request.backend = get_backend()
@@ -1122,6 +1578,9 @@ def api_method(http_method=None, token_required=True, user_required=True,
                 if getattr(request, "backend", None) is not None:
                     request.backend.post_exec(success_status)
                     request.backend.close()
+                    if success_status:
+                        for f in request.on_commit:
+                            f()
         return wrapper
     return decorator
 
@@ -0,0 +1,157 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cached access of users to the shared paths of accounts.
+
+The permissions of a path (its xfeature) apply to the path and, if the path
+is a folder, to everything under it, unless a deeper path has permissions
+of its own. Deciding whether a user may access an object therefore needs
+every shared path of the account along the path of the object, not only the
+paths shared with the user.
+
+An AccessTrie holds all the shared paths of an account, each labeled with
+the access a given user has to it, directly, through a group or through
+'*'. The tries are kept in a process-wide LRU cache, stamped with the value
+of a counter that is incremented in the database along with every change
+to permissions or groups, so that a trie is only used while no such change
+has been committed since it was loaded.
+"""
+
+import threading
+
+from synnefo.lib.ordereddict import OrderedDict
+
+# The label of shared paths the user has no access to.
+NO_ACCESS = -1
+
+_acl_caches = {}
+_acl_caches_lock = threading.Lock()
+
+
+class _TrieNode(object):
+    __slots__ = ('children', 'exact', 'folder')
+
+    def __init__(self):
+        self.children = {}
+        # The access to the path, and to the path followed by a slash.
+        self.exact = None
+        self.folder = None
+
+
+class AccessTrie(object):
+    """The access of a user to the shared paths of an account.
+
+    Access is either NO_ACCESS or the READ or WRITE constant of the database
+    module, WRITE also implying read access.
+    """
+
+    def __init__(self, grants=()):
+        self.root = _TrieNode()
+        for path, access in grants:
+            self.insert(path, access)
+
+    def insert(self, path, access):
+        node = self.root
+        for part in path.rstrip('/').split('/'):
+            node = node.children.setdefault(part, _TrieNode())
+        if path.endswith('/'):
+            node.folder = access
+        else:
+            node.exact = access
+
+    def inherit(self, path):
+        """Return the shared paths influencing the access to path.
+
+        This is the list of (path, access) for the shared paths among the
+        components of path below the account, deepest first.
+        """
+
+        parts = path.rstrip('/').split('/')
+        node = self.root.children.get(parts[0])
+        found = []
+        for i in xrange(1, len(parts)):
+            if node is None:
+                break
+            node = node.children.get(parts[i])
+            if node is None:
+                break
+            subp = '/'.join(parts[:i + 1])
+            if node.exact is not None:
+                found.append((subp, node.exact))
+            if node.folder is not None and subp != path:
+                found.append((subp + '/', node.folder))
+        found.reverse()
+        return found
+
+
+def user_access(permissions, member, groups, read, write):
+    """Return the access of member to a path with the given permissions.
+
+    Permissions map the read and write keys to lists of members, which may
+    be users, groups in the form 'owner:group' or '*'. Groups are the
+    'owner:group' names of the groups the member belongs to.
+    """
+
+    def granted(members):
+        for m in members:
+            if m == member or m == '*' or m in groups:
+                return True
+        return False
+
+    if granted(permissions.get(write, ())):
+        return write
+    if granted(permissions.get(read, ())):
+        return read
+    return NO_ACCESS
+
+
+class AccessTrieCache(object):
+    """A thread-safe LRU cache of AccessTries keyed by (user, account).
+
+    Each trie is stored along with the version of permissions it was
+    loaded at and is only returned for the same version.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.tries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.tries.pop(key, None)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                return None
+            self.tries[key] = entry
+            return entry[1]
+
+    def put(self, key, version, trie):
+        with self.lock:
+            self.tries.pop(key, None)
+            self.tries[key] = (version, trie)
+            while len(self.tries) > self.size:
+                self.tries.popitem(last=False)
+
+
+def get_acl_cache(db_connection, size):
+    """Return the AccessTrieCache of the process for the given database."""
+
+    with _acl_caches_lock:
+        cache = _acl_caches.get(db_connection)
+        if cache is None:
+            cache = _acl_caches[db_connection] = AccessTrieCache(size)
+        return cache
@@ -0,0 +1,158 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark the Merkle engine on objects from 1GB to 1TB.
+
+Leaf hashing throughput is measured on a sample of random blocks, serially
+and on a thread pool, and extrapolated to the object size. The trees are
+built over random block hashes, so no actual data of the object size is
+needed. For every size the script reports the time to compute the top hash
+from scratch with the original list-based algorithm and with MerkleTree,
+and the time to update the top hash after changing one block, either in
+place or by diffing a new hashmap against a cached tree.
+"""
+
+import os
+import sys
+import hashlib
+import argparse
+from time import time
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+from synnefo.lib.merkle import MerkleTree, hash_blocks
+
+UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(s):
+    s = s.strip().upper()
+    if s[-1:] in UNITS:
+        return int(float(s[:-1]) * UNITS[s[-1]])
+    return int(s)
+
+
+def format_size(n):
+    for unit in 'TGMK':
+        if n >= UNITS[unit] and n % UNITS[unit] == 0:
+            return '%d%sB' % (n // UNITS[unit], unit)
+    return '%dB' % n
+
+
+def list_merkle(hashes, blockhash):
+    """The original, list-based top hash computation."""
+
+    def hash_raw(v):
+        h = hashlib.new(blockhash)
+        h.update(v)
+        return h.digest()
+
+    if len(hashes) == 0:
+        return hash_raw('')
+    if len(hashes) == 1:
+        return hashes[0]
+    h = list(hashes)
+    s = 2
+    while s < len(h):
+        s = s * 2
+    h += [('\x00' * len(h[0]))] * (s - len(h))
+    while len(h) > 1:
+        h = [hash_raw(h[x] + h[x + 1]) for x in range(0, len(h), 2)]
+    return h[0]
+
+
+def timed(f, *args):
+    start = time()
+    result = f(*args)
+    return time() - start, result
+
+
+def bench_leaves(block_size, blockhash, sample, workers):
+    nblocks = max(sample // block_size, 1)
+    blocks = [os.urandom(block_size) for _ in xrange(min(nblocks, 16))]
+    stream = lambda: (blocks[i % len(blocks)] for i in xrange(nblocks))
+    serial, _ = timed(lambda: list(hash_blocks(stream(), blockhash)))
+    pool = ThreadPool(workers)
+    try:
+        parallel, _ = timed(
+            lambda: list(hash_blocks(stream(), blockhash, pool=pool)))
+    finally:
+        pool.close()
+    size = nblocks * block_size
+    return size / serial, size / parallel
+
+
+def bench_tree(size, block_size, blockhash):
+    digest_size = hashlib.new(blockhash).digest_size
+    nblocks = max((size + block_size - 1) // block_size, 1)
+    hashes = [os.urandom(digest_size) for _ in xrange(nblocks)]
+
+    t_list, top = timed(list_merkle, hashes, blockhash)
+    t_build, tree = timed(MerkleTree, blockhash, hashes)
+    assert tree.root() == top
+
+    index = nblocks // 2
+    changed = os.urandom(digest_size)
+    t_update, _ = timed(tree.update, index, changed)
+    hashes[index] = changed
+    assert tree.root() == list_merkle(hashes, blockhash)
+
+    hashes[0] = os.urandom(digest_size)
+    cached = tree.copy()
+    t_diff, _ = timed(cached.update_leaves, hashes)
+    return nblocks, t_list, t_build, t_update, t_diff
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Merkle engine used by Pithos")
+    parser.add_argument(
+        '--block-size', type=parse_size, default=4 * UNITS['M'],
+        help="Block size (default: 4M)")
+    parser.add_argument(
+        '--hash-algorithm', default='sha256',
+        help="Block hash algorithm (default: sha256)")
+    parser.add_argument(
+        '--sizes', default='1G,10G,100G,1T',
+        help="Comma-separated object sizes (default: 1G,10G,100G,1T)")
+    parser.add_argument(
+        '--sample', type=parse_size, default=256 * UNITS['M'],
+        help="Data hashed to measure the leaf hashing throughput "
+             "(default: 256M)")
+    parser.add_argument(
+        '--workers', type=int, default=cpu_count(),
+        help="Threads hashing leaves in parallel (default: number of CPUs)")
+    args = parser.parse_args(argv)
+
+    serial, parallel = bench_leaves(args.block_size, args.hash_algorithm,
+                                    args.sample, args.workers)
+    print "Leaf hashing: %.1f MB/s serial, %.1f MB/s with %d threads" % (
+        serial / UNITS['M'], parallel / UNITS['M'], args.workers)
+    print
+
+    fmt = '%8s %9s %12s %12s %12s %12s %12s'
+    print fmt % ('size', 'blocks', 'leaves (s)', 'list (s)', 'build (s)',
+                 'update (ms)', 'diff (ms)')
+    for size in map(parse_size, args.sizes.split(',')):
+        nblocks, t_list, t_build, t_update, t_diff = bench_tree(
+            size, args.block_size, args.hash_algorithm)
+        print fmt % (format_size(size), nblocks,
+                     '%.1f' % (size / parallel), '%.3f' % t_list,
+                     '%.3f' % t_build, '%.3f' % (t_update * 1000),
+                     '%.3f' % (t_diff * 1000))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Block cache shared by the processes of a node.
+
+Blocks are content-addressed and immutable, so a cached block never needs
+to be invalidated. The cache lives in a memory-mapped file (ideally on a
+tmpfs such as /dev/shm), which every worker process maps, and is organized
+as a set-associative cache: each block hash maps to a set of 'ways' slots
+and the least recently used slot of the set is evicted. Sets are locked
+with fcntl byte-range locks, so processes only contend on the same set.
+
+A block is admitted in the cache only the second time it is missed within
+a window of recent misses, so that one-off reads (e.g. a large download)
+do not flush the blocks that are read over and over (e.g. public objects
+and images).
+"""
+
+import os
+import mmap
+import fcntl
+import struct
+import tempfile
+import threading
+from time import time
+from binascii import hexlify
+from collections import OrderedDict
+
+MAGIC = 'SNFBC001'
+PAGE_SIZE = mmap.PAGESIZE
+
+# magic, block size, number of slots, ways
+_HEADER = struct.Struct('<8sIII')
+_COUNTERS = ('hits', 'misses', 'hit_bytes', 'admissions', 'evictions',
+             'admitted_bytes')
+_COUNTERS_STRUCT = struct.Struct('<%dQ' % len(_COUNTERS))
+_COUNTERS_OFFSET = 64
+# block hash (up to 64 bytes, e.g. sha512), block length, last access time
+_SLOT = struct.Struct('<64sId')
+_EMPTY = '\x00' * 64
+
+DEFAULT_WAYS = 8
+# Flush the per-process counters to the shared header every so many lookups.
+COUNTERS_FLUSH_INTERVAL = 128
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_block_cache(path, size, block_size, ways=DEFAULT_WAYS):
+    """Return the BlockCache of the process for the given path.
+
+    Return None if the cache is too small to hold a single set.
+    """
+
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            if size // block_size < ways:
+                return None
+            cache = _caches[path] = BlockCache(path, size, block_size, ways)
+        return cache
+
+
+def _round_up(n, alignment):
+    return (n + alignment - 1) // alignment * alignment
+
+
+class BlockCache(object):
+    """A fixed-size block cache kept in a memory-mapped file."""
+
+    def __init__(self, path, size, block_size, ways=DEFAULT_WAYS):
+        self.path = path
+        self.block_size = block_size
+        self.ways = ways
+        self.nsets = max(size // block_size // ways, 1)
+        self.nslots = self.nsets * ways
+        self.table_offset = PAGE_SIZE
+        self.data_offset = _round_up(
+            self.table_offset + self.nslots * _SLOT.size, PAGE_SIZE)
+        self.file_size = self.data_offset + self.nslots * block_size
+
+        # fcntl locks do not exclude threads of the same process
+        self.lock = threading.Lock()
+        self.doorkeeper = OrderedDict()
+        self.doorkeeper_size = self.nslots * 2
+        self.counters = dict((c, 0) for c in _COUNTERS)
+        self.lookups = 0
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._init_arena()
+            self.mm = mmap.mmap(self.fd, self.file_size, mmap.MAP_SHARED)
+        except:
+            os.close(self.fd)
+            raise
+
+    def _init_arena(self):
+        header = (MAGIC, self.block_size, self.nslots, self.ways)
+        while True:
+            fd = None
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, PAGE_SIZE, 0)
+            try:
+                # Another process may have replaced the file since it was
+                # opened, in which case the lock excludes nobody.
+                if self._is_current():
+                    data = os.read(self.fd, _HEADER.size) if \
+                        os.fstat(self.fd).st_size >= self.file_size else ''
+                    if len(data) == _HEADER.size and \
+                       _HEADER.unpack(data) == header:
+                        return
+                    # New file or different geometry: start from an empty
+                    # cache. Other processes may still map the old file, so
+                    # it must not be truncated under them; build the cache
+                    # in a new file instead.
+                    fd = self._create_arena(header)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, PAGE_SIZE, 0)
+            os.close(self.fd)
+            if fd is not None:
+                self.fd = fd
+                return
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def _is_current(self):
+        """Return whether the open file is the one the path names."""
+
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        fst = os.fstat(self.fd)
+        return (st.st_dev, st.st_ino) == (fst.st_dev, fst.st_ino)
+
+    def _create_arena(self, header):
+        """Create an empty cache file and rename it to the cache path."""
+
+        directory, name = os.path.split(self.path)
+        fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % name,
+                                        dir=directory or '.')
+        try:
+            os.ftruncate(fd, self.file_size)
+            os.write(fd, _HEADER.pack(*header))
+            os.rename(tmp_path, self.path)
+        except:
+            os.close(fd)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return fd
+
+    def _set_of(self, key):
+        return int(hexlify(key[:8]), 16) % self.nsets
+
+    def _lock_set(self, s, op):
+        length = self.ways * _SLOT.size
+        fcntl.lockf(self.fd, op, length,
+                    self.table_offset + s * length)
+
+    def _slot_offset(self, slot):
+        return self.table_offset + slot * _SLOT.size
+
+    def _read_slot(self, slot):
+        return _SLOT.unpack_from(self.mm, self._slot_offset(slot))
+
+    def _find(self, s, key):
+        key = key.ljust(len(_EMPTY), '\x00')
+        for slot in xrange(s * self.ways, (s + 1) * self.ways):
+            h, length, atime = self._read_slot(slot)
+            if h == key:
+                return slot, length
+        return None, 0
+
+    def _count(self, **deltas):
+        for k, v in deltas.iteritems():
+            self.counters[k] += v
+
+    def _maybe_flush_counters(self):
+        self.lookups += 1
+        if self.lookups % COUNTERS_FLUSH_INTERVAL == 0:
+            self._flush_counters()
+
+    def _flush_counters(self):
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, PAGE_SIZE, 0)
+        try:
+            shared = _COUNTERS_STRUCT.unpack_from(self.mm, _COUNTERS_OFFSET)
+            shared = [v + self.counters[c] for c, v in zip(_COUNTERS, shared)]
+            _COUNTERS_STRUCT.pack_into(self.mm, _COUNTERS_OFFSET, *shared)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, PAGE_SIZE, 0)
+        self.counters = dict((c, 0) for c in _COUNTERS)
+        return dict(zip(_COUNTERS, shared))
+
+    def get(self, key):
+        """Return the cached block for the binary hash key or None."""
+
+        s = self._set_of(key)
+        with self.lock:
+            self._lock_set(s, fcntl.LOCK_EX)
+            try:
+                slot, length = self._find(s, key)
+                if slot is None:
+                    self._count(misses=1)
+                    return None
+                _SLOT.pack_into(self.mm, self._slot_offset(slot),
+                                key, length, time())
+                offset = self.data_offset + slot * self.block_size
+                block = self.mm[offset:offset + length]
+            finally:
+                self._lock_set(s, fcntl.LOCK_UN)
+                self._maybe_flush_counters()
+            self._count(hits=1, hit_bytes=length)
+            return block
+
+    def put(self, key, block):
+        """Offer a block to the cache.
+
+        The block is only stored if it was recently missed before.
+        Return True if the block was stored.
+        """
+
+        if len(block) > self.block_size or len(key) > len(_EMPTY):
+            return False
+        with self.lock:
+            if self.doorkeeper.pop(key, None) is None:
+                self.doorkeeper[key] = True
+                if len(self.doorkeeper) > self.doorkeeper_size:
+                    self.doorkeeper.popitem(last=False)
+                return False
+
+            s = self._set_of(key)
+            self._lock_set(s, fcntl.LOCK_EX)
+            try:
+                slot, _ = self._find(s, key)
+                if slot is not None:
+                    return False
+                victim, victim_atime = None, None
+                for slot in xrange(s * self.ways, (s + 1) * self.ways):
+                    h, length, atime = self._read_slot(slot)
+                    if h == _EMPTY:
+                        victim, victim_atime = slot, None
+                        break
+                    if victim is None or atime < victim_atime:
+                        victim, victim_atime = slot, atime
+                if victim_atime is not None:
+                    self._count(evictions=1)
+                # Invalidate the slot while its data are being replaced.
+                _SLOT.pack_into(self.mm, self._slot_offset(victim),
+                                _EMPTY, 0, 0)
+                offset = self.data_offset + victim * self.block_size
+                self.mm[offset:offset + len(block)] = block
+                _SLOT.pack_into(self.mm, self._slot_offset(victim),
+                                key, len(block), time())
+            finally:
+                self._lock_set(s, fcntl.LOCK_UN)
+            self._count(admissions=1, admitted_bytes=len(block))
+            return True
+
+    def stats(self):
+        """Return the cache counters aggregated over all processes.
+
+        Besides the raw counters, the result includes the cache capacity
+        in bytes and the hit ratio.
+        """
+
+        with self.lock:
+            stats = self._flush_counters()
+        lookups = stats['hits'] + stats['misses']
+        stats['capacity'] = self.nslots * self.block_size
+        stats['hit_ratio'] = float(stats['hits']) / lookups if lookups else 0
+        return stats
+
+    def close(self):
+        with self.lock:
+            self._flush_counters()
+            self.mm.close()
+            os.close(self.fd)
@@ -0,0 +1,135 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Resolution of quota commissions in the background.
+
+Instead of resolving the commissions issued by a request before returning
+to the client, the backend registers their serials in the qh_serials table
+in the same transaction as the changes they account for and hands them to
+the CommissionResolver of the process. Its worker thread drains the queued
+serials in batches and resolves each batch with a single call to Astakos,
+removing the accepted serials from qh_serials afterwards.
+
+If Astakos cannot be reached or the process dies before a batch is
+resolved, the commissions are left pending in Astakos, while the serials of
+the accepted ones stay registered in qh_serials. This is exactly the state
+'snf-manage reconcile-commissions-pithos --fix' recovers from: it accepts
+the pending commissions that are registered and rejects the rest.
+"""
+
+import logging
+import threading
+from Queue import Queue, Empty
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+_resolvers = {}
+_resolvers_lock = threading.Lock()
+
+
+def get_commission_resolver(db_module, db_connection, astakosclient,
+                            batch_size=DEFAULT_BATCH_SIZE):
+    """Return the CommissionResolver of the process for the given database.
+    """
+
+    key = (db_module.__name__, db_connection)
+    with _resolvers_lock:
+        resolver = _resolvers.get(key)
+        if resolver is None:
+            resolver = _resolvers[key] = CommissionResolver(
+                db_module, db_connection, astakosclient, batch_size)
+        return resolver
+
+
+class CommissionResolver(object):
+    """Resolve quota commissions in batches, in a background thread."""
+
+    def __init__(self, db_module, db_connection, astakosclient,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self.astakosclient = astakosclient
+        self.batch_size = batch_size
+        self.wrapper = db_module.DBWrapper(db_connection)
+        self.commission_serials = db_module.QuotaholderSerial(
+            wrapper=self.wrapper)
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self._run,
+                                       name='pithos-commissions')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def accept(self, serials):
+        """Queue serials, already registered in qh_serials, for acceptance.
+        """
+
+        if serials:
+            self.queue.put((list(serials), []))
+
+    def reject(self, serials):
+        """Queue serials for rejection."""
+
+        if serials:
+            self.queue.put(([], list(serials)))
+
+    def flush(self):
+        """Wait until all the queued serials have been resolved."""
+
+        self.queue.join()
+
+    def _next_batch(self):
+        accept, reject = self.queue.get()
+        accept, reject = list(accept), list(reject)
+        taken = 1
+        while len(accept) + len(reject) < self.batch_size:
+            try:
+                a, r = self.queue.get_nowait()
+            except Empty:
+                break
+            accept.extend(a)
+            reject.extend(r)
+            taken += 1
+        return accept, reject, taken
+
+    def _run(self):
+        while True:
+            accept, reject, taken = self._next_batch()
+            try:
+                self.resolve(accept, reject)
+            except Exception:
+                logger.exception("Failed to resolve commissions %s/%s; "
+                                 "they are left to "
+                                 "reconcile-commissions-pithos",
+                                 accept, reject)
+            finally:
+                for _ in xrange(taken):
+                    self.queue.task_done()
+
+    def resolve(self, accept, reject):
+        """Resolve the commissions and unregister the accepted serials."""
+
+        r = self.astakosclient.resolve_commissions(
+            accept_serials=accept, reject_serials=reject)
+        accepted = r.get('accepted', [])
+        if not accepted:
+            return r
+        self.wrapper.execute()
+        try:
+            self.commission_serials.delete_many(accepted)
+        except:
+            self.wrapper.rollback()
+            raise
+        self.wrapper.commit()
+        return r
@@ -31,6 +31,45 @@ from pithos.workers import (
 
 monkey.patch_Request()
 
+# Maximum number of xseg requests kept in flight by the batched methods.
+DEFAULT_QUEUE_DEPTH = 32
+
+
+def _windows(items, size):
+    """Split items in consecutive lists of at most size elements."""
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _submit(req):
+    """Submit an xseg request, putting it back if the submission fails."""
+    try:
+        req.submit()
+    except Exception:
+        req.put()
+        raise
+    return req
+
+
+def _put_requests(reqs, reaped):
+    """Put back a list of submitted xseg requests.
+
+       The first reaped requests have completed. The rest may still be in
+       flight, e.g. after an early return or an error, and are waited on
+       before being put back, since putting back a request in flight
+       corrupts the request pool. A request that cannot be waited on is
+       left out of the pool.
+    """
+    for i, req in enumerate(reqs):
+        if req is None:
+            continue
+        if i >= reaped:
+            try:
+                req.wait()
+            except Exception:
+                continue
+        req.put()
+
 
 class ArchipelagoBlocker(object):
     """Blocker.
@@ -60,6 +99,8 @@ class ArchipelagoBlocker(object):
         self.hashtype = hashtype
         self.hashlen = len(emptyhash)
         self.emptyhash = emptyhash
+        self.queue_depth = int(params.get('queue_depth',
+                                          DEFAULT_QUEUE_DEPTH))
 
     def _pad(self, block):
         return block + ('\x00' * (self.blocksize - len(block)))
@@ -69,18 +110,36 @@ class ArchipelagoBlocker(object):
         return ArchipelagoObject(name, self.ioctx_pool, self.dst_port, create)
 
     def _check_rear_block(self, blkhash):
-        filename = hexlify(blkhash)
+        return self._check_rear_blocks([blkhash])[0]
+
+    def _check_rear_blocks(self, blkhashes):
+        """Check a list of blocks for existence.
+
+           Up to queue_depth info requests are submitted at once before
+           reaping their completions, so that the round trips overlap.
+           Return a list of booleans in the order of the given hashes.
+        """
+        result = []
+        append = result.append
         ioctx = self.ioctx_pool.pool_get()
-        req = Request.get_info_request(ioctx, self.dst_port, filename)
-        req.submit()
-        req.wait()
-        ret = req.success()
-        req.put()
-        self.ioctx_pool.pool_put(ioctx)
-        if ret:
-            return True
-        else:
-            return False
+        try:
+            for window in _windows(blkhashes, self.queue_depth):
+                reqs = []
+                reaped = 0
+                try:
+                    for h in window:
+                        req = Request.get_info_request(ioctx, self.dst_port,
+                                                       hexlify(h))
+                        reqs.append(_submit(req))
+                    for req in reqs:
+                        req.wait()
+                        reaped += 1
+                        append(bool(req.success()))
+                finally:
+                    _put_requests(reqs, reaped)
+        finally:
+            self.ioctx_pool.pool_put(ioctx)
+        return result
 
     def block_hash(self, data):
         """Hash a block of data"""
@@ -92,74 +151,122 @@ class ArchipelagoBlocker(object):
         """Check hashes for existence and
            return those missing from block storage.
         """
-        notfound = []
-        append = notfound.append
-
+        unique = []
+        seen = set()
         for h in hashes:
-            if h not in notfound and not self._check_rear_block(h):
-                append(h)
+            if h not in seen:
+                seen.add(h)
+                unique.append(h)
 
-        return notfound
+        exists = self._check_rear_blocks(unique)
+        return [h for h, e in zip(unique, exists) if not e]
 
     def block_retr(self, hashes):
-        """Retrieve blocks from storage by their hashes."""
+        """Retrieve blocks from storage by their hashes.
+
+           Reads are pipelined in windows of queue_depth requests.
+           Retrieval stops at the first block that cannot be read.
+        """
         blocksize = self.blocksize
         blocks = []
         append = blocks.append
-        block = None
 
-        for h in hashes:
-            if h == self.emptyhash:
-                append(self._pad(''))
-                continue
-            with self._get_rear_block(h, 0) as rbl:
-                if not rbl:
-                    break
-                for block in rbl.sync_read_chunks(blocksize, 1, 0):
-                    break  # there should be just one block there
-            if not block:
-                break
-            append(self._pad(block))
+        ioctx = self.ioctx_pool.pool_get()
+        try:
+            for window in _windows(list(hashes), self.queue_depth):
+                reqs = []
+                reaped = 0
+                try:
+                    for h in window:
+                        if h == self.emptyhash:
+                            reqs.append(None)
+                            continue
+                        req = Request.get_read_request(ioctx, self.dst_port,
+                                                       hexlify(h),
+                                                       size=blocksize)
+                        reqs.append(_submit(req))
+                    for req in reqs:
+                        if req is None:
+                            reaped += 1
+                            append(self._pad(''))
+                            continue
+                        req.wait()
+                        reaped += 1
+                        if not req.success():
+                            return blocks
+                        block = string_at(req.get_data(), blocksize)
+                        if not block:
+                            return blocks
+                        append(self._pad(block))
+                finally:
+                    _put_requests(reqs, reaped)
+        finally:
+            self.ioctx_pool.pool_put(ioctx)
 
         return blocks
 
     def block_retr_archipelago(self, hashes):
-        """Retrieve blocks from storage by their hashes"""
+        """Retrieve blocks from storage by their hashes
+
+           The info requests of a window of hashes are submitted together,
+           followed by the read requests of the same window.
+        """
         blocks = []
         append = blocks.append
 
         ioctx = self.ioctx_pool.pool_get()
         archip_emptyhash = hexlify(self.emptyhash)
 
-        for h in hashes:
-            if h == archip_emptyhash:
-                append(self._pad(''))
-                continue
-            req = Request.get_info_request(ioctx, self.dst_port, h)
-            req.submit()
-            req.wait()
-            ret = req.success()
-            if ret:
-                info = req.get_data(_type=xseg_reply_info)
-                size = info.contents.size
-                req.put()
-                req_data = Request.get_read_request(ioctx, self.dst_port, h,
-                                                    size=size)
-                req_data.submit()
-                req_data.wait()
-                ret_data = req_data.success()
-                if ret_data:
-                    append(self._pad(string_at(req_data.get_data(), size)))
-                    req_data.put()
-                else:
-                    req_data.put()
-                    self.ioctx_pool.pool_put(ioctx)
-                    raise Exception("Cannot retrieve Archipelago data.")
-            else:
-                req.put()
-                self.ioctx_pool.pool_put(ioctx)
-                raise Exception("Bad block file.")
-        self.ioctx_pool.pool_put(ioctx)
+        try:
+            for window in _windows(list(hashes), self.queue_depth):
+                names = []
+                for h in window:
+                    if h != archip_emptyhash and h not in names:
+                        names.append(h)
+                sizes = {}
+                reqs = []
+                reaped = 0
+                try:
+                    for h in names:
+                        req = Request.get_info_request(ioctx, self.dst_port,
+                                                       h)
+                        reqs.append(_submit(req))
+                    for h, req in zip(names, reqs):
+                        req.wait()
+                        reaped += 1
+                        if not req.success():
+                            raise Exception("Bad block file.")
+                        info = req.get_data(_type=xseg_reply_info)
+                        sizes[h] = info.contents.size
+                finally:
+                    _put_requests(reqs, reaped)
+
+                data = {}
+                reqs = []
+                reaped = 0
+                try:
+                    for h in names:
+                        req = Request.get_read_request(ioctx, self.dst_port,
+                                                       h, size=sizes[h])
+                        reqs.append(_submit(req))
+                    for h, req in zip(names, reqs):
+                        req.wait()
+                        reaped += 1
+                        if not req.success():
+                            raise Exception("Cannot retrieve Archipelago "
+                                            "data.")
+                        data[h] = self._pad(string_at(req.get_data(),
+                                                      sizes[h]))
+                finally:
+                    _put_requests(reqs, reaped)
+
+                for h in window:
+                    if h == archip_emptyhash:
+                        append(self._pad(''))
+                    else:
+                        append(data[h])
+        finally:
+            self.ioctx_pool.pool_put(ioctx)
         return blocks
 
     def block_stor(self, blocklist):
@@ -170,8 +277,8 @@ class ArchipelagoBlocker(object):
         """
         block_hash = self.block_hash
         hashlist = [block_hash(b) for b in blocklist]
-        missing = [i for i, h in enumerate(hashlist) if not
-                   self._check_rear_block(h)]
+        exists = self._check_rear_blocks(hashlist)
+        missing = [i for i, e in enumerate(exists) if not e]
         for i in missing:
             with self._get_rear_block(hashlist[i], 1) as rbl:
                 rbl.sync_write(blocklist[i])  # XXX: verify?
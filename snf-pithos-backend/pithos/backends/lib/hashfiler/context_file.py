@@ -0,0 +1,98 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import errno
+import mmap
+from tempfile import mkstemp
+
+
+def fan_out_path(root, name, depth, width=2):
+    """Return the path of name under root, sharded by the name prefix.
+
+       The first depth * width characters of name are used as intermediate
+       directories, so that no directory ends up with millions of entries.
+    """
+    parts = [name[i * width:(i + 1) * width] for i in xrange(depth)]
+    parts.append(name)
+    return os.path.join(root, *parts)
+
+
+def ensure_dir(path, umask=None):
+    """Create the directory path (and its parents) if it does not exist."""
+    if os.path.isdir(path):
+        return
+    old_umask = os.umask(umask) if umask is not None else None
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    finally:
+        if old_umask is not None:
+            os.umask(old_umask)
+
+
+def file_atomic_write(path, data, umask=None, fsync=False, overwrite=False):
+    """Write data to path, so that readers never see a partial file.
+
+       The data are written in a temporary file in the same directory,
+       which is then renamed over path. Unless overwrite is set, return
+       False without writing if path already exists, which is fine for
+       content-addressed files.
+    """
+    if not overwrite and os.path.exists(path):
+        return False
+    dirname = os.path.dirname(path)
+    ensure_dir(dirname, umask)
+    fd, tmp = mkstemp(prefix='.tmp-', dir=dirname)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if umask is not None:
+            os.chmod(tmp, 0o666 & ~umask)
+        os.rename(tmp, path)
+    except:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+def file_mmap_read(path):
+    """Return the contents of path using a read-only memory map.
+
+       Return None if the file does not exist.
+    """
+    try:
+        f = open(path, 'rb')
+    except IOError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return ''
+        m = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            return m[:]
+        finally:
+            m.close()
@@ -0,0 +1,151 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from hashlib import new as newhasher
+from binascii import hexlify
+
+from context_file import (
+    fan_out_path,
+    ensure_dir,
+    file_atomic_write,
+    file_mmap_read,
+    )
+
+
+class FileBlocker(object):
+    """Blocker storing blocks as files in a local directory tree.
+       Required constructor parameters: blocksize, blockpath, hashtype.
+       Optional constructor parameters: umask, fanout, fsync.
+    """
+
+    blocksize = None
+    blockpath = None
+    hashtype = None
+
+    def __init__(self, **params):
+        blocksize = params['blocksize']
+        blockpath = params['blockpath']
+        hashtype = params['hashtype']
+        try:
+            hasher = newhasher(hashtype)
+        except ValueError:
+            msg = "Variable hashtype '%s' is not available from hashlib"
+            raise ValueError(msg % (hashtype,))
+
+        hasher.update("")
+        emptyhash = hasher.digest()
+
+        self.umask = params.get('umask')
+        ensure_dir(blockpath, self.umask)
+        if not os.path.isdir(blockpath):
+            raise ValueError("Variable blockpath '%s' is not a directory" %
+                             (blockpath,))
+
+        self.blocksize = blocksize
+        self.blockpath = blockpath
+        self.fanout = int(params.get('fanout', 2))
+        self.fsync = params.get('fsync', False)
+        self.hashtype = hashtype
+        self.hashlen = len(emptyhash)
+        self.emptyhash = emptyhash
+
+    def _pad(self, block):
+        return block + ('\x00' * (self.blocksize - len(block)))
+
+    def _block_path(self, blkhash):
+        return fan_out_path(self.blockpath, hexlify(blkhash), self.fanout)
+
+    def _check_rear_block(self, blkhash):
+        return os.path.exists(self._block_path(blkhash))
+
+    def block_hash(self, data):
+        """Hash a block of data"""
+        hasher = newhasher(self.hashtype)
+        hasher.update(data.rstrip('\x00'))
+        return hasher.digest()
+
+    def block_ping(self, hashes):
+        """Check hashes for existence and
+           return those missing from block storage.
+        """
+        notfound = []
+        append = notfound.append
+        seen = set()
+
+        for h in hashes:
+            if h in seen:
+                continue
+            seen.add(h)
+            if not self._check_rear_block(h):
+                append(h)
+
+        return notfound
+
+    def block_retr(self, hashes):
+        """Retrieve blocks from storage by their hashes."""
+        blocks = []
+        append = blocks.append
+
+        for h in hashes:
+            if h == self.emptyhash:
+                append(self._pad(''))
+                continue
+            block = file_mmap_read(self._block_path(h))
+            if not block:
+                break
+            append(self._pad(block))
+
+        return blocks
+
+    def block_stor(self, blocklist):
+        """Store a bunch of blocks and return (hashes, missing).
+           Hashes is a list of the hashes of the blocks,
+           missing is a list of indices in that list indicating
+           which blocks were missing from the store.
+        """
+        block_hash = self.block_hash
+        hashlist = [block_hash(b) for b in blocklist]
+        missing = []
+        for i, h in enumerate(hashlist):
+            if file_atomic_write(self._block_path(h), blocklist[i],
+                                 umask=self.umask, fsync=self.fsync):
+                missing.append(i)
+
+        return hashlist, missing
+
+    def block_delta(self, blkhash, offset, data):
+        """Construct and store a new block from a given block
+           and a data 'patch' applied at offset. Return:
+           (the hash of the new block, if the block already existed)
+        """
+
+        blocksize = self.blocksize
+        if offset >= blocksize or not data:
+            return None, None
+
+        block = self.block_retr((blkhash,))
+        if not block:
+            return None, None
+
+        block = block[0]
+        newblock = block[:offset] + data
+        if len(newblock) > blocksize:
+            newblock = newblock[:blocksize]
+        elif len(newblock) < blocksize:
+            newblock += block[len(newblock):]
+
+        h, a = self.block_stor((newblock,))
+        return h[0], 1 if a else 0
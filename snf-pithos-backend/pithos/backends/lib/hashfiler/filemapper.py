@@ -0,0 +1,88 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from hashlib import sha256
+from binascii import hexlify, unhexlify
+
+from context_file import (
+    fan_out_path,
+    ensure_dir,
+    file_atomic_write,
+    file_mmap_read,
+    )
+
+
+class FileMapper(object):
+    """Mapper storing hashes maps as files in a local directory tree.
+       Required constructor parameters: mappath, namelen.
+       Optional constructor parameters: umask, fanout, fsync.
+
+       A map is stored as the concatenation of the binary block hashes,
+       so that a map of n blocks occupies exactly n * namelen bytes.
+       Map names share a common prefix, so the directory fan-out is based
+       on a digest of the name instead of the name itself.
+    """
+
+    mappath = None
+    namelen = None
+
+    def __init__(self, **params):
+        self.params = params
+        self.namelen = params['namelen']
+        mappath = params['mappath']
+        self.umask = params.get('umask')
+        ensure_dir(mappath, self.umask)
+        if not os.path.isdir(mappath):
+            raise ValueError("Variable mappath '%s' is not a directory" %
+                             (mappath,))
+        self.mappath = mappath
+        self.fanout = int(params.get('fanout', 2))
+        self.fsync = params.get('fsync', False)
+
+    def _map_path(self, maphash):
+        return fan_out_path(self.mappath, sha256(maphash).hexdigest(),
+                            self.fanout)
+
+    def map_retr(self, maphash, size):
+        """Return as a list, part of the hashes map of an object
+           at the given block offset.
+           By default, return the whole hashes map.
+        """
+        data = file_mmap_read(self._map_path(maphash))
+        if data is None:
+            raise Exception("Could not retrieve mapfile %s." % maphash)
+        namelen = self.namelen
+        return [hexlify(data[i:i + namelen])
+                for i in xrange(0, len(data), namelen)]
+
+    def _unhexlify_name(self, name):
+        try:
+            data = unhexlify(name)
+        except TypeError:
+            data = None
+        if data is None or len(data) != self.namelen:
+            raise ValueError("Map entry '%s' is not a hexadecimal hash of"
+                             " %d bytes" % (name, self.namelen))
+        return data
+
+    def map_stor(self, maphash, hashes, size, block_size):
+        """Store hashes in the given hashes map.
+           Only hexadecimal hashes of namelen bytes can be stored,
+           since the map is stored in binary form.
+        """
+        data = ''.join(self._unhexlify_name(h) for h in hashes)
+        file_atomic_write(self._map_path(maphash), data, umask=self.umask,
+                          fsync=self.fsync, overwrite=True)
@@ -0,0 +1,89 @@
+# Copyright (C) 2010-2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Block module keeping blocks and maps in a local directory tree.
+
+Use it by setting the backend block module to
+'pithos.backends.lib.hashfiler.filestore' and passing at least the 'path'
+block parameter, e.g.:
+
+    PITHOS_BACKEND_BLOCK_MODULE = 'pithos.backends.lib.hashfiler.filestore'
+    PITHOS_BACKEND_BLOCK_KWARGS = {'path': '/srv/pithos/data'}
+"""
+
+import os
+from binascii import unhexlify
+
+from fileblocker import FileBlocker
+from filemapper import FileMapper
+
+# The store does not talk to Archipelago, so the backend does not need to
+# set up an xseg context pool for it.
+USES_XSEG = False
+
+
+class Store(object):
+    """Store.
+       Required constructor parameters: block_size, hash_algorithm, path
+       Optional constructor parameters: umask, fanout, fsync
+    """
+
+    def __init__(self, **params):
+        path = params['path']
+        optional = dict((k, params[k]) for k in ('umask', 'fanout', 'fsync')
+                        if params.get(k) is not None)
+        pb = {'blocksize': params['block_size'],
+              'blockpath': os.path.join(path, 'blocks'),
+              'hashtype': params['hash_algorithm'],
+              }
+        pb.update(optional)
+        self.blocker = FileBlocker(**pb)
+        pm = {'namelen': self.blocker.hashlen,
+              'mappath': os.path.join(path, 'maps'),
+              }
+        pm.update(optional)
+        self.mapper = FileMapper(**pm)
+
+    def map_get(self, name, size):
+        return self.mapper.map_retr(name, size)
+
+    def map_put(self, name, map, size, block_size):
+        self.mapper.map_stor(name, map, size, block_size)
+
+    def map_delete(self, name):
+        pass
+
+    def block_get(self, hash):
+        blocks = self.blocker.block_retr((hash,))
+        if not blocks:
+            return None
+        return blocks[0]
+
+    def block_get_archipelago(self, hash):
+        try:
+            return self.block_get(unhexlify(hash))
+        except TypeError:
+            return None
+
+    def block_put(self, data):
+        hashes, absent = self.blocker.block_stor((data,))
+        return hashes[0]
+
+    def block_update(self, hash, offset, data):
+        h, e = self.blocker.block_delta(hash, offset, data)
+        return h
+
+    def block_search(self, map):
+        return self.blocker.block_ping(map)
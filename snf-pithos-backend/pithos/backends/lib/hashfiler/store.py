@@ -21,6 +21,7 @@ class Store(object):
     """Store.
        Required constructor parameters: block_size, hash_algorithm,
                                         archipelago_cfile, namelen
+       Optional constructor parameters: queue_depth
     """
 
     def __init__(self, **params):
@@ -28,6 +29,8 @@ class Store(object):
               'hashtype': params['hash_algorithm'],
               'archipelago_cfile': params['archipelago_cfile'],
               }
+        if params.get('queue_depth') is not None:
+            pb['queue_depth'] = params['queue_depth']
         self.blocker = Blocker(**pb)
         pm = {'namelen': self.blocker.hashlen,
               'archipelago_cfile': params['archipelago_cfile'],
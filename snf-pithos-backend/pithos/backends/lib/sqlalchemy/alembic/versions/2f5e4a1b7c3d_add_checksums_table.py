@@ -0,0 +1,44 @@
+"""Add checksums table
+
+Revision ID: 2f5e4a1b7c3d
+Revises: 5adc52055209
+Create Date: 2016-06-14 12:20:41.517204
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2f5e4a1b7c3d'
+down_revision = '5adc52055209'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'checksums',
+        sa.Column('hash', sa.String(256), primary_key=True),
+        sa.Column('size', sa.BigInteger, primary_key=True,
+                  autoincrement=False),
+        sa.Column('checksum', sa.String(256), nullable=False),
+        mysql_engine='InnoDB')
+
+    # Seed the table with the checksums already known.
+    v = sa.sql.table(
+        'versions',
+        sa.sql.column('hash', sa.String),
+        sa.sql.column('size', sa.BigInteger),
+        sa.sql.column('checksum', sa.String))
+    c = sa.sql.table(
+        'checksums',
+        sa.sql.column('hash', sa.String),
+        sa.sql.column('size', sa.BigInteger),
+        sa.sql.column('checksum', sa.String))
+    s = sa.select([v.c.hash, v.c.size, sa.func.max(v.c.checksum)])
+    s = s.where(sa.and_(v.c.hash.isnot(None), v.c.checksum != ''))
+    s = s.group_by(v.c.hash, v.c.size)
+    op.execute(c.insert().from_select(['hash', 'size', 'checksum'], s))
+
+
+def downgrade():
+    op.drop_table('checksums')
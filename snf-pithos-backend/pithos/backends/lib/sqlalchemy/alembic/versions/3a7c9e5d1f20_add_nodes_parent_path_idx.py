@@ -0,0 +1,21 @@
+"""Add nodes (parent, path) index
+
+Revision ID: 3a7c9e5d1f20
+Revises: 2f5e4a1b7c3d
+Create Date: 2016-06-20 10:05:12.603118
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3a7c9e5d1f20'
+down_revision = '2f5e4a1b7c3d'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('idx_nodes_parent_path', 'nodes', ['parent', 'path'])
+
+
+def downgrade():
+    op.drop_index('idx_nodes_parent_path', 'nodes')
@@ -0,0 +1,76 @@
+"""Add account statistics
+
+Revision ID: 4b1d8e2c6a95
+Revises: 3a7c9e5d1f20
+Create Date: 2016-06-21 11:05:12.381644
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4b1d8e2c6a95'
+down_revision = '3a7c9e5d1f20'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    n = sa.sql.table(
+        'nodes',
+        sa.sql.column('node', sa.Integer),
+        sa.sql.column('parent', sa.Integer))
+    v = sa.sql.table(
+        'versions',
+        sa.sql.column('serial', sa.Integer),
+        sa.sql.column('node', sa.Integer),
+        sa.sql.column('mtime', sa.DECIMAL),
+        sa.sql.column('cluster', sa.Integer))
+    st = sa.sql.table(
+        'statistics',
+        sa.sql.column('node', sa.Integer),
+        sa.sql.column('population', sa.Integer),
+        sa.sql.column('size', sa.BigInteger),
+        sa.sql.column('mtime', sa.DECIMAL),
+        sa.sql.column('cluster', sa.Integer))
+
+    accounts = sa.select([n.c.node], sa.and_(n.c.node != 0, n.c.parent == 0))
+    op.execute(st.delete().where(st.c.node.in_(accounts)))
+
+    # The population of an account is the number of its container versions,
+    # its size the sum of the sizes of its containers.
+    c = op.get_bind()
+    stats = {}
+    s = sa.select([n.c.parent, v.c.cluster, sa.func.count(v.c.serial),
+                   sa.func.max(v.c.mtime)])
+    s = s.where(sa.and_(v.c.node == n.c.node, n.c.parent.in_(accounts)))
+    s = s.group_by(n.c.parent, v.c.cluster)
+    for node, cluster, population, mtime in c.execute(s).fetchall():
+        stats[(node, cluster)] = [population, 0, mtime]
+    s = sa.select([n.c.parent, st.c.cluster, sa.func.sum(st.c.size),
+                   sa.func.max(st.c.mtime)])
+    s = s.where(sa.and_(st.c.node == n.c.node, n.c.parent.in_(accounts)))
+    s = s.group_by(n.c.parent, st.c.cluster)
+    for node, cluster, size, mtime in c.execute(s).fetchall():
+        row = stats.setdefault((node, cluster), [0, 0, mtime])
+        row[1] = size or 0
+        row[2] = max(row[2], mtime)
+
+    if stats:
+        op.bulk_insert(st, [
+            {'node': node, 'population': population, 'size': size,
+             'mtime': mtime, 'cluster': cluster}
+            for (node, cluster), (population, size, mtime)
+            in stats.iteritems()])
+
+
+def downgrade():
+    n = sa.sql.table(
+        'nodes',
+        sa.sql.column('node', sa.Integer),
+        sa.sql.column('parent', sa.Integer))
+    st = sa.sql.table(
+        'statistics',
+        sa.sql.column('node', sa.Integer))
+
+    accounts = sa.select([n.c.node], sa.and_(n.c.node != 0, n.c.parent == 0))
+    op.execute(st.delete().where(st.c.node.in_(accounts)))
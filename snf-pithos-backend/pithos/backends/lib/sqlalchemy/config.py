@@ -13,9 +13,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from sqlalchemy import Table, Column, String, MetaData
-from sqlalchemy.sql import select
-from sqlalchemy.exc import NoSuchTableError
+from sqlalchemy import Table, Column, String, Integer, MetaData
+from sqlalchemy.sql import select, cast
+from sqlalchemy.exc import NoSuchTableError, IntegrityError
 
 from dbworker import DBWorker
 
@@ -65,3 +65,29 @@ class Config(DBWorker):
         inserted_primary_key = r.inserted_primary_key[0]
         r.close()
         return inserted_primary_key
+
+    def increment_value(self, key):
+        """Increment the integer configuration entry (initially 0) and
+           return the new value.
+        """
+
+        s = self.config.update().where(self.config.c.key == key)
+        s = s.values(value=cast(cast(self.config.c.value, Integer) + 1,
+                                String))
+        r = self.conn.execute(s)
+        updated = r.rowcount
+        r.close()
+        if not updated:
+            # A concurrent transaction may create the entry first, in which
+            # case increment the entry it created.
+            t = self.conn.begin_nested()  # create savepoint
+            try:
+                r = self.conn.execute(self.config.insert(), key=key,
+                                      value='1')
+            except IntegrityError:
+                t.rollback()
+                r = self.conn.execute(s)
+            else:
+                t.commit()
+            r.close()
+        return int(self.get_value(key))
@@ -13,6 +13,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+
 from sqlalchemy import create_engine
 from sqlalchemy.pool import NullPool
 from sqlalchemy.interfaces import PoolListener
@@ -22,6 +24,7 @@ class DBWrapper(object):
     """Database connection wrapper."""
 
     def __init__(self, db):
+        self.pid = os.getpid()
         if db.startswith('sqlite://'):
             class ForeignKeysListener(PoolListener):
                 def connect(self, dbapi_con, con_record):
@@ -47,6 +50,13 @@ class DBWrapper(object):
         self.conn.close()
         self.conn = None
 
+    @property
+    def closed(self):
+        return self.conn is None or self.conn.closed
+
+    def in_transaction(self):
+        return self.conn.in_transaction()
+
     def execute(self):
         self.trans = self.conn.begin()
 
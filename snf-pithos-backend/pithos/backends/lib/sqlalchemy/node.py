@@ -14,15 +14,13 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from time import time
-from operator import itemgetter
-from itertools import groupby
 from collections import defaultdict
 
 from sqlalchemy import (Table, Integer, BigInteger, DECIMAL, Boolean,
                         Column, String, MetaData, ForeignKey)
 from sqlalchemy.schema import Index, Sequence
 from sqlalchemy.sql import (func, and_, or_, not_, select, bindparam, exists,
-                            functions)
+                            functions, case)
 from sqlalchemy.sql.expression import true, literal, type_coerce
 from sqlalchemy.exc import NoSuchTableError, IntegrityError
 
@@ -32,6 +30,12 @@ from pithos.backends.modular import MAP_AVAILABLE
 from pithos.backends.filter import parse_filters
 
 DEFAULT_DISKSPACE_RESOURCE = 'pithos.diskspace'
+# The number of rows fetched at a time when listing with a delimiter.
+LISTING_PAGE_SIZE = 1000
+# The version properties domain object listings can be sorted by.
+DOMAIN_SORT_PROPERTIES = ('path', 'uuid', 'size', 'mtime')
+# The number of objects whose attributes are fetched at a time.
+DOMAIN_OBJECTS_BATCH = 1000
 ROOTNODE = 0
 
 (MATCH_PREFIX, MATCH_EXACT) = range(2)
@@ -101,6 +105,7 @@ def create_tables(engine):
           postgresql_where=nodes.c.parent == 0)
     Index('idx_nodes_parent0_path', nodes.c.parent, nodes.c.path,
           postgresql_where=nodes.c.parent == 0)
+    Index('idx_nodes_parent_path', nodes.c.parent, nodes.c.path)
 
     #create policy table
     columns = []
@@ -202,6 +207,14 @@ def create_tables(engine):
           attributes.c.domain,
           postgresql_where=attributes.c.domain == "plankton")
 
+    #create checksums table
+    columns = []
+    columns.append(Column('hash', String(256), primary_key=True))
+    columns.append(Column('size', BigInteger, primary_key=True,
+                          autoincrement=False))
+    columns.append(Column('checksum', String(256), nullable=False))
+    Table('checksums', metadata, *columns, mysql_engine='InnoDB')
+
     # TODO: handle backends not supporting sequences
     mapfile_seq = Sequence('mapfile_seq', metadata=metadata)
 
@@ -221,6 +234,8 @@ class Node(DBWorker):
         self._props = params.pop('props')
         self.mapfile_prefix = params.pop('mapfile_prefix', 'snf_file_')
         DBWorker.__init__(self, **params)
+        self._statistics_deltas = {}
+        self._parents = {}
         try:
             metadata = MetaData(self.engine)
             self.nodes = Table('nodes', metadata, autoload=True)
@@ -228,6 +243,7 @@ class Node(DBWorker):
             self.statistics = Table('statistics', metadata, autoload=True)
             self.versions = Table('versions', metadata, autoload=True)
             self.attributes = Table('attributes', metadata, autoload=True)
+            self.checksums = Table('checksums', metadata, autoload=True)
             self.mapfile_seq = Sequence('mapfile_seq', metadata)
         except NoSuchTableError:
             tables = create_tables(self.engine)
@@ -296,6 +312,48 @@ class Node(DBWorker):
         r.close()
         return [row[0] for row in rows]
 
+    def node_lookup_paths(self, paths):
+        """Return a dict mapping the existing paths to their nodes."""
+
+        if not paths:
+            return {}
+        s = select([self.nodes.c.path, self.nodes.c.node],
+                   self.nodes.c.path.in_(paths))
+        r = self.conn.execute(s)
+        rows = r.fetchall()
+        r.close()
+        return dict(rows)
+
+    def node_create_many(self, parent, paths):
+        """Return a dict mapping paths to their nodes, creating the nodes
+           of the paths that do not exist under parent with one statement.
+        """
+
+        nodes = self.node_lookup_paths(paths)
+        missing = [p for p in paths if p not in nodes]
+        if not missing:
+            return nodes
+        t = self.conn.begin_nested()  # create savepoint
+        s = self.nodes.insert().values([{'parent': parent, 'path': p}
+                                        for p in missing])
+        try:
+            self.conn.execute(s).close()
+        except IntegrityError:
+            # Some were created meanwhile.
+            t.rollback()
+            for p in missing:
+                try:
+                    self.node_create(parent, p)
+                except ValueError:
+                    pass
+        else:
+            t.commit()
+        created = self.node_lookup_paths(missing)
+        for node in created.itervalues():
+            self._parents[node] = parent
+        nodes.update(created)
+        return nodes
+
     def node_get_properties(self, node):
         """Return the node's (parent, path).
            Return None if the node is not found.
@@ -398,7 +456,8 @@ class Node(DBWorker):
         nr, size = row[0], safe_long(row[1]) if row[1] else 0
         mtime = time()
         self.statistics_update(parent, -nr, -size, mtime, cluster)
-        self.statistics_update_ancestors(parent, -nr, -size, mtime, cluster,
+        # Population isn't recursive
+        self.statistics_update_ancestors(parent, 0, -size, mtime, cluster,
                                          update_statistics_ancestors_depth)
 
         s = select([self.versions.c.hash, self.versions.c.serial])
@@ -428,6 +487,64 @@ class Node(DBWorker):
         if nodes:
             s = self.nodes.delete().where(self.nodes.c.node.in_(nodes))
             self.conn.execute(s).close()
+            self._statistics_forget(nodes)
+
+        return hashes, size, serials
+
+    def node_purge_children_chunk(self, parent, before=inf, cluster=0,
+                                  limit=1000,
+                                  update_statistics_ancestors_depth=None):
+        """Delete up to limit versions with the specified
+           parent and cluster, oldest first, and return
+           the hashes, the total size and the serials of versions deleted.
+           Clears out the nodes of these versions with no remaining versions.
+        """
+
+        c1 = select([self.nodes.c.node],
+                    self.nodes.c.parent == parent)
+        where_clause = and_(self.versions.c.node.in_(c1),
+                            self.versions.c.cluster == cluster)
+        if before != inf:
+            where_clause = and_(where_clause,
+                                self.versions.c.mtime <= before)
+        s = select([self.versions.c.serial, self.versions.c.node,
+                    self.versions.c.hash, self.versions.c.size])
+        s = s.where(where_clause).order_by(self.versions.c.serial)
+        s = s.limit(limit)
+        r = self.conn.execute(s)
+        rows = r.fetchall()
+        r.close()
+        if not rows:
+            return (), 0, ()
+        serials = [row[0] for row in rows]
+        nodes = set(row[1] for row in rows)
+        hashes = [row[2] for row in rows]
+        size = sum(safe_long(row[3]) for row in rows if row[3])
+
+        #update statistics
+        mtime = time()
+        self.statistics_update(parent, -len(serials), -size, mtime, cluster)
+        # Population isn't recursive
+        self.statistics_update_ancestors(parent, 0, -size, mtime, cluster,
+                                         update_statistics_ancestors_depth)
+
+        #delete versions
+        s = self.versions.delete().where(self.versions.c.serial.in_(serials))
+        self.conn.execute(s).close()
+
+        #delete nodes
+        s = select([self.nodes.c.node],
+                   and_(self.nodes.c.node.in_(nodes),
+                        select([func.count(self.versions.c.serial)],
+                               self.versions.c.node == self.nodes.c.node).
+                        as_scalar() == 0))
+        rp = self.conn.execute(s)
+        nodes = [row[0] for row in rp.fetchall()]
+        rp.close()
+        if nodes:
+            s = self.nodes.delete().where(self.nodes.c.node.in_(nodes))
+            self.conn.execute(s).close()
+            self._statistics_forget(nodes)
 
         return hashes, size, serials
 
@@ -485,6 +602,7 @@ class Node(DBWorker):
         if nodes:
             s = self.nodes.delete().where(self.nodes.c.node.in_(nodes))
             self.conn.execute(s).close()
+            self._statistics_forget(nodes)
 
         return hashes, size, serials
 
@@ -511,8 +629,21 @@ class Node(DBWorker):
 
         s = self.nodes.delete().where(self.nodes.c.node == node)
         self.conn.execute(s).close()
+        self._statistics_forget((node,))
         return True
 
+    def node_children(self, node):
+        """Return the paths and nodes of node's children."""
+
+        s = select([self.nodes.c.path, self.nodes.c.node])
+        s = s.where(and_(self.nodes.c.parent == node,
+                         self.nodes.c.node != ROOTNODE))
+        s = s.order_by(self.nodes.c.path)
+        r = self.conn.execute(s)
+        rows = r.fetchall()
+        r.close()
+        return rows
+
     def node_accounts(self, accounts=()):
         s = select([self.nodes.c.path, self.nodes.c.node])
         s = s.where(and_(self.nodes.c.node != 0,
@@ -653,6 +784,7 @@ class Node(DBWorker):
            for all versions under node that belong to the cluster.
         """
 
+        self.statistics_flush()
         s = select([self.statistics.c.population,
                     self.statistics.c.size,
                     self.statistics.c.mtime])
@@ -668,34 +800,19 @@ class Node(DBWorker):
            Statistics keep track the population, total
            size of objects and mtime in the node's namespace.
            May be zero or positive or negative numbers.
+
+           Updates are merged in memory per node and cluster
+           and written by statistics_flush.
         """
-        s = select([self.statistics.c.population, self.statistics.c.size],
-                   and_(self.statistics.c.node == node,
-                        self.statistics.c.cluster == cluster))
-        rp = self.conn.execute(s)
-        r = rp.fetchone()
-        rp.close()
-        if not r:
-            prepopulation, presize = (0, 0)
-        else:
-            prepopulation, presize = r
-        population += prepopulation
-        population = max(population, 0)
-        size += presize
 
-        #insert or replace
-        #TODO better upsert
-        u = self.statistics.update().where(and_(
-            self.statistics.c.node == node,
-            self.statistics.c.cluster == cluster))
-        u = u.values(population=population, size=size, mtime=mtime)
-        rp = self.conn.execute(u)
-        rp.close()
-        if rp.rowcount == 0:
-            ins = self.statistics.insert()
-            ins = ins.values(node=node, population=population, size=size,
-                             mtime=mtime, cluster=cluster)
-            self.conn.execute(ins).close()
+        delta = self._statistics_deltas.get((node, cluster))
+        if delta is None:
+            self._statistics_deltas[(node, cluster)] = [population, size,
+                                                        mtime]
+        else:
+            delta[0] += population
+            delta[1] += size
+            delta[2] = max(delta[2], mtime)
 
     def statistics_update_ancestors(self, node, population, size, mtime,
                                     cluster=0, recursion_depth=None):
@@ -711,15 +828,108 @@ class Node(DBWorker):
                 break
             if recursion_depth is not None and recursion_depth <= i:
                 break
-            props = self.node_get_properties(node)
-            if props is None:
-                break
-            parent, path = props
+            parent = self._parents.get(node)
+            if parent is None:
+                props = self.node_get_properties(node)
+                if props is None:
+                    break
+                parent = self._parents[node] = props[0]
             self.statistics_update(parent, population, size, mtime, cluster)
             node = parent
             population = 0  # Population isn't recursive
             i += 1
 
+    def statistics_flush(self):
+        """Write the pending statistics updates.
+
+           All the updates are written with three statements
+           (a select, an insert and an executemany update),
+           in node order to avoid deadlocks between transactions.
+        """
+
+        deltas = self._statistics_deltas
+        if not deltas:
+            return
+        self._statistics_deltas = {}
+        keys = sorted(deltas)
+
+        s = select([self.statistics.c.node, self.statistics.c.cluster])
+        s = s.where(self.statistics.c.node.in_(set(k[0] for k in keys)))
+        r = self.conn.execute(s)
+        existing = set((row[0], row[1]) for row in r.fetchall())
+        r.close()
+        missing = [k for k in keys if k not in existing]
+        if missing:
+            ins = self.statistics.insert().values(
+                [{'node': node, 'population': 0, 'size': 0, 'mtime': 0,
+                  'cluster': cluster} for node, cluster in missing])
+            self.conn.execute(ins).close()
+
+        population = self.statistics.c.population + bindparam('b_population')
+        u = self.statistics.update().where(and_(
+            self.statistics.c.node == bindparam('b_node'),
+            self.statistics.c.cluster == bindparam('b_cluster')))
+        u = u.values(population=case([(population < 0, 0)],
+                                     else_=population),
+                     size=self.statistics.c.size + bindparam('b_size'),
+                     mtime=bindparam('b_mtime'))
+        self.conn.execute(u, [
+            {'b_node': node, 'b_cluster': cluster,
+             'b_population': deltas[(node, cluster)][0],
+             'b_size': deltas[(node, cluster)][1],
+             'b_mtime': deltas[(node, cluster)][2]}
+            for node, cluster in keys]).close()
+
+    def _statistics_forget(self, nodes):
+        """Forget the pending statistics updates of removed nodes."""
+
+        nodes = set(nodes)
+        for key in [k for k in self._statistics_deltas if k[0] in nodes]:
+            del self._statistics_deltas[key]
+        for node in nodes:
+            self._parents.pop(node, None)
+
+    def statistics_discard(self):
+        """Forget the pending statistics updates."""
+
+        self._statistics_deltas = {}
+        self._parents = {}
+
+    def statistics_compute(self, node, cluster=0):
+        """Return population, total size and last mtime
+           for all versions under node that belong to the cluster,
+           computed from the versions themselves.
+           This is what statistics_get should return and
+           requires scanning all the nodes under node.
+        """
+
+        props = self.node_get_properties(node)
+        if props is None:
+            return None
+        parent, path = props
+
+        # First level, just under node (get population).
+        c = select([self.nodes.c.node], self.nodes.c.parent == node)
+        s = select([func.count(self.versions.c.serial)])
+        s = s.where(and_(self.versions.c.node.in_(c),
+                         self.versions.c.cluster == cluster))
+        r = self.conn.execute(s)
+        population = r.fetchone()[0]
+        r.close()
+
+        # All children (get size and mtime).
+        c = select([self.nodes.c.node],
+                   self.nodes.c.path.like(self.escape_like(path) + '/%',
+                                          escape=ESCAPE_CHAR))
+        s = select([func.sum(self.versions.c.size),
+                    func.max(self.versions.c.mtime)])
+        s = s.where(and_(self.versions.c.node.in_(c),
+                         self.versions.c.cluster == cluster))
+        r = self.conn.execute(s)
+        size, mtime = r.fetchone()
+        r.close()
+        return (population, safe_long(size) or 0, mtime or 0)
+
     def statistics_latest(self, node, before=inf, except_cluster=0):
         """Return population, total size and last mtime
            for all latest versions under node that
@@ -876,6 +1086,42 @@ class Node(DBWorker):
 
         return serial, mtime, mapfile
 
+    def version_create_many(self, versions,
+                            update_statistics_ancestors_depth=None):
+        """Create new versions with one statement and make them the latest
+           versions of their nodes. Versions are dicts with the arguments
+           of version_create, with a mapfile, and at most one per node.
+           Return a dict mapping the nodes to the serials of their new
+           versions.
+        """
+
+        if not versions:
+            return {}
+        mtime = time()
+        values = []
+        for v in versions:
+            v = dict(v, mtime=mtime)
+            if v['size'] == 0:
+                v['mapfile'] = None
+            values.append(v)
+        s = self.versions.insert().values(values).returning(
+            self.versions.c.node, self.versions.c.serial)
+        r = self.conn.execute(s)
+        serials = dict(r.fetchall())
+        r.close()
+        for v in values:
+            self.statistics_update_ancestors(
+                v['node'], 1, v['size'], mtime, v['cluster'],
+                update_statistics_ancestors_depth)
+
+        s = self.nodes.update().where(
+            self.nodes.c.node == bindparam('b_node'))
+        s = s.values(latest_version=bindparam('b_serial'))
+        self.conn.execute(s, [{'b_node': node, 'b_serial': serial}
+                              for node, serial in serials.iteritems()]
+                          ).close()
+        return serials
+
     def version_lookup(self, node, before=inf, cluster=0, all_props=True,
                        keys=()):
         """Lookup the current version of the given node.
@@ -1000,6 +1246,40 @@ class Node(DBWorker):
         s = s.values(**{key: value})
         self.conn.execute(s).close()
 
+    def checksum_get(self, hash, size):
+        """Return the checksum of the content with the given hash and size,
+           or None if it is not known.
+        """
+
+        c = self.checksums.c
+        s = select([c.checksum], and_(c.hash == hash, c.size == size))
+        rp = self.conn.execute(s)
+        r = rp.fetchone()
+        rp.close()
+        return r[0] if r else None
+
+    def checksum_put(self, hash, size, checksum):
+        """Remember the checksum of the content with the given hash and size.
+        """
+
+        c = self.checksums.c
+        s = self.checksums.update().where(and_(c.hash == hash,
+                                               c.size == size))
+        r = self.conn.execute(s.values(checksum=checksum))
+        updated = r.rowcount
+        r.close()
+        if updated:
+            return
+        t = self.conn.begin_nested()  # create savepoint
+        s = self.checksums.insert().values(hash=hash, size=size,
+                                           checksum=checksum)
+        try:
+            self.conn.execute(s).close()
+        except IntegrityError:
+            t.rollback()
+        else:
+            t.commit()
+
     def version_recluster(self, serial, cluster,
                           update_statistics_ancestors_depth=None):
         """Move the version into another cluster."""
@@ -1024,6 +1304,34 @@ class Node(DBWorker):
         s = s.values(cluster=cluster)
         self.conn.execute(s).close()
 
+    def version_recluster_many(self, serials, cluster,
+                               update_statistics_ancestors_depth=None):
+        """Move the versions into another cluster."""
+
+        if not serials:
+            return
+        v = self.versions.c
+        s = select([v.serial, v.node, v.size, v.cluster],
+                   and_(v.serial.in_(serials), v.cluster != cluster))
+        r = self.conn.execute(s)
+        rows = r.fetchall()
+        r.close()
+        if not rows:
+            return
+
+        mtime = time()
+        for serial, node, size, oldcluster in rows:
+            self.statistics_update_ancestors(
+                node, -1, -size, mtime, oldcluster,
+                update_statistics_ancestors_depth)
+            self.statistics_update_ancestors(
+                node, 1, size, mtime, cluster,
+                update_statistics_ancestors_depth)
+
+        s = self.versions.update().where(
+            v.serial.in_([row[0] for row in rows]))
+        self.conn.execute(s.values(cluster=cluster)).close()
+
     def version_remove(self, serial, update_statistics_ancestors_depth=None):
         """Remove the serial specified."""
 
@@ -1144,12 +1452,67 @@ class Node(DBWorker):
                              is_latest=True, key=k, value=v)
             self.conn.execute(s).close()
 
+    def _attribute_copy_domains_query(self, exclude_domain=None,
+                                      src_node=False):
+        attrs = self.attributes
+        s = select([bindparam('dest', type_=Integer), attrs.c.domain,
+                    bindparam('dest_node', type_=Integer), true(),
+                    attrs.c.key, attrs.c.value])
+        conditions = [attrs.c.serial == bindparam('source')]
+        if exclude_domain is not None:
+            conditions.append(attrs.c.domain != exclude_domain)
+        if src_node:
+            conditions.append(attrs.c.node == bindparam('src_node'))
+        s = s.where(and_(*conditions))
+        return attrs.insert().from_select(
+            ['serial', 'domain', 'node', 'is_latest', 'key', 'value'], s)
+
+    def attribute_copy_domains(self, source, dest, node, exclude_domain=None,
+                               src_node=None):
+        """Copy the attributes of all domains of version source to the new
+           version dest of node, except those of exclude_domain.
+           If src_node is given, copy only the attributes of source
+           belonging to it.
+        """
+
+        s = self._attribute_copy_domains_query(exclude_domain,
+                                               src_node is not None)
+        self.conn.execute(s, source=source, dest=dest, dest_node=node,
+                          src_node=src_node).close()
+
+    def attribute_copy_domains_many(self, copies):
+        """Copy the attributes of all domains for every (source, dest, node)
+           in copies, as in attribute_copy_domains.
+        """
+
+        params = [{'source': source, 'dest': dest, 'dest_node': node}
+                  for source, dest, node in copies]
+        if not params:
+            return
+        s = self._attribute_copy_domains_query()
+        self.conn.execute(s, params).close()
+
     def attribute_unset_is_latest(self, node, exclude):
         u = self.attributes.update().where(and_(
             self.attributes.c.node == node,
             self.attributes.c.serial != exclude)).values({'is_latest': False})
         self.conn.execute(u)
 
+    def attribute_unset_is_latest_many(self, latest):
+        """Unset is_latest for the attributes of all the versions of each
+           node in latest, a dict mapping nodes to the serials to exclude.
+        """
+
+        if not latest:
+            return
+        u = self.attributes.update().where(and_(
+            self.attributes.c.node == bindparam('b_node'),
+            self.attributes.c.serial != bindparam('b_serial')))
+        u = u.values({'is_latest': False})
+        self.conn.execute(u, [{'b_node': node, 'b_serial': serial}
+                              for node, serial in latest.iteritems()]
+                          ).close()
+
     def latest_attribute_keys(self, parent, domain, before=inf,
                               except_cluster=0, pathq=None):
         """Return a list with all keys pairs defined
@@ -1271,20 +1634,17 @@ class Node(DBWorker):
                 d4.join(self.versions,
                         onclause=self.versions.c.serial == d4.c.vmax)
         else:
-            d4 = select([self.nodes.c.path,
-                         self.nodes.c.node,
-                         self.nodes.c.latest_version]).where(
-                             self.nodes.c.parent == parent)
-            d4 = d4.where(and_(self.nodes.c.path > bindparam('start'),
-                               self.nodes.c.path < nextling)).cte("d4")
-
+            # Join the children of parent directly (not through a CTE), so
+            # that the (parent, path) index is scanned in order and the scan
+            # stops at the limit.
+            d4 = self.nodes.alias('d4')
             inner_join = \
                 d4.join(self.versions,
                         onclause=self.versions.c.serial == d4.c.latest_version)
         if not all_props:
             s = select([d4.c.path,
                        self.versions.c.serial],
-                       from_obj=[inner_join]).distinct()
+                       from_obj=[inner_join])
         else:
             s = select([d4.c.path,
                        self.versions.c.serial, self.versions.c.node,
@@ -1299,7 +1659,13 @@ class Node(DBWorker):
                        self.versions.c.map_check_timestamp,
                        self.versions.c.mapfile,
                        self.versions.c.is_snapshot],
-                       from_obj=[inner_join]).distinct()
+                       from_obj=[inner_join])
+        if before != inf:
+            s = s.distinct()
+        else:
+            s = s.where(and_(d4.c.parent == parent,
+                             d4.c.path > bindparam('start'),
+                             d4.c.path < nextling))
 
         s = s.where(self.versions.c.cluster != except_cluster)
         s = s.where(self.versions.c.node == d4.c.node)
@@ -1370,13 +1736,20 @@ class Node(DBWorker):
         mappend = matches.append
         skip_prefix = None
         one_more = False
+        done = False
 
-        rp = self.conn.execute(s, start=start)
+        # Fetch the paths in pages, each one starting right after the
+        # previous one. As soon as a common prefix is found, the next page
+        # starts right after the prefix, so that the paths under it are
+        # skipped with a single seek.
+        page_size = min(limit + 1, LISTING_PAGE_SIZE)
+        s = s.limit(page_size)
 
-        while count < limit or one_more:
-            props_many = rp.fetchmany(10000)
-            if not props_many:
-                break
+        while not done and (count < limit or one_more):
+            rp = self.conn.execute(s, start=start)
+            props_many = rp.fetchall()
+            rp.close()
+            seek = False
 
             for props in props_many:
                 path = props[0]
@@ -1393,13 +1766,20 @@ class Node(DBWorker):
                     if idx > 0 and idx + dz != len(path):
                         pf = path[:idx + dz]
                         pappend(pf)
+                    done = True
                     break
 
                 if idx > 0 and idx + dz != len(path):
                     pf = path[:idx + dz]
                     pappend(pf)
-                    skip_prefix = pf
-                    continue
+                    try:
+                        # Seek past the paths under the common prefix.
+                        start = strprevling(strnextling(pf))
+                        seek = True
+                        break
+                    except RuntimeError:
+                        skip_prefix = pf
+                        continue
 
                 mappend(props)
                 count += 1
@@ -1408,9 +1788,14 @@ class Node(DBWorker):
                         # Get one more, in case there is a path.
                         one_more = True
                     else:
+                        done = True
                         break
 
-        rp.close()
+            if done or seek:
+                continue
+            if len(props_many) < page_size:
+                break
+            start = props_many[-1][0]
 
         return matches, prefixes
 
@@ -1437,9 +1822,10 @@ class Node(DBWorker):
         r.close()
         return l
 
-    def domain_object_list(self, domain, paths, cluster=None):
-        """Return a list of (path, property list, attribute dictionary)
-           for the objects in the specific domain and cluster.
+    def _domain_objects(self, domain, paths, cluster=None, account=None,
+                        filters=None, size_range=None, sort_key=None):
+        """Return the aliases, the columns of the properties, the sort
+           column and the query selecting the objects in the domain.
         """
 
         v = self.versions.alias('v')
@@ -1450,27 +1836,119 @@ class Node(DBWorker):
                  v.c.source, v.c.mtime, v.c.muser, v.c.uuid, v.c.checksum,
                  v.c.cluster, v.c.available, v.c.map_check_timestamp,
                  v.c.mapfile, v.c.is_snapshot]
-        cols = props + [a.c.key, a.c.value]
 
-        s = select(cols)
-        if cluster:
+        def attribute(key=None, value=None):
+            s = select([a.c.serial])
+            s = s.where(and_(a.c.serial == v.c.serial, a.c.domain == domain,
+                             a.c.is_latest == true()))
+            if key is not None:
+                s = s.where(and_(a.c.key == key, a.c.value == value))
+            return exists(s)
+
+        from_obj = n.join(v, v.c.node == n.c.node)
+        if sort_key in DOMAIN_SORT_PROPERTIES:
+            sort_column = getattr(v.c, sort_key) if sort_key != 'path' \
+                else n.c.path
+        elif sort_key is not None:
+            sa = self.attributes.alias('sa')
+            from_obj = from_obj.outerjoin(
+                sa, and_(sa.c.serial == v.c.serial, sa.c.domain == domain,
+                         sa.c.key == sort_key))
+            sort_column = func.coalesce(sa.c.value, '')
+        else:
+            sort_column = n.c.path
+
+        s = select(props + [sort_column], from_obj=[from_obj])
+        s = s.where(attribute())
+        if cluster is not None:
             s = s.where(v.c.cluster == cluster)
-        s = s.where(v.c.serial == a.c.serial)
-        s = s.where(a.c.domain == domain)
-        s = s.where(a.c.node == n.c.node)
-        s = s.where(a.c.is_latest == true())
+        scope = []
         if paths:
-            s = s.where(n.c.path.in_(paths))
+            scope.append(n.c.path.in_(paths))
+        if account:
+            scope.append(n.c.path.like(self.escape_like(account) + '/%/%',
+                                       escape=ESCAPE_CHAR))
+        if scope:
+            s = s.where(or_(*scope))
+        for key, value in (filters or {}).iteritems():
+            s = s.where(attribute(key, value))
+        if size_range:
+            if size_range[0] is not None:
+                s = s.where(v.c.size >= size_range[0])
+            if size_range[1] is not None:
+                s = s.where(v.c.size <= size_range[1])
+        return n, v, props, sort_column, s
+
+    def domain_object_list(self, domain, paths, cluster=None, account=None,
+                           filters=None, size_range=None, sort_key=None,
+                           reverse=False, after=None, limit=None):
+        """Return a list of (path, property list, attribute dictionary)
+           for the objects in the specific domain and cluster.
+
+        Keyword arguments:
+        paths -- return only objects with these paths or, if account is
+                 also given, the objects of the account
+        filters -- dict of attributes the objects must have in the domain
+        size_range -- tuple of the minimum and maximum size
+        sort_key -- order by this property (one of DOMAIN_SORT_PROPERTIES)
+                    or attribute of the domain, and then by path
+        after -- return only objects after this (sort value, path),
+                 as returned by domain_object_position
+        """
 
+        n, v, props, sort_column, s = self._domain_objects(
+            domain, paths, cluster, account, filters, size_range, sort_key)
+        if after is not None:
+            value, path = after
+            if reverse:
+                s = s.where(or_(sort_column < value,
+                                and_(sort_column == value, n.c.path < path)))
+            else:
+                s = s.where(or_(sort_column > value,
+                                and_(sort_column == value, n.c.path > path)))
+        if reverse:
+            s = s.order_by(sort_column.desc(), n.c.path.desc())
+        else:
+            s = s.order_by(sort_column.asc(), n.c.path.asc())
+        if limit is not None:
+            s = s.limit(limit)
         r = self.conn.execute(s)
-        rows = r.fetchall()
+        rows = [row[:len(props)] for row in r.fetchall()]
         r.close()
+        if not rows:
+            return []
+
+        # Fetch the attributes of all the objects at once.
+        attributes = defaultdict(dict)
+        serials = [row[1] for row in rows]
+        for i in range(0, len(serials), DOMAIN_OBJECTS_BATCH):
+            batch = serials[i:i + DOMAIN_OBJECTS_BATCH]
+            s = select([self.attributes.c.serial, self.attributes.c.key,
+                        self.attributes.c.value])
+            s = s.where(and_(self.attributes.c.serial.in_(batch),
+                             self.attributes.c.domain == domain,
+                             self.attributes.c.is_latest == true()))
+            r = self.conn.execute(s)
+            for serial, key, value in r.fetchall():
+                attributes[serial][key] = value
+            r.close()
+        return [(row[0], tuple(row[1:]), attributes[row[1]]) for row in rows]
+
+    def domain_object_position(self, domain, uuid, paths, cluster=None,
+                               account=None, filters=None, size_range=None,
+                               sort_key=None):
+        """Return the (sort value, path) of the object with the uuid among
+           the objects listed by domain_object_list, or None.
+        """
 
-        group_by = itemgetter(slice(len(props)))
-        rows.sort(key=group_by)
-        groups = groupby(rows, group_by)
-        return [(k[0], k[1:], dict([i[len(props):] for i in data])) for
-                (k, data) in groups]
+        n, v, props, sort_column, s = self._domain_objects(
+            domain, paths, cluster, account, filters, size_range, sort_key)
+        s = s.with_only_columns([sort_column, n.c.path])
+        s = s.where(v.c.uuid == uuid)
+        r = self.conn.execute(s)
+        row = r.fetchone()
+        r.close()
+        return tuple(row) if row else None
 
     def get_props(self, paths):
         inner_join = \
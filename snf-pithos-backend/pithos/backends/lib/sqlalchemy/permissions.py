@@ -14,7 +14,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from sqlalchemy.sql import select, literal, or_, and_
-from sqlalchemy.sql.expression import join, union
+from sqlalchemy.sql.expression import join, outerjoin, union
 
 from xfeatures import XFeatures
 from groups import Groups
@@ -27,6 +27,9 @@ from dbworker import ESCAPE_CHAR
 
 READ = 0
 WRITE = 1
+ACCESS_KEYS = {READ: 'read', WRITE: 'write'}
+# The number of paths whose permissions are fetched at a time.
+ACCESS_BATCH = 1000
 
 
 class Permissions(XFeatures, Groups, Public, Node):
@@ -96,6 +99,23 @@ class Permissions(XFeatures, Groups, Public, Node):
             del(permissions[WRITE])
         return permissions
 
+    def access_get_many(self, paths):
+        """Return a dict mapping the paths that have permissions to their
+           permissions, as returned by access_get."""
+
+        d = {}
+        for i in range(0, len(paths), ACCESS_BATCH):
+            s = select([self.xfeatures.c.path, self.xfeaturevals.c.key,
+                        self.xfeaturevals.c.value],
+                       from_obj=[self.xfeatures.join(self.xfeaturevals)])
+            s = s.where(self.xfeatures.c.path.in_(paths[i:i + ACCESS_BATCH]))
+            r = self.conn.execute(s)
+            for path, key, value in r.fetchall():
+                permissions = d.setdefault(path, defaultdict(list))
+                permissions[ACCESS_KEYS[key]].append(value)
+            r.close()
+        return d
+
     def access_members(self, path):
         feature = self.xfeature_get(path)
         if not feature:
@@ -114,16 +134,20 @@ class Permissions(XFeatures, Groups, Public, Node):
         return list(members)
 
     def access_clear(self, path):
-        """Revoke access to path (both permissions and public)."""
+        """Revoke access to path (both permissions and public).
+           Return true if the path had permissions."""
 
-        self.xfeature_destroy(path)
+        destroyed = self.xfeature_destroy(path)
         self.public_unset(path)
+        return destroyed > 0
 
     def access_clear_bulk(self, paths):
-        """Revoke access to path (both permissions and public)."""
+        """Revoke access to paths (both permissions and public).
+           Return true if any of the paths had permissions."""
 
-        self.xfeature_destroy_bulk(paths)
+        destroyed = self.xfeature_destroy_bulk(paths)
         self.public_unset_bulk(paths)
+        return destroyed > 0
 
     def access_check(self, path, access, member):
         """Return true if the member has this access to the path."""
@@ -244,10 +268,29 @@ class Permissions(XFeatures, Groups, Public, Node):
                                 self.nodes.c.node.in_(container_nodes))
             s = select([self.nodes.c.path], condition)
             r = self.conn.execute(s)
-            l += [row[0] for row in r.fetchall() if row[0] not in l]
+            listed = set(l)
+            l += [row[0] for row in r.fetchall() if row[0] not in listed]
             r.close()
         return l
 
+    def access_list_prefix(self, prefix):
+        """Return a dict mapping the paths starting with prefix that have
+           permissions to their permissions, keyed by READ and WRITE."""
+
+        s = select([self.xfeatures.c.path, self.xfeaturevals.c.key,
+                    self.xfeaturevals.c.value],
+                   from_obj=[outerjoin(self.xfeatures, self.xfeaturevals)])
+        s = s.where(self.xfeatures.c.path.like(
+            self.escape_like(prefix) + '%', escape=ESCAPE_CHAR))
+        r = self.conn.execute(s)
+        d = {}
+        for path, key, value in r.fetchall():
+            permissions = d.setdefault(path, defaultdict(list))
+            if key is not None:
+                permissions[key].append(value)
+        r.close()
+        return d
+
     def access_list_shared(self, prefix=''):
         """Return the list of shared paths."""
 
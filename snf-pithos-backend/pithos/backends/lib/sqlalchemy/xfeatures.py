@@ -114,20 +114,26 @@ class XFeatures(DBWorker):
         return inserted_primary_key
 
     def xfeature_destroy(self, path):
-        """Destroy a feature and all its key, value pairs."""
+        """Destroy a feature and all its key, value pairs.
+           Return the number of features destroyed."""
 
         s = self.xfeatures.delete().where(self.xfeatures.c.path == path)
         r = self.conn.execute(s)
+        destroyed = r.rowcount
         r.close()
+        return destroyed
 
     def xfeature_destroy_bulk(self, paths):
-        """Destroy features and all their key, value pairs."""
+        """Destroy features and all their key, value pairs.
+           Return the number of features destroyed."""
 
         if not paths:
-            return
+            return 0
         s = self.xfeatures.delete().where(self.xfeatures.c.path.in_(paths))
         r = self.conn.execute(s)
+        destroyed = r.rowcount
         r.close()
+        return destroyed
 
     def feature_dict(self, feature):
         """Return a dict mapping keys to list of values for feature."""
@@ -47,3 +47,15 @@ class Config(DBWorker):
         q = "insert into config (key, value) values (?, ?)"
         id = self.execute(q, (key, value)).lastrowid
         return id
+
+    def increment_value(self, key):
+        """Increment the integer configuration entry (initially 0) and
+           return the new value.
+        """
+
+        q = "insert or ignore into config (key, value) values (?, '0')"
+        self.execute(q, (key,))
+        q = ("update config set value = cast(value as integer) + 1 "
+             "where key = ?")
+        self.execute(q, (key,))
+        return int(self.get_value(key))
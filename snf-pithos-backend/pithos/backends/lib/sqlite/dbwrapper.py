@@ -13,27 +13,58 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+
 try:
     from pysqlite2 import dbapi2 as sqlite3
 except ImportError:
     import sqlite3
 
+# Seconds to wait for a lock held by another connection.
+BUSY_TIMEOUT = 30
+# Prepared statements kept by every connection, keyed by their SQL.
+STATEMENT_CACHE_SIZE = 1024
+
 
 class DBWrapper(object):
-    """Database connection wrapper."""
+    """Database connection wrapper.
+
+    Database files are put in write-ahead logging mode, where readers do
+    not block writers and a writer does not block readers, so that the
+    connections of several processes, e.g. gunicorn workers, may use the
+    database concurrently. A connection belongs to the process that opened
+    it and should not be used after a fork.
+    """
 
     def __init__(self, db):
-        self.conn = sqlite3.connect(db, check_same_thread=False)
+        self.pid = os.getpid()
+        self.conn = sqlite3.connect(db, timeout=BUSY_TIMEOUT,
+                                    cached_statements=STATEMENT_CACHE_SIZE,
+                                    check_same_thread=False)
         self.conn.execute(""" pragma case_sensitive_like = on """)
+        if db != ':memory:':
+            self.conn.execute(""" pragma journal_mode = wal """)
+            # Safe in WAL mode, only the last commits may be lost on a
+            # power failure.
+            self.conn.execute(""" pragma synchronous = normal """)
+        self.trans = None
+        self.closed = False
 
     def close(self):
         self.conn.close()
+        self.closed = True
+
+    def in_transaction(self):
+        return self.trans is not None
 
     def execute(self):
         self.conn.execute('begin deferred')
+        self.trans = True
 
     def commit(self):
         self.conn.commit()
+        self.trans = None
 
     def rollback(self):
         self.conn.rollback()
+        self.trans = None
@@ -14,8 +14,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from time import time
-from operator import itemgetter
-from itertools import groupby
 
 from dbworker import DBWorker
 
@@ -23,6 +21,13 @@ from pithos.backends.modular import MAP_AVAILABLE
 from pithos.backends.filter import parse_filters
 
 
+# The version properties domain object listings can be sorted by.
+DOMAIN_SORT_PROPERTIES = ('path', 'uuid', 'size', 'mtime')
+# The number of objects whose attributes are fetched at a time.
+DOMAIN_OBJECTS_BATCH = 500
+# The number of values bound in an IN list at a time. Older SQLite builds
+# allow at most 999 variables in a statement.
+IN_LIST_BATCH = 500
 ROOTNODE = 0
 
 (MATCH_PREFIX, MATCH_EXACT) = range(2)
@@ -80,6 +85,8 @@ class Node(DBWorker):
             setattr(self, p.upper(), self._props[p])
         self.mapfile_prefix = params.pop('mapfile_prefix', 'snf_file_')
         DBWorker.__init__(self, **params)
+        self._statistics_deltas = {}
+        self._parents = {}
         execute = self.execute
 
         execute(""" pragma foreign_keys = on """)
@@ -97,6 +104,8 @@ class Node(DBWorker):
                     on nodes(path) """)
         execute(""" create index if not exists idx_nodes_parent
                     on nodes(parent) """)
+        execute(""" create index if not exists idx_nodes_parent_path
+                    on nodes(parent, path) """)
         execute(""" create index if not exists idx_latest_version
                     on nodes(latest_version) """)
 
@@ -166,6 +175,12 @@ class Node(DBWorker):
         execute(""" create index if not exists idx_attributes_serial_node
                     on attributes(serial, node) """)
 
+        execute(""" create table if not exists checksums
+                          ( hash       text    not null,
+                            size       integer not null,
+                            checksum   text    not null,
+                            primary key (hash, size) ) """)
+
         execute(""" create table if not exists mapfile_seq
                           ( serial    integer primary key,
                             dummy     boolean default -1) """)
@@ -215,6 +230,36 @@ class Node(DBWorker):
             return [row[0] for row in r]
         return None
 
+    def node_lookup_paths(self, paths):
+        """Return a dict mapping the existing paths to their nodes."""
+
+        nodes = {}
+        paths = list(paths)
+        for i in range(0, len(paths), IN_LIST_BATCH):
+            batch = paths[i:i + IN_LIST_BATCH]
+            q = ("select path, node from nodes where path in (%s)" %
+                 ','.join('?' for _ in batch))
+            self.execute(q, batch)
+            nodes.update(self.fetchall())
+        return nodes
+
+    def node_create_many(self, parent, paths):
+        """Return a dict mapping paths to their nodes, creating the nodes
+           of the paths that do not exist under parent.
+        """
+
+        nodes = self.node_lookup_paths(paths)
+        missing = [p for p in paths if p not in nodes]
+        if not missing:
+            return nodes
+        q = "insert or ignore into nodes (parent, path) values (?, ?)"
+        self.executemany(q, ((parent, p) for p in missing))
+        created = self.node_lookup_paths(missing)
+        for node in created.itervalues():
+            self._parents[node] = parent
+        nodes.update(created)
+        return nodes
+
     def node_get_properties(self, node):
         """Return the node's (parent, path).
            Return None if the node is not found.
@@ -289,7 +334,8 @@ class Node(DBWorker):
             return (), 0, ()
         mtime = time()
         self.statistics_update(parent, -nr, -size, mtime, cluster)
-        self.statistics_update_ancestors(parent, -nr, -size, mtime, cluster,
+        # Population isn't recursive
+        self.statistics_update_ancestors(parent, 0, -size, mtime, cluster,
                                          update_statistics_ancestors_depth)
 
         q = ("select hash, serial from versions "
@@ -319,6 +365,52 @@ class Node(DBWorker):
              "where node = n.node) = 0 "
              "and parent = ?)")
         execute(q, (parent,))
+        # The ids of the removed nodes may be reused.
+        self._parents = {}
+        return hashes, size, serials
+
+    def node_purge_children_chunk(self, parent, before=inf, cluster=0,
+                                  limit=1000,
+                                  update_statistics_ancestors_depth=None):
+        """Delete up to limit versions with the specified
+           parent and cluster, oldest first, and return
+           the hashes, the size and the serials of versions deleted.
+           Clears out the nodes of these versions with no remaining versions.
+        """
+
+        execute = self.execute
+        q = ("select serial, node, hash, size from versions "
+             "where node in (select node "
+             "from nodes "
+             "where parent = ?) "
+             "and cluster = ? "
+             "and mtime <= ? "
+             "order by serial "
+             "limit ?")
+        execute(q, (parent, cluster, before, limit))
+        rows = self.fetchall()
+        if not rows:
+            return (), 0, ()
+        serials = [r[0] for r in rows]
+        nodes = set(r[1] for r in rows)
+        hashes = [r[2] for r in rows]
+        size = sum(r[3] for r in rows if r[3])
+        mtime = time()
+        self.statistics_update(parent, -len(serials), -size, mtime, cluster)
+        # Population isn't recursive
+        self.statistics_update_ancestors(parent, 0, -size, mtime, cluster,
+                                         update_statistics_ancestors_depth)
+
+        q = "delete from versions where serial = ?"
+        self.executemany(q, [(s,) for s in serials])
+        q = ("delete from nodes "
+             "where node = ? "
+             "and (select count(serial) "
+             "from versions "
+             "where node = ?) = 0")
+        self.executemany(q, [(n, n) for n in nodes])
+        for node in nodes:
+            self._parents.pop(node, None)
         return hashes, size, serials
 
     def node_purge(self, node, before=inf, cluster=0,
@@ -366,6 +458,7 @@ class Node(DBWorker):
              "where node = n.node) = 0 "
              "and node = ?)")
         execute(q, (node,))
+        self._parents.pop(node, None)
         return hashes, size, serials
 
     def node_remove(self, node, update_statistics_ancestors_depth=None):
@@ -389,8 +482,16 @@ class Node(DBWorker):
 
         q = "delete from nodes where node = ?"
         self.execute(q, (node,))
+        self._parents.pop(node, None)
         return True
 
+    def node_children(self, node):
+        """Return the paths and nodes of node's children."""
+
+        q = ("select path, node from nodes where parent = ? and node != 0 "
+             "order by path")
+        return self.execute(q, (node,)).fetchall()
+
     def node_accounts(self, accounts=()):
         q = ("select path, node from nodes where node != 0 and parent = 0 ")
         args = []
@@ -446,6 +547,7 @@ class Node(DBWorker):
            for all versions under node that belong to the cluster.
         """
 
+        self.statistics_flush()
         q = ("select population, size, mtime from statistics "
              "where node = ? and cluster = ?")
         self.execute(q, (node, cluster))
@@ -456,23 +558,19 @@ class Node(DBWorker):
            Statistics keep track the population, total
            size of objects and mtime in the node's namespace.
            May be zero or positive or negative numbers.
+
+           Updates are merged in memory per node and cluster
+           and written by statistics_flush.
         """
 
-        qs = ("select population, size from statistics "
-              "where node = ? and cluster = ?")
-        qu = ("insert or replace into statistics "
-              "(node, population, size, mtime, cluster) "
-              "values (?, ?, ?, ?, ?)")
-        self.execute(qs, (node, cluster))
-        r = self.fetchone()
-        if r is None:
-            prepopulation, presize = (0, 0)
+        delta = self._statistics_deltas.get((node, cluster))
+        if delta is None:
+            self._statistics_deltas[(node, cluster)] = [population, size,
+                                                        mtime]
         else:
-            prepopulation, presize = r
-        population += prepopulation
-        population = max(population, 0)
-        size += presize
-        self.execute(qu, (node, population, size, mtime, cluster))
+            delta[0] += population
+            delta[1] += size
+            delta[2] = max(delta[2], mtime)
 
     def statistics_update_ancestors(self, node, population, size, mtime,
                                     cluster=0, recursion_depth=None):
@@ -487,15 +585,72 @@ class Node(DBWorker):
                 break
             if recursion_depth is not None and recursion_depth <= i:
                 break
-            props = self.node_get_properties(node)
-            if props is None:
-                break
-            parent, path = props
+            parent = self._parents.get(node)
+            if parent is None:
+                props = self.node_get_properties(node)
+                if props is None:
+                    break
+                parent = self._parents[node] = props[0]
             self.statistics_update(parent, population, size, mtime, cluster)
             node = parent
             population = 0  # Population isn't recursive
             i += 1
 
+    def statistics_flush(self):
+        """Write the pending statistics updates."""
+
+        deltas = self._statistics_deltas
+        if not deltas:
+            return
+        self._statistics_deltas = {}
+        keys = sorted(deltas)
+
+        # Nodes removed in the meantime get no statistics.
+        q = ("insert or ignore into statistics "
+             "(node, population, size, mtime, cluster) "
+             "select node, 0, 0, 0, ? from nodes where node = ?")
+        self.executemany(q, ((cluster, node) for node, cluster in keys))
+        q = ("update statistics "
+             "set population = max(population + ?, 0), "
+             "size = size + ?, mtime = ? "
+             "where node = ? and cluster = ?")
+        self.executemany(q, (tuple(deltas[k]) + k for k in keys))
+
+    def statistics_discard(self):
+        """Forget the pending statistics updates."""
+
+        self._statistics_deltas = {}
+        self._parents = {}
+
+    def statistics_compute(self, node, cluster=0):
+        """Return population, total size and last mtime
+           for all versions under node that belong to the cluster,
+           computed from the versions themselves.
+           This is what statistics_get should return and
+           requires scanning all the nodes under node.
+        """
+
+        props = self.node_get_properties(node)
+        if props is None:
+            return None
+        parent, path = props
+
+        # First level, just under node (get population).
+        q = ("select count(serial) from versions "
+             "where node in (select node from nodes where parent = ?) "
+             "and cluster = ?")
+        self.execute(q, (node, cluster))
+        population = self.fetchone()[0]
+
+        # All children (get size and mtime).
+        q = ("select sum(size), max(mtime) from versions "
+             "where node in (select node from nodes "
+             "where path like ? escape '\\') "
+             "and cluster = ?")
+        self.execute(q, (self.escape_like(path) + '/%', cluster))
+        size, mtime = self.fetchone()
+        return (population, size or 0, mtime or 0)
+
     def statistics_latest(self, node, before=inf, except_cluster=0):
         """Return population, total size and last mtime
            for all latest versions under node that
@@ -606,6 +761,44 @@ class Node(DBWorker):
 
         return serial, mtime, mapfile
 
+    def version_create_many(self, versions,
+                            update_statistics_ancestors_depth=None):
+        """Create new versions and make them the latest versions of their
+           nodes. Versions are dicts with the arguments of version_create,
+           with a mapfile, and at most one per node.
+           Return a dict mapping the nodes to the serials of their new
+           versions.
+        """
+
+        if not versions:
+            return {}
+        q = ("insert into versions (node, hash, size, type, source, mtime, "
+             "muser, uuid, checksum, cluster, available, "
+             "map_check_timestamp, mapfile, is_snapshot) "
+             "values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+        mtime = time()
+        self.executemany(q, ((v['node'], v['hash'], v['size'], v['type'],
+                              v['source'], mtime, v['muser'], v['uuid'],
+                              v['checksum'], v['cluster'], v['available'],
+                              v['map_check_timestamp'],
+                              v['mapfile'] if v['size'] != 0 else None,
+                              v['is_snapshot']) for v in versions))
+        for v in versions:
+            self.statistics_update_ancestors(
+                v['node'], 1, v['size'], mtime, v['cluster'],
+                update_statistics_ancestors_depth)
+
+        # The transaction holds the write lock, so the rows got consecutive
+        # serials, one more than the largest, in the order given.
+        self.execute("select last_insert_rowid()")
+        last = self.fetchone()[0]
+        first = last - len(versions) + 1
+        serials = dict((v['node'], first + i) for i, v in enumerate(versions))
+        q = "update nodes set latest_version = ? where node = ?"
+        self.executemany(q, ((serial, node)
+                             for node, serial in serials.iteritems()))
+        return serials
+
     def version_lookup(self, node, before=inf, cluster=0, all_props=True,
                        keys=()):
         """Lookup the current version of the given node.
@@ -712,6 +905,24 @@ class Node(DBWorker):
         q = "update versions set %s = ? where serial = ?" % key
         self.execute(q, (value, serial))
 
+    def checksum_get(self, hash, size):
+        """Return the checksum of the content with the given hash and size,
+           or None if it is not known.
+        """
+
+        q = "select checksum from checksums where hash = ? and size = ?"
+        self.execute(q, (hash, size))
+        r = self.fetchone()
+        return r[0] if r else None
+
+    def checksum_put(self, hash, size, checksum):
+        """Remember the checksum of the content with the given hash and size.
+        """
+
+        q = ("insert or replace into checksums (hash, size, checksum) "
+             "values (?, ?, ?)")
+        self.execute(q, (hash, size, checksum))
+
     def version_recluster(self, serial, cluster,
                           update_statistics_ancestors_depth=None):
         """Move the version into another cluster."""
@@ -734,6 +945,34 @@ class Node(DBWorker):
         q = "update versions set cluster = ? where serial = ?"
         self.execute(q, (cluster, serial))
 
+    def version_recluster_many(self, serials, cluster,
+                               update_statistics_ancestors_depth=None):
+        """Move the versions into another cluster."""
+
+        rows = []
+        serials = list(serials)
+        for i in range(0, len(serials), IN_LIST_BATCH):
+            batch = serials[i:i + IN_LIST_BATCH]
+            q = ("select serial, node, size, cluster from versions "
+                 "where serial in (%s) and cluster != ?" %
+                 ','.join('?' for _ in batch))
+            self.execute(q, batch + [cluster])
+            rows.extend(self.fetchall())
+        if not rows:
+            return
+
+        mtime = time()
+        for serial, node, size, oldcluster in rows:
+            self.statistics_update_ancestors(
+                node, -1, -size, mtime, oldcluster,
+                update_statistics_ancestors_depth)
+            self.statistics_update_ancestors(
+                node, 1, size, mtime, cluster,
+                update_statistics_ancestors_depth)
+
+        q = "update versions set cluster = ? where serial = ?"
+        self.executemany(q, ((cluster, row[0]) for row in rows))
+
     def version_remove(self, serial, update_statistics_ancestors_depth=None):
         """Remove the serial specified."""
 
@@ -812,9 +1051,8 @@ class Node(DBWorker):
 
         if keys:
             q = ("delete from attributes "
-                 "where serial = ? and domain = ? and key in (%s)" %
-                 ','.join(keys))
-            self.execute(q, (serial, domain))
+                 "where serial = ? and domain = ? and key = ?")
+            self.executemany(q, ((serial, domain, k) for k in keys))
         else:
             q = "delete from attributes where serial = ? and domain = ?"
             self.execute(q, (serial, domain))
@@ -826,11 +1064,58 @@ class Node(DBWorker):
              "where serial = ?")
         self.execute(q, (dest, source))
 
+    def _attribute_copy_domains_query(self, exclude_domain=None,
+                                      src_node=False):
+        q = ("insert or replace into attributes "
+             "(serial, domain, node, is_latest, key, value) "
+             "select ?, domain, ?, 1, key, value from attributes "
+             "where serial = ?")
+        if exclude_domain is not None:
+            q += " and domain != ?"
+        if src_node:
+            q += " and node = ?"
+        return q
+
+    def attribute_copy_domains(self, source, dest, node, exclude_domain=None,
+                               src_node=None):
+        """Copy the attributes of all domains of version source to the new
+           version dest of node, except those of exclude_domain.
+           If src_node is given, copy only the attributes of source
+           belonging to it.
+        """
+
+        q = self._attribute_copy_domains_query(exclude_domain,
+                                               src_node is not None)
+        args = [dest, node, source]
+        if exclude_domain is not None:
+            args.append(exclude_domain)
+        if src_node is not None:
+            args.append(src_node)
+        self.execute(q, args)
+
+    def attribute_copy_domains_many(self, copies):
+        """Copy the attributes of all domains for every (source, dest, node)
+           in copies, as in attribute_copy_domains.
+        """
+
+        q = self._attribute_copy_domains_query()
+        self.executemany(q, ((dest, node, source)
+                             for source, dest, node in copies))
+
     def attribute_unset_is_latest(self, node, exclude):
         q = ("update attributes set is_latest = 0 "
              "where node = ? and serial != ?")
         self.execute(q, (node, exclude))
 
+    def attribute_unset_is_latest_many(self, latest):
+        """Unset is_latest for the attributes of all the versions of each
+           node in latest, a dict mapping nodes to the serials to exclude.
+        """
+
+        q = ("update attributes set is_latest = 0 "
+             "where node = ? and serial != ?")
+        self.executemany(q, latest.iteritems())
+
     def _construct_filters(self, domain, filterq):
         if not domain or not filterq:
             return None, None
@@ -1051,9 +1336,7 @@ class Node(DBWorker):
              "from versions v, nodes n "
              "where v.serial = %s "
              "and v.cluster != ? "
-             "and v.node in (select node "
-             "from nodes "
-             "where parent = ?) "
+             "and n.parent = ? "
              "and n.node = v.node "
              "and n.path > ? and n.path < ?")
         subq, args = self._construct_versions_nodes_latest_version_subquery(
@@ -1108,6 +1391,8 @@ class Node(DBWorker):
             if props is None:
                 break
             path = props[0]
+            if prefixes and path.startswith(prefixes[-1]):
+                continue
             idx = path.find(delimiter, pfz)
 
             if idx < 0:
@@ -1126,7 +1411,8 @@ class Node(DBWorker):
             if count >= limit:
                 break
 
-            args[start_index] = strnextling(pf)  # New start.
+            # Seek past the paths under the common prefix.
+            args[start_index] = strprevling(strnextling(pf))
             execute(q, args)
 
         return matches, prefixes
@@ -1154,37 +1440,116 @@ class Node(DBWorker):
         self.execute(q, args)
         return self.fetchone()
 
-    def domain_object_list(self, domain, paths, cluster=None):
+    def _domain_objects(self, domain, paths, cluster=None, account=None,
+                        filters=None, size_range=None, sort_key=None):
+        """Return the sort column and the query selecting the objects in the
+           domain (without the selected columns) along with its arguments.
+        """
+
+        attribute = ("exists (select serial from attributes "
+                     "where serial = v.serial and domain = ? and "
+                     "is_latest = 1%s) ")
+        q = "from nodes n inner join versions v on v.node = n.node "
+        args = []
+        if sort_key in DOMAIN_SORT_PROPERTIES:
+            sort_column = 'n.path' if sort_key == 'path' else 'v.' + sort_key
+        elif sort_key is not None:
+            q += ("left join attributes sa on sa.serial = v.serial and "
+                  "sa.domain = ? and sa.key = ? ")
+            args += [domain, sort_key]
+            sort_column = "coalesce(sa.value, '')"
+        else:
+            sort_column = 'n.path'
+        q += "where " + attribute % ''
+        args.append(domain)
+        if cluster is not None:
+            q += "and v.cluster = ? "
+            args.append(cluster)
+        scope = []
+        if paths:
+            scope.append("n.path in (%s)" % ','.join('?' for _ in paths))
+            args += paths
+        if account:
+            scope.append("n.path like ? escape '\\'")
+            args.append(self.escape_like(account) + '/%/%')
+        if scope:
+            q += "and (%s) " % ' or '.join(scope)
+        for key, value in (filters or {}).iteritems():
+            q += "and " + attribute % " and key = ? and value = ?"
+            args += [domain, key, value]
+        if size_range:
+            if size_range[0] is not None:
+                q += "and v.size >= ? "
+                args.append(size_range[0])
+            if size_range[1] is not None:
+                q += "and v.size <= ? "
+                args.append(size_range[1])
+        return sort_column, q, args
+
+    def domain_object_list(self, domain, paths, cluster=None, account=None,
+                           filters=None, size_range=None, sort_key=None,
+                           reverse=False, after=None, limit=None):
         """Return a list of (path, property list, attribute dictionary)
            for the objects in the specific domain and cluster.
+
+        Keyword arguments:
+        paths -- return only objects with these paths or, if account is
+                 also given, the objects of the account
+        filters -- dict of attributes the objects must have in the domain
+        size_range -- tuple of the minimum and maximum size
+        sort_key -- order by this property (one of DOMAIN_SORT_PROPERTIES)
+                    or attribute of the domain, and then by path
+        after -- return only objects after this (sort value, path),
+                 as returned by domain_object_position
         """
 
         props = ('n.path', 'v.serial', 'v.node', 'v.hash', 'v.size', 'v.type',
                  'v.source', 'v.mtime', 'v.muser', 'v.uuid', 'v.checksum',
                  'v.cluster', 'v.available', 'v.map_check_timestamp',
                  'v.mapfile', 'v.is_snapshot')
-        cols = list(props) + ['a.key', 'a.value']
-        args = [domain]
-        q = ("select %s from nodes n, versions v, attributes a "
-             "where v.serial = a.serial and "
-             "a.domain = ? and "
-             "a.node = n.node and "
-             "a.is_latest = 1 ") % ','.join(cols)
-        if paths:
-            q += ("and path in (%s) " % ','.join('?' for _ in paths))
-            map(args.append, paths)
-        if cluster is not None:
-            q += "and v.cluster = ?"
-            args += [cluster]
-
+        sort_column, q, args = self._domain_objects(
+            domain, paths, cluster, account, filters, size_range, sort_key)
+        q = "select %s %s" % (','.join(props), q)
+        op, order = ('<', 'desc') if reverse else ('>', 'asc')
+        if after is not None:
+            q += "and (%s %s ? or (%s = ? and n.path %s ?)) " % (
+                sort_column, op, sort_column, op)
+            args += [after[0], after[0], after[1]]
+        q += "order by %s %s, n.path %s" % (sort_column, order, order)
+        if limit is not None:
+            q += " limit ?"
+            args.append(limit)
         self.execute(q, args)
         rows = self.fetchall()
+        if not rows:
+            return []
+
+        # Fetch the attributes of all the objects at once.
+        attributes = dict((row[1], {}) for row in rows)
+        serials = attributes.keys()
+        for i in range(0, len(serials), DOMAIN_OBJECTS_BATCH):
+            batch = serials[i:i + DOMAIN_OBJECTS_BATCH]
+            q = ("select serial, key, value from attributes "
+                 "where serial in (%s) and domain = ? and is_latest = 1" %
+                 ','.join('?' for _ in batch))
+            self.execute(q, batch + [domain])
+            for serial, key, value in self.fetchall():
+                attributes[serial][key] = value
+        return [(row[0], tuple(row[1:]), attributes[row[1]]) for row in rows]
+
+    def domain_object_position(self, domain, uuid, paths, cluster=None,
+                               account=None, filters=None, size_range=None,
+                               sort_key=None):
+        """Return the (sort value, path) of the object with the uuid among
+           the objects listed by domain_object_list, or None.
+        """
 
-        group_by = itemgetter(slice(len(props)))
-        rows.sort(key=group_by)
-        groups = groupby(rows, group_by)
-        return [(k[0], k[1:], dict([i[len(props):] for i in data])) for
-                (k, data) in groups]
+        sort_column, q, args = self._domain_objects(
+            domain, paths, cluster, account, filters, size_range, sort_key)
+        q = "select %s, n.path %s and v.uuid = ?" % (sort_column, q)
+        self.execute(q, args + [uuid])
+        row = self.fetchone()
+        return tuple(row) if row else None
 
     def get_props(self, paths):
         q = ("select distinct n.path, v.type "
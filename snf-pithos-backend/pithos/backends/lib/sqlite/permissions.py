@@ -22,6 +22,9 @@ from collections import defaultdict
 
 READ = 0
 WRITE = 1
+ACCESS_KEYS = {READ: 'read', WRITE: 'write'}
+# The number of paths whose permissions are fetched at a time.
+ACCESS_BATCH = 500
 
 
 class Permissions(XFeatures, Groups, Public, Node):
@@ -92,6 +95,23 @@ class Permissions(XFeatures, Groups, Public, Node):
             del(permissions[WRITE])
         return permissions
 
+    def access_get_many(self, paths):
+        """Return a dict mapping the paths that have permissions to their
+           permissions, as returned by access_get."""
+
+        d = {}
+        for i in range(0, len(paths), ACCESS_BATCH):
+            batch = paths[i:i + ACCESS_BATCH]
+            q = ("select x.path, xvals.key, xvals.value "
+                 "from xfeaturevals xvals join xfeatures x "
+                 "on xvals.feature_id = x.feature_id "
+                 "where x.path in (%s)") % ','.join('?' for _ in batch)
+            self.execute(q, batch)
+            for path, key, value in self.fetchall():
+                permissions = d.setdefault(path, defaultdict(list))
+                permissions[ACCESS_KEYS[key]].append(value)
+        return d
+
     def access_members(self, path):
         feature = self.xfeature_get(path)
         if not feature:
@@ -110,16 +130,20 @@ class Permissions(XFeatures, Groups, Public, Node):
         return members
 
     def access_clear(self, path):
-        """Revoke access to path (both permissions and public)."""
+        """Revoke access to path (both permissions and public).
+           Return true if the path had permissions."""
 
-        self.xfeature_destroy(path)
+        destroyed = self.xfeature_destroy(path)
         self.public_unset(path)
+        return destroyed > 0
 
     def access_clear_bulk(self, paths):
-        """Revoke access to path (both permissions and public)."""
+        """Revoke access to paths (both permissions and public).
+           Return true if any of the paths had permissions."""
 
-        self.xfeature_destroy_bulk(paths)
+        destroyed = self.xfeature_destroy_bulk(paths)
         self.public_unset_bulk(paths)
+        return destroyed > 0
 
     def access_check(self, path, access, member):
         """Return true if the member has this access to the path."""
@@ -224,9 +248,24 @@ class Permissions(XFeatures, Groups, Public, Node):
                 q += ("or node in (%s)" % select_containers)
                 args += [node]
             self.execute(q, args)
-            l += [r[0] for r in self.fetchall() if r[0] not in l]
+            listed = set(l)
+            l += [r[0] for r in self.fetchall() if r[0] not in listed]
         return l
 
+    def access_list_prefix(self, prefix):
+        """Return a dict mapping the paths starting with prefix that have
+           permissions to their permissions, keyed by READ and WRITE."""
+
+        q = ("select path, key, value from xfeatures left join xfeaturevals "
+             "using (feature_id) where path like ? escape '\\'")
+        self.execute(q, (self.escape_like(prefix) + '%',))
+        d = {}
+        for path, key, value in self.fetchall():
+            permissions = d.setdefault(path, defaultdict(list))
+            if key is not None:
+                permissions[key].append(value)
+        return d
+
     def access_list_shared(self, prefix=''):
         """Return the list of shared paths."""
 
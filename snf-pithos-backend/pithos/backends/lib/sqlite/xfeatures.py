@@ -90,17 +90,19 @@ class XFeatures(DBWorker):
         return id
 
     def xfeature_destroy(self, path):
-        """Destroy a feature and all its key, value pairs."""
+        """Destroy a feature and all its key, value pairs.
+           Return the number of features destroyed."""
 
         q = "delete from xfeatures where path = ?"
-        self.execute(q, (path,))
+        return self.execute(q, (path,)).rowcount
 
     def xfeature_destroy_bulk(self, paths):
-        """Destroy features and all their key, value pairs."""
+        """Destroy features and all their key, value pairs.
+           Return the number of features destroyed."""
 
         placeholders = ','.join('?' for path in paths)
         q = "delete from xfeatures where path in (%s)" % placeholders
-        self.execute(q, paths)
+        return self.execute(q, paths).rowcount
 
     def feature_dict(self, feature):
         """Return a dict mapping keys to list of values for feature."""
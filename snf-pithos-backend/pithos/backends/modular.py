@@ -16,7 +16,6 @@
 import sys
 import uuid as uuidlib
 import logging
-import hashlib
 import binascii
 
 from collections import defaultdict, OrderedDict
@@ -33,6 +32,11 @@ try:
 except ImportError:
     AstakosClient = None
 
+from pithos.backends.acl import (AccessTrie, NO_ACCESS, user_access,
+                                  get_acl_cache)
+from pithos.backends.blockcache import get_block_cache
+from pithos.backends.commissions import get_commission_resolver
+from synnefo.lib.merkle import MerkleTree, get_merkle_tree_cache
 from pithos.backends.exceptions import (
     NotAllowedError, QuotaError,
     AccountExists, ContainerExists, AccountNotEmpty,
@@ -61,25 +65,8 @@ class HashMap(list):
         self.blocksize = blocksize
         self.blockhash = blockhash
 
-    def _hash_raw(self, v):
-        h = hashlib.new(self.blockhash)
-        h.update(v)
-        return h.digest()
-
     def hash(self):
-        if len(self) == 0:
-            return self._hash_raw('')
-        if len(self) == 1:
-            return self.__getitem__(0)
-
-        h = list(self)
-        s = 2
-        while s < len(h):
-            s = s * 2
-        h += [('\x00' * len(h[0]))] * (s - len(h))
-        while len(h) > 1:
-            h = [self._hash_raw(h[x] + h[x + 1]) for x in range(0, len(h), 2)]
-        return h[0]
+        return MerkleTree(self.blockhash, self).root()
 
 # Default modules and settings.
 DEFAULT_DB_MODULE = 'pithos.backends.lib.sqlalchemy'
@@ -87,6 +74,14 @@ DEFAULT_DB_CONNECTION = 'sqlite:///backend.db'
 DEFAULT_BLOCK_MODULE = 'pithos.backends.lib.hashfiler'
 DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024  # 4MB
 DEFAULT_HASH_ALGORITHM = 'sha256'
+DEFAULT_BLOCK_CACHE_PATH = '/dev/shm/pithos-block-cache'
+DEFAULT_MERKLE_CACHE_SIZE = 65536  # Block hashes.
+DEFAULT_COMMISSION_BATCH_SIZE = 1000  # Serials.
+DEFAULT_ACL_CACHE_SIZE = 10000  # (user, account) pairs.
+DEFAULT_TREE_CHUNK_SIZE = 1000  # Objects.
+
+# The config entry counting the changes to permissions and groups.
+ACL_VERSION_KEY = 'xfeature_version'
 
 # Default setting for new accounts.
 DEFAULT_ACCOUNT_QUOTA = 0  # No quota.
@@ -247,7 +242,13 @@ class ModularBackend(object):
                  mapfile_prefix=DEFAULT_MAPFILE_PREFIX,
                  resource_max_metadata=DEFAULT_RESOURCE_MAX_METADATA,
                  acc_max_groups=DEFAULT_ACC_MAX_GROUPS,
-                 acc_max_group_members=DEFAULT_ACC_MAX_GROUP_MEMBERS):
+                 acc_max_group_members=DEFAULT_ACC_MAX_GROUP_MEMBERS,
+                 block_cache_path=DEFAULT_BLOCK_CACHE_PATH,
+                 block_cache_size=0,
+                 merkle_cache_size=DEFAULT_MERKLE_CACHE_SIZE,
+                 async_commissions=False,
+                 commission_batch_size=DEFAULT_COMMISSION_BATCH_SIZE,
+                 acl_cache_size=DEFAULT_ACL_CACHE_SIZE):
 
         not_nullable = ('block_size', 'hash_algorithm',
                         'public_url_security', 'public_url_alphabet',
@@ -303,12 +304,15 @@ class ModularBackend(object):
 
         self.ALLOWED = ['read', 'write']
 
-        glue.WorkerGlue.setupXsegPool(ObjectPool, Segment, Xseg_ctx,
-                                      cfile=archipelago_conf_file,
-                                      pool_size=xseg_pool_size)
+        self.block_module = load_module(block_module)
+        # Block modules that do not use Archipelago (e.g. the local file
+        # store) opt out of the xseg context pool.
+        if getattr(self.block_module, 'USES_XSEG', True):
+            glue.WorkerGlue.setupXsegPool(ObjectPool, Segment, Xseg_ctx,
+                                          cfile=archipelago_conf_file,
+                                          pool_size=xseg_pool_size)
 
         self.ioctx_pool = glue.WorkerGlue.ioctx_pool
-        self.block_module = load_module(block_module)
         self.block_params = block_params
         params = {'block_size': self.block_size,
                   'hash_algorithm': self.hash_algorithm,
@@ -317,6 +321,22 @@ class ModularBackend(object):
             params.update(block_params)
         self.store = self.block_module.Store(**params)
 
+        self.block_cache = None
+        if block_cache_size:
+            self.block_cache = get_block_cache(block_cache_path,
+                                               block_cache_size,
+                                               self.block_size)
+
+        self.merkle_cache = None
+        if merkle_cache_size:
+            self.merkle_cache = get_merkle_tree_cache(merkle_cache_size)
+
+        self.acl_cache = None
+        if acl_cache_size:
+            self.acl_cache = get_acl_cache(db_connection, acl_cache_size)
+        self._acl_version = None
+        self._acl_changed_in_transaction = False
+
         self.astakos_auth_url = astakos_auth_url
         self.service_token = service_token
 
@@ -331,6 +351,12 @@ class ModularBackend(object):
                 use_pool=True,
                 pool_size=astakosclient_poolsize)
 
+        self.commission_resolver = None
+        if async_commissions and self.using_external_quotaholder:
+            self.commission_resolver = get_commission_resolver(
+                self.db_module, db_connection, self.astakosclient,
+                commission_batch_size)
+
         self.serials = []
 
         self._move_object = partial(self._copy_object, is_move=True)
@@ -351,37 +377,59 @@ class ModularBackend(object):
         self.wrapper.execute()
         self.serials = []
         self._reset_allowed_paths()
+        self._acl_version = None
+        self._acl_changed_in_transaction = False
         self.in_transaction = True
 
     def post_exec(self, success_status=True):
         if success_status:
+            try:
+                self.node.statistics_flush()
+            except:
+                # Nothing has been committed yet, so end the transaction as
+                # a failed one.
+                self.post_exec(False)
+                raise
+
             # register serials
             if self.serials:
                 self.commission_serials.insert_many(
                     self.serials)
 
-                # commit to ensure that the serials are registered
-                # even if resolve commission fails
-                self.wrapper.commit()
+                if self.commission_resolver is None:
+                    # commit to ensure that the serials are registered
+                    # even if resolve commission fails
+                    self.wrapper.commit()
 
-                # start new transaction
-                self.wrapper.execute()
+                    # start new transaction
+                    self.wrapper.execute()
 
-                r = self.astakosclient.resolve_commissions(
-                    accept_serials=self.serials,
-                    reject_serials=[])
-                self.commission_serials.delete_many(
-                    r['accepted'])
+                    r = self.astakosclient.resolve_commissions(
+                        accept_serials=self.serials,
+                        reject_serials=[])
+                    self.commission_serials.delete_many(
+                        r['accepted'])
 
             self.wrapper.commit()
+
+            # the serials are registered along with the changes they
+            # account for, so they can be accepted in the background
+            if self.commission_resolver is not None:
+                self.commission_resolver.accept(self.serials)
         else:
             if self.serials:
-                r = self.astakosclient.resolve_commissions(
-                    accept_serials=[],
-                    reject_serials=self.serials)
-                self.commission_serials.delete_many(
-                    r['rejected'])
+                if self.commission_resolver is not None:
+                    self.commission_resolver.reject(self.serials)
+                else:
+                    r = self.astakosclient.resolve_commissions(
+                        accept_serials=[],
+                        reject_serials=self.serials)
+                    self.commission_serials.delete_many(
+                        r['rejected'])
             self.wrapper.rollback()
+        self.node.statistics_discard()
+        self._acl_version = None
+        self._acl_changed_in_transaction = False
         self.in_transaction = False
 
     def close(self):
@@ -435,13 +483,13 @@ class ModularBackend(object):
         except NameError:
             props = None
             mtime = until
-        count, bytes, tstamp = self._get_statistics(node, until, compute=True)
+        count, bytes, tstamp = self._get_statistics(node, until)
         tstamp = max(tstamp, mtime)
         if until is None:
             modified = tstamp
         else:
             modified = self._get_statistics(
-                node, compute=True)[2]  # Overall last modification.
+                node)[2]  # Overall last modification.
             modified = max(modified, mtime)
 
         if user != account:
@@ -538,6 +586,7 @@ class ModularBackend(object):
 
         self.permissions.group_destroy(account)
         self.permissions.group_addmany(account, groups)
+        self._acl_changed()
 
     @debug_method
     @backend_method
@@ -622,6 +671,7 @@ class ModularBackend(object):
                                      update_statistics_ancestors_depth=-1):
             raise AccountNotEmpty("Account is not empty")
         self.permissions.group_destroy(account)
+        self._acl_changed()
 
         # remove all the cached allowed paths
         # removing the specific path could be more expensive
@@ -762,13 +812,13 @@ class ModularBackend(object):
         path, node = self._lookup_container(account, container)
         src_version_id, dest_version_id = self._put_metadata(
             user, node, domain, meta, replace,
-            update_statistics_ancestors_depth=0)
+            update_statistics_ancestors_depth=1)
         if src_version_id is not None:
             versioning = self._get_policy(
                 node, is_account_policy=False)[VERSIONING_POLICY]
             if versioning != 'auto':
                 self.node.version_remove(src_version_id,
-                                         update_statistics_ancestors_depth=0)
+                                         update_statistics_ancestors_depth=1)
 
     @debug_method
     @backend_method
@@ -846,7 +896,7 @@ class ModularBackend(object):
         path = '/'.join((account, container))
         node = self._put_path(
             user, self._lookup_account(account, True)[1], path,
-            update_statistics_ancestors_depth=-1)
+            update_statistics_ancestors_depth=1)
         self._put_policy(node, policy, True, is_account_policy=False,
                          default_project=account,
                          check=True if policy else False)
@@ -874,11 +924,11 @@ class ModularBackend(object):
         if until is not None:
             hashes, size, _ = self.node.node_purge_children(
                 node, until, CLUSTER_HISTORY,
-                update_statistics_ancestors_depth=0)
+                update_statistics_ancestors_depth=1)
             for h in hashes:
                 self.store.map_delete(h)
             self.node.node_purge_children(node, until, CLUSTER_DELETED,
-                                          update_statistics_ancestors_depth=0)
+                                          update_statistics_ancestors_depth=1)
             if not self.free_versioning:
                 self._report_size_change(
                     user, account, -size, project, name=path)
@@ -889,12 +939,12 @@ class ModularBackend(object):
                 raise ContainerNotEmpty("Container is not empty")
             hashes, size, _ = self.node.node_purge_children(
                 node, inf, CLUSTER_HISTORY,
-                update_statistics_ancestors_depth=0)
+                update_statistics_ancestors_depth=1)
             for h in hashes:
                 self.store.map_delete(h)
             self.node.node_purge_children(node, inf, CLUSTER_DELETED,
-                                          update_statistics_ancestors_depth=0)
-            self.node.node_remove(node, update_statistics_ancestors_depth=0)
+                                          update_statistics_ancestors_depth=1)
+            self.node.node_remove(node, update_statistics_ancestors_depth=1)
             if not self.free_versioning:
                 self._report_size_change(
                     user, account, -size, project, name=path)
@@ -921,6 +971,110 @@ class ModularBackend(object):
         # removing the specific path could be more expensive
         self._reset_allowed_paths()
 
+    @debug_method
+    def purge_container(self, user, account, container, until=None,
+                        chunk_size=DEFAULT_TREE_CHUNK_SIZE):
+        """Purge a container in chunks.
+
+        If until is not None, purge the history of the objects up to until.
+        Otherwise, delete all the objects, purge their history and remove
+        the container.
+
+        Unlike delete_container, every chunk of objects or versions is
+        processed in a transaction of its own, with one size change
+        reported to the quotaholder. If a chunk fails, the chunks before
+        it stay purged, so an interrupted purge may be resumed by
+        repeating it.
+
+        This is a generator that yields (objects deleted, versions purged)
+        after each chunk is committed. It cannot be used inside another
+        transaction of the backend.
+
+        Raises:
+            NotAllowedError: Operation not permitted
+            ItemNotExists: Container does not exist
+            ContainerNotEmpty: Objects were added while purging
+        """
+
+        if user != account:
+            raise NotAllowedError
+
+        objects = []
+        if until is None:
+            success_status = False
+            self.pre_exec()
+            try:
+                self._can_write_container(user, account, container)
+                objects = self._list_objects_no_limit(
+                    user, account, container, prefix='', delimiter=None,
+                    virtual=False, domain=None, keys=[], shared=False,
+                    until=None, size_range=None, all_props=True,
+                    public=False)
+                success_status = True
+            finally:
+                self.post_exec(success_status)
+
+        deleted = 0
+        for i in xrange(0, len(objects), chunk_size):
+            chunk = objects[i:i + chunk_size]
+            success_status = False
+            self.pre_exec(lock_container_path=True)
+            try:
+                path, node = self._lookup_container(account, container)
+                # Objects deleted meanwhile are skipped.
+                props = dict((p[self.NODE], p) for p in
+                             self._get_versions([x[2] for x in chunk]))
+                existing = [('/'.join((path, x[0])), props[x[2]])
+                            for x in chunk if x[2] in props]
+                freed_space = self._delete_objects_bulk(user, node, existing)
+                self._report_size_change(user, account, -freed_space,
+                                         self._get_project(node), name=path)
+                success_status = True
+            finally:
+                self.post_exec(success_status)
+            deleted += len(existing)
+            yield deleted, 0
+
+        purged = 0
+        for cluster in (CLUSTER_HISTORY, CLUSTER_DELETED):
+            while True:
+                success_status = False
+                self.pre_exec(lock_container_path=True)
+                try:
+                    path, node = self._lookup_container(account, container)
+                    hashes, size, serials = \
+                        self.node.node_purge_children_chunk(
+                            node, until if until is not None else inf,
+                            cluster, chunk_size,
+                            update_statistics_ancestors_depth=1)
+                    for h in hashes:
+                        self.store.map_delete(h)
+                    if cluster == CLUSTER_HISTORY and \
+                            not self.free_versioning:
+                        self._report_size_change(
+                            user, account, -size, self._get_project(node),
+                            name=path)
+                    success_status = True
+                finally:
+                    self.post_exec(success_status)
+                if not serials:
+                    break
+                purged += len(serials)
+                yield deleted, purged
+
+        if until is None:
+            success_status = False
+            self.pre_exec(lock_container_path=True)
+            try:
+                path, node = self._lookup_container(account, container)
+                if self._get_statistics(node)[0] > 0:
+                    raise ContainerNotEmpty("Container is not empty")
+                self.node.node_remove(node,
+                                      update_statistics_ancestors_depth=1)
+                success_status = True
+            finally:
+                self.post_exec(success_status)
+
     def _list_objects(self, user, account, container, prefix, delimiter,
                       marker, limit, virtual, domain, keys, shared, until,
                       size_range, all_props, public):
@@ -1216,11 +1370,11 @@ class ModularBackend(object):
                                          lock_container=True)
         src_version_id, dest_version_id = self._put_metadata(
             user, node, domain, meta, replace,
-            update_statistics_ancestors_depth=1)
+            update_statistics_ancestors_depth=2)
         self._copy_metadata(src_version_id, dest_version_id, node,
                             exclude_domain=domain, src_node=node)
         self._apply_versioning(account, container, src_version_id,
-                               update_statistics_ancestors_depth=1)
+                               update_statistics_ancestors_depth=2)
         return dest_version_id
 
     @debug_method
@@ -1311,6 +1465,7 @@ class ModularBackend(object):
             self.permissions.access_set(path, permissions)
         except:
             raise ValueError("Invalid users/groups in permissions")
+        self._acl_changed()
 
         # remove all the cached allowed paths
         # filtering out only those affected could be more expensive
@@ -1378,6 +1533,7 @@ class ModularBackend(object):
             # Raising an exception results in db transaction rollback
             # However we have to force the update of the database
             self.wrapper.rollback()  # rollback existing transaction
+            self.node.statistics_discard()
             self.wrapper.execute()  # start new transaction
             self.node.version_put_property(props[self.SERIAL],
                                            'map_check_timestamp', time())
@@ -1422,18 +1578,11 @@ class ModularBackend(object):
 
     def _copy_metadata(self, src_version, dest_version, dest_node,
                        exclude_domain, src_node=None):
-        domains = self.node.attribute_get_domains(src_version,
-                                                  node=src_node)
-        try:
-            domains.remove(exclude_domain)
-        except ValueError:  # domain is not in the list
-            pass
-
-        for d in domains:
-            existing = dict(self.node.attribute_get(src_version, d))
-            self._put_metadata_duplicate(
-                src_version, dest_version, d, dest_node, meta=existing,
-                replace=True)
+        # All domains are copied at once. Their number of items has been
+        # checked when they were set.
+        self.node.attribute_copy_domains(src_version, dest_version, dest_node,
+                                         exclude_domain=exclude_domain,
+                                         src_node=src_node)
 
     def _update_object_hash(self, user, account, container, name, size, type,
                             hash, checksum, domain, meta, replace_meta,
@@ -1460,7 +1609,7 @@ class ModularBackend(object):
         pre_version_id, dest_version_id, mapfile = self._put_version_duplicate(
             user, node, src_node=src_node, size=size, type=type, hash=hash,
             checksum=checksum, is_copy=is_copy,
-            update_statistics_ancestors_depth=1,
+            update_statistics_ancestors_depth=2,
             available=available, keep_available=keep_available,
             force_mapfile=force_mapfile, is_snapshot=is_snapshot)
 
@@ -1473,41 +1622,44 @@ class ModularBackend(object):
             src_version_id, dest_version_id, domain, node, meta, replace_meta)
 
         del_size = self._apply_versioning(account, container, pre_version_id,
-                                          update_statistics_ancestors_depth=1)
+                                          update_statistics_ancestors_depth=2)
         size_delta = size - del_size
         if size_delta > 0:
-            # Check account quota.
-            if not self.using_external_quotaholder:
-                account_quota = long(self._get_policy(
-                    account_node, is_account_policy=True)[QUOTA_POLICY])
-                account_usage = self._get_statistics(account_node,
-                                                     compute=True)[1]
-                if (account_quota > 0 and account_usage > account_quota):
-                    raise QuotaError(
-                        'Account quota exceeded: limit: %s, usage: %s' % (
-                            account_quota, account_usage))
-
-            # Check container quota.
-            container_quota = long(self._get_policy(
-                container_node, is_account_policy=False)[QUOTA_POLICY])
-            container_usage = self._get_statistics(container_node)[1]
-            if (container_quota > 0 and container_usage > container_quota):
-                # This must be executed in a transaction, so the version is
-                # never created if it fails.
-                raise QuotaError(
-                    'Container quota exceeded: limit: %s, usage: %s' % (
-                        container_quota, container_usage
-                    )
-                )
+            self._check_quota(account_node, container_node)
 
         if report_size_change:
             self._report_size_change(
                 user, account, size_delta, project, name=path)
         if permissions is not None:
             self.permissions.access_set(path, permissions)
+            self._acl_changed()
 
         return dest_version_id, size_delta, mapfile
 
+    def _check_quota(self, account_node, container_node):
+        # Check account quota.
+        if not self.using_external_quotaholder:
+            account_quota = long(self._get_policy(
+                account_node, is_account_policy=True)[QUOTA_POLICY])
+            account_usage = self._get_statistics(account_node)[1]
+            if (account_quota > 0 and account_usage > account_quota):
+                raise QuotaError(
+                    'Account quota exceeded: limit: %s, usage: %s' % (
+                        account_quota, account_usage))
+
+        # Check container quota.
+        container_quota = long(self._get_policy(
+            container_node, is_account_policy=False)[QUOTA_POLICY])
+        container_usage = self._get_statistics(container_node)[1]
+        if (container_quota > 0 and container_usage > container_quota):
+            # This must be executed in a transaction, so the version is
+            # never created if it fails.
+            raise QuotaError(
+                'Container quota exceeded: limit: %s, usage: %s' % (
+                    container_quota, container_usage
+                )
+            )
+
     @debug_method
     @backend_method
     def register_object_map(self, user, account, container, name, size, type,
@@ -1592,6 +1744,7 @@ class ModularBackend(object):
                 "The object's size does not match "
                 "with the object's hashmap length")
 
+        base_hash = None
         try:
             path, node = self._lookup_object(account, container, name,
                                              lock_container=True)
@@ -1606,6 +1759,7 @@ class ModularBackend(object):
                 if props[self.IS_SNAPSHOT]:
                     raise IllegalOperationError(
                         'Cannot update Archipelago volume hashmap.')
+                base_hash = props[self.HASH]
         meta = meta or {}
         if size == 0:  # No such thing as an empty hashmap.
             hashmap = [self.put_block('')]
@@ -1617,7 +1771,7 @@ class ModularBackend(object):
             ie.data = [binascii.hexlify(x) for x in missing]
             raise ie
 
-        hash_ = map_.hash()
+        hash_ = self._hashmap_tree(map_, base=base_hash).root()
         hexlified = binascii.hexlify(hash_)
         # _update_object_hash() locks destination path
         dest_version_id, _, mapfile = self._update_object_hash(
@@ -1627,6 +1781,16 @@ class ModularBackend(object):
             self.store.map_put(mapfile, hashmap, size, self.block_size)
         return dest_version_id, hexlified
 
+    @debug_method
+    @backend_method
+    def lookup_object_checksum(self, hash, size):
+        """Return the checksum of the objects with the given hash and size.
+
+        Return '' if no such object has a checksum.
+        """
+
+        return self.node.checksum_get(hash, size) or ''
+
     @debug_method
     @backend_method
     def update_object_checksum(self, user, account, container, name, version,
@@ -1639,6 +1803,7 @@ class ModularBackend(object):
         path, node = self._lookup_object(account, container, name,
                                          lock_container=True)
         props = self._get_version(node, version)
+        self.node.checksum_put(props[self.HASH], props[self.SIZE], checksum)
         versions = self.node.node_get_versions(node)
         for x in versions:
             if (x[self.SERIAL] >= int(version) and
@@ -1660,19 +1825,9 @@ class ModularBackend(object):
         occupied_space = 0
         self._can_read_object(user, src_account, src_container, src_name)
 
-        src_container_path = '/'.join((src_account, src_container))
         dest_container_path = '/'.join((dest_account, dest_container))
-        # Lock container paths in alphabetical order
-        if src_container_path < dest_container_path:
-            src_container_node = self._lookup_container(src_account,
-                                                        src_container)[-1]
-            dest_container_node = self._lookup_container(dest_account,
-                                                         dest_container)[-1]
-        else:
-            dest_container_node = self._lookup_container(dest_account,
-                                                         dest_container)[-1]
-            src_container_node = self._lookup_container(src_account,
-                                                        src_container)[-1]
+        src_container_node, dest_container_node = self._lock_containers(
+            src_account, src_container, dest_account, dest_container)
 
         cross_account = src_account != dest_account
         cross_container = src_container != dest_container
@@ -1739,32 +1894,18 @@ class ModularBackend(object):
             freed_space += del_size
 
         if delimiter:
-            prefix = (src_name + delimiter if not
-                      src_name.endswith(delimiter) else src_name)
-            src_names = self._list_objects_no_limit(
-                user, src_account, src_container, prefix, delimiter=None,
-                virtual=False, domain=None, keys=[], shared=False, until=None,
-                size_range=None, all_props=True, public=False,
-                listing_limit=listing_limit)
-            src_names.sort(key=lambda x: x[2])  # order by nodes
-            paths = [elem[0] for elem in src_names]
-            nodes = [elem[2] for elem in src_names]
-            # TODO: Will do another fetch of the properties
-            # in duplicate version...
-            props = self._get_versions(nodes)
-
-            for prop, vsrc_name, node in zip(props, paths, nodes):
-                dest_prefix = (dest_name + delimiter if not
-                               dest_name.endswith(delimiter) else dest_name)
-                _version_id = prop[self.SERIAL]
-                _type = prop[self.TYPE]
-                _dest_name = vsrc_name.replace(prefix, dest_prefix, 1)
-                serials, size_delta, del_size = self._copy_object(
-                    user, src_account, src_container, vsrc_name,
-                    dest_account, dest_container, _dest_name, _type,
-                    src_version=_version_id, is_move=is_move,
-                    delimiter=None,
-                    report_size_change=(not bulk_report_size_change))
+            # The objects under the folder are copied in chunks.
+            objects = self._list_tree(user, src_account, src_container,
+                                      src_name, dest_name, delimiter,
+                                      listing_limit=listing_limit)
+            dest_obj_path = '/'.join((dest_container_path, dest_name))
+            for i in xrange(0, len(objects), DEFAULT_TREE_CHUNK_SIZE):
+                serials, size_delta, del_size = self._copy_objects_bulk(
+                    user, src_account, src_container,
+                    dest_account, dest_container,
+                    objects[i:i + DEFAULT_TREE_CHUNK_SIZE], is_move,
+                    report_size_change=(not bulk_report_size_change),
+                    name=dest_obj_path)
                 dest_versions.extend(serials)
                 occupied_space += size_delta
                 freed_space += del_size
@@ -1778,6 +1919,163 @@ class ModularBackend(object):
                 name=dest_obj_path)
         return dest_versions, occupied_space, freed_space
 
+    def _lock_containers(self, src_account, src_container, dest_account,
+                         dest_container):
+        """Return the nodes of the source and destination containers,
+        locking their paths in alphabetical order.
+        """
+
+        src_container_path = '/'.join((src_account, src_container))
+        dest_container_path = '/'.join((dest_account, dest_container))
+        if src_container_path < dest_container_path:
+            src_container_node = self._lookup_container(src_account,
+                                                        src_container)[-1]
+            dest_container_node = self._lookup_container(dest_account,
+                                                         dest_container)[-1]
+        else:
+            dest_container_node = self._lookup_container(dest_account,
+                                                         dest_container)[-1]
+            src_container_node = self._lookup_container(src_account,
+                                                        src_container)[-1]
+        return src_container_node, dest_container_node
+
+    def _list_tree(self, user, account, container, name, dest_name,
+                   delimiter, listing_limit=10000):
+        """Return (name, destination name, node) for the objects whose
+        path starts with name + delimiter, to be copied under dest_name.
+        """
+
+        prefix = name + delimiter if not name.endswith(delimiter) else name
+        dest_prefix = (dest_name + delimiter if not
+                       dest_name.endswith(delimiter) else dest_name)
+        objects = self._list_objects_no_limit(
+            user, account, container, prefix, delimiter=None,
+            virtual=False, domain=None, keys=[], shared=False, until=None,
+            size_range=None, all_props=True, public=False,
+            listing_limit=listing_limit)
+        return [(x[0], x[0].replace(prefix, dest_prefix, 1), x[2])
+                for x in objects]
+
+    def _copy_objects_bulk(self, user, src_account, src_container,
+                           dest_account, dest_container, objects, is_move,
+                           report_size_change=True, name=''):
+        """Copy or move objects between containers with set-based queries.
+
+        Objects are (source name, destination name, source node), with
+        distinct destinations. Objects deleted meanwhile are skipped.
+        The nodes, versions and attributes of the destinations are created
+        with a few statements for all objects, and the new versions share
+        the mapfiles of the sources. The quotas are checked and the size
+        changes are reported to the quotaholder once for all objects.
+
+        Return (destination versions, occupied space, freed space).
+        """
+
+        src_container_node, dest_container_node = self._lock_containers(
+            src_account, src_container, dest_account, dest_container)
+        props = dict((p[self.NODE], p) for p in
+                     self._get_versions([o[2] for o in objects]))
+        objects = [o for o in objects if o[2] in props]
+        if not objects:
+            return [], 0, 0
+        for src_name, dest_name, _ in objects:
+            self._can_read_object(user, src_account, src_container, src_name)
+            self._can_write_object(user, dest_account, dest_container,
+                                   dest_name)
+
+        src_container_path = '/'.join((src_account, src_container))
+        dest_container_path = '/'.join((dest_account, dest_container))
+        dest_paths = ['/'.join((dest_container_path, o[1])) for o in objects]
+        dest_nodes = self.node.node_create_many(dest_container_node,
+                                                dest_paths)
+
+        # The current versions of the destinations become history.
+        replaced = list(self._get_versions(dest_nodes.values()))
+        self.node.version_recluster_many(
+            [p[self.SERIAL] for p in replaced], CLUSTER_HISTORY,
+            update_statistics_ancestors_depth=2)
+
+        versions = []
+        moved = []
+        for (src_name, _, node), dest_path in zip(objects, dest_paths):
+            p = props[node]
+            src_path = '/'.join((src_container_path, src_name))
+            is_copy = not is_move and src_path != dest_path  # New uuid.
+            if is_copy and p[self.AVAILABLE] != MAP_AVAILABLE:
+                raise NotAllowedError("Copying objects not available in the "
+                                      "storage backend is forbidden.")
+            versions.append({
+                'node': dest_nodes[dest_path], 'hash': p[self.HASH],
+                'size': p[self.SIZE], 'type': p[self.TYPE],
+                'source': p[self.SERIAL], 'muser': user,
+                'uuid': self._generate_uuid() if is_copy else p[self.UUID],
+                'checksum': p[self.CHECKSUM], 'cluster': CLUSTER_NORMAL,
+                'available': p[self.AVAILABLE],
+                'map_check_timestamp': p[self.MAP_CHECK_TIMESTAMP],
+                'mapfile': p[self.MAPFILE],
+                'is_snapshot': p[self.IS_SNAPSHOT]})
+            if is_move and src_path != dest_path:
+                moved.append((src_path, p))
+        serials = self.node.version_create_many(
+            versions, update_statistics_ancestors_depth=2)
+        self.node.attribute_unset_is_latest_many(serials)
+        self.node.attribute_copy_domains_many(
+            [(v['source'], serials[v['node']], v['node']) for v in versions])
+        occupied_space = sum(v['size'] for v in versions)
+        occupied_space -= self._apply_versioning_bulk(dest_container_node,
+                                                      replaced)
+
+        # Sources that are also destinations have just been replaced.
+        moved = [(path, p) for path, p in moved if p[self.NODE] not in serials]
+        freed_space = self._delete_objects_bulk(user, src_container_node,
+                                                moved)
+
+        if occupied_space > 0:
+            account_node = self._lookup_account(dest_account, True)[1]
+            self._check_quota(account_node, dest_container_node)
+        if report_size_change:
+            src_project = self._get_project(src_container_node)
+            dest_project = self._get_project(dest_container_node)
+            if (src_account, src_project) == (dest_account, dest_project):
+                self._report_size_change(user, dest_account,
+                                         occupied_space - freed_space,
+                                         dest_project, name=name)
+            else:
+                self._report_size_change(user, dest_account, occupied_space,
+                                         dest_project, name=name)
+                self._report_size_change(user, src_account, -freed_space,
+                                         src_project, name=name)
+        return ([serials[v['node']] for v in versions], occupied_space,
+                freed_space)
+
+    def _delete_objects_bulk(self, user, container_node, objects):
+        """Delete objects of a container with set-based queries.
+
+        Objects are (path, properties of the current version). Return the
+        size freed.
+        """
+
+        if not objects:
+            return 0
+        self.node.version_recluster_many(
+            [p[self.SERIAL] for _, p in objects], CLUSTER_HISTORY,
+            update_statistics_ancestors_depth=2)
+        deleted = self.node.version_create_many(
+            [{'node': p[self.NODE], 'hash': None, 'size': 0, 'type': '',
+              'source': p[self.SERIAL], 'muser': user,
+              'uuid': p[self.UUID], 'checksum': '',
+              'cluster': CLUSTER_DELETED, 'available': p[self.AVAILABLE],
+              'map_check_timestamp': p[self.MAP_CHECK_TIMESTAMP],
+              'mapfile': None, 'is_snapshot': p[self.IS_SNAPSHOT]}
+             for _, p in objects],
+            update_statistics_ancestors_depth=2)
+        self.node.attribute_unset_is_latest_many(deleted)
+        freed_space = self._apply_versioning_bulk(
+            container_node, [p for _, p in objects])
+        if self.permissions.access_clear_bulk([path for path, _ in objects]):
+            self._acl_changed()
+        return freed_space
+
     @debug_method
     @backend_method
     def copy_object(self, user, src_account, src_container, src_name,
@@ -1848,6 +2146,63 @@ class ModularBackend(object):
             listing_limit=listing_limit)
         return dest_version_id
 
+    @debug_method
+    def copy_tree(self, user, src_account, src_container, src_name,
+                  dest_account, dest_container, dest_name, is_move=False,
+                  delimiter='/', chunk_size=DEFAULT_TREE_CHUNK_SIZE):
+        """Copy or move an object and the objects under it, in chunks.
+
+        Unlike copy_object and move_object with a delimiter, every chunk of
+        objects is copied in a transaction of its own, with one size change
+        reported to the quotaholder. If a chunk fails, the chunks before it
+        stay copied, so an interrupted move may be resumed by repeating it.
+
+        This is a generator that yields (objects copied, total objects)
+        after each chunk is committed. It cannot be used inside another
+        transaction of the backend.
+
+        Raises:
+            NotAllowedError: Operation not permitted
+            ItemNotExists: Container does not exist
+            QuotaError: Account or container quota exceeded
+        """
+
+        if is_move and user != src_account:
+            raise NotAllowedError
+
+        success_status = False
+        self.pre_exec()
+        try:
+            self._lookup_container(dest_account, dest_container)
+            objects = []
+            try:
+                node = self._lookup_object(src_account, src_container,
+                                           src_name)[1]
+            except ItemNotExists:
+                pass
+            else:
+                objects.append((src_name, dest_name, node))
+            objects += self._list_tree(user, src_account, src_container,
+                                       src_name, dest_name, delimiter)
+            success_status = True
+        finally:
+            self.post_exec(success_status)
+
+        name = '/'.join((dest_account, dest_container, dest_name))
+        total = len(objects)
+        for i in xrange(0, total, chunk_size):
+            chunk = objects[i:i + chunk_size]
+            success_status = False
+            self.pre_exec(lock_container_path=True)
+            try:
+                self._copy_objects_bulk(user, src_account, src_container,
+                                        dest_account, dest_container, chunk,
+                                        is_move, name=name)
+                success_status = True
+            finally:
+                self.post_exec(success_status)
+            yield i + len(chunk), total
+
     def _delete_object(self, user, account, container, name, until=None,
                        delimiter=None, report_size_change=True,
                        listing_limit=None):
@@ -1866,22 +2221,23 @@ class ModularBackend(object):
             hashes = []
             size = 0
             h, s, _ = self.node.node_purge(node, until, CLUSTER_NORMAL,
-                                           update_statistics_ancestors_depth=1)
+                                           update_statistics_ancestors_depth=2)
             hashes += h
             size += s
             h, s, _ = self.node.node_purge(node, until, CLUSTER_HISTORY,
-                                           update_statistics_ancestors_depth=1)
+                                           update_statistics_ancestors_depth=2)
             hashes += h
             if not self.free_versioning:
                 size += s
             for h in hashes:
                 self.store.map_delete(h)
             self.node.node_purge(node, until, CLUSTER_DELETED,
-                                 update_statistics_ancestors_depth=1)
+                                 update_statistics_ancestors_depth=2)
             try:
                 self._get_version(node)
             except NameError:
-                self.permissions.access_clear(path)
+                if self.permissions.access_clear(path):
+                    self._acl_changed()
             self._report_size_change(
                 user, account, -size, project, name=path)
             return size
@@ -1893,11 +2249,11 @@ class ModularBackend(object):
         # in case we will want to delete them in the future
         src_version_id, dest_version_id, _ = self._put_version_duplicate(
             user, node, size=0, type='', hash=None, checksum='',
-            cluster=CLUSTER_DELETED, update_statistics_ancestors_depth=1,
+            cluster=CLUSTER_DELETED, update_statistics_ancestors_depth=2,
             keep_src_mapfile=True)
         freed_space = self._apply_versioning(
             account, container, src_version_id,
-            update_statistics_ancestors_depth=1)
+            update_statistics_ancestors_depth=2)
         paths = [path]
 
         if delimiter:
@@ -1914,7 +2270,8 @@ class ModularBackend(object):
                                                report_size_change=False)
                 freed_space += del_size
                 paths.append(path)
-        self.permissions.access_clear_bulk(paths)
+        if self.permissions.access_clear_bulk(paths):
+            self._acl_changed()
 
         if report_size_change:
             path = '/'.join([account, container, name])
@@ -2072,11 +2429,88 @@ class ModularBackend(object):
         """
 
         logger.debug("get_block: %s", hash)
+        key = None
+        if self.block_cache is not None:
+            try:
+                key = binascii.unhexlify(hash)
+            except TypeError:
+                # Archipelago block names need not be hex hashes. Such
+                # blocks are read without the cache.
+                pass
+        if key is not None:
+            block = self.block_cache.get(key)
+            if block is not None:
+                return block
         block = self.store.block_get_archipelago(hash)
         if not block:
             raise ItemNotExists("Block does not exist")
+        if key is not None:
+            self.block_cache.put(key, block)
         return block
 
+    def get_block_cache_stats(self):
+        """Return the block cache counters, or None if there is no cache."""
+
+        if self.block_cache is None:
+            return None
+        return self.block_cache.stats()
+
+    @debug_method
+    @backend_method
+    def reconcile_statistics(self, accounts=(), fix=False):
+        """Check the statistics of the accounts and their containers.
+
+        The statistics kept for each account and container are compared to
+        the ones computed from the versions under it. Return a list of
+        (path, cluster, (population, size), (actual population, size)) for
+        the statistics found out of sync and fix them if requested.
+        """
+
+        unsynced = []
+        for account_path, account_node in self.node.node_accounts(accounts):
+            nodes = list(self.node.node_children(account_node))
+            nodes.append((account_path, account_node))
+            for path, node in nodes:
+                for cluster in (CLUSTER_NORMAL, CLUSTER_HISTORY,
+                                CLUSTER_DELETED):
+                    stats = self.node.statistics_get(node, cluster)
+                    population, size, mtime = stats or (0, 0, 0)
+                    actual = self.node.statistics_compute(node, cluster)
+                    if actual is None:
+                        continue
+                    if (population, size) == actual[:2]:
+                        continue
+                    unsynced.append((path, cluster, (population, size),
+                                     actual[:2]))
+                    if fix:
+                        self.node.statistics_update(
+                            node, actual[0] - population, actual[1] - size,
+                            max(mtime, actual[2]), cluster)
+        return unsynced
+
+    def _hashmap_tree(self, hashmap, base=None):
+        """Return the Merkle tree of a (binary) hashmap.
+
+        If the tree with top hash 'base' (e.g. the one of the current
+        version of the object) is cached, only the hashes that differ from
+        it are rehashed.
+        """
+
+        if self.merkle_cache is None:
+            return MerkleTree(self.hash_algorithm, hashmap)
+        tree = None
+        if base:
+            try:
+                tree = self.merkle_cache.get(self._unhexlify_hash(base))
+            except InvalidHash:
+                pass
+        if tree is None:
+            tree = MerkleTree(self.hash_algorithm, hashmap)
+        else:
+            tree.update_leaves(hashmap)
+        self.merkle_cache.put(tree)
+        return tree
+
     def put_block(self, data):
         """Store a block and return the hash."""
 
@@ -2177,14 +2611,16 @@ class ModularBackend(object):
             raise ItemNotExists("Path does not exist")
         return props
 
-    def _get_statistics(self, node, until=None, compute=False):
-        """Return (count, sum of size, timestamp) of everything under node."""
+    def _get_statistics(self, node, until=None):
+        """Return (count, sum of size, timestamp) of everything under node.
+
+        The current statistics of accounts and containers are kept up to date
+        along with their contents, so only statistics in the past need to be
+        computed.
+        """
 
         if until is not None:
             stats = self.node.statistics_latest(node, until, CLUSTER_DELETED)
-        elif compute:
-            stats = self.node.statistics_latest(node,
-                                                except_cluster=CLUSTER_DELETED)
         else:
             stats = self.node.statistics_get(node, CLUSTER_NORMAL)
         if stats is None:
@@ -2274,6 +2710,11 @@ class ModularBackend(object):
             type = src_type
         if checksum is None:
             checksum = src_checksum
+        elif checksum and hash is not None:
+            self.node.checksum_put(hash, size, checksum)
+        if not checksum and hash is not None:
+            # Reuse the checksum of another object with the same content.
+            checksum = self.node.checksum_get(hash, size) or ''
         uuid = self._generate_uuid(
         ) if (is_copy or src_version_id is None) else props[self.UUID]
 
@@ -2484,6 +2925,24 @@ class ModularBackend(object):
                 version_id, keys=('size',))[0]
         return 0
 
+    def _apply_versioning_bulk(self, container_node, versions):
+        """Delete the provided versions, given by their properties, if such
+           is the policy. Return the size of the objects removed.
+        """
+
+        if not versions:
+            return 0
+        versioning = self._get_policy(
+            container_node, is_account_policy=False)[VERSIONING_POLICY]
+        if versioning != 'auto':
+            for props in versions:
+                hash, _ = self.node.version_remove(
+                    props[self.SERIAL], update_statistics_ancestors_depth=2)
+                self.store.map_delete(hash)
+        elif not self.free_versioning:
+            return 0
+        return sum(props[self.SIZE] for props in versions)
+
     # Access control functions.
 
     def _check_account(self, user):
@@ -2519,11 +2978,13 @@ class ModularBackend(object):
                 formatted.append((prop[0], self.MATCH_EXACT))
         return formatted
 
-    def _get_permissions_path(self, account, container, name):
+    def _get_permissions_path(self, account, container, name,
+                              permission_paths=None):
         path = '/'.join((account, container, name))
-        permission_paths = self.permissions.access_inherit(path)
-        permission_paths.sort()
-        permission_paths.reverse()
+        if permission_paths is None:
+            permission_paths = self.permissions.access_inherit(path)
+            permission_paths.sort()
+            permission_paths.reverse()
         for p in permission_paths:
             if p == path:
                 return p
@@ -2572,6 +3033,57 @@ class ModularBackend(object):
 
         return None
 
+    def _acl_changed(self):
+        """Invalidate the cached access of users to shared paths."""
+
+        if self.acl_cache is not None:
+            self.config.increment_value(ACL_VERSION_KEY)
+            # The new version is not committed yet: do not cache anything
+            # under it, in case the transaction is rolled back.
+            self._acl_changed_in_transaction = True
+
+    def _get_access_trie(self, user, account):
+        """Return the AccessTrie of user for the shared paths of account.
+
+        Return None if the cache is disabled.
+        """
+
+        if self.acl_cache is None:
+            return None
+        cached = not self._acl_changed_in_transaction
+        if cached:
+            # Read the version before loading the permissions, so that a
+            # trie is never stamped with a version newer than its contents.
+            if self._acl_version is None:
+                self._acl_version = int(
+                    self.config.get_value(ACL_VERSION_KEY) or 0)
+            trie = self.acl_cache.get((user, account), self._acl_version)
+            if trie is not None:
+                return trie
+        groups = set(owner + ':' + group for owner, group in
+                     self.permissions.group_parents(user))
+        shared = self.permissions.access_list_prefix(account + '/')
+        trie = AccessTrie(
+            (path, user_access(permissions, user, groups,
+                               self.READ, self.WRITE))
+            for path, permissions in shared.iteritems())
+        if cached:
+            self.acl_cache.put((user, account), self._acl_version, trie)
+        return trie
+
+    def _get_object_access(self, user, account, container, name):
+        """Return the path granting access to the object and the access
+           of user to it, using the cached permissions.
+        """
+
+        trie = self._get_access_trie(user, account)
+        shared = trie.inherit('/'.join((account, container, name)))
+        if not shared:
+            return None, NO_ACCESS
+        path = self._get_permissions_path(account, container, name,
+                                          [p for p, _ in shared])
+        return path, dict(shared).get(path, NO_ACCESS)
+
     def _reset_allowed_paths(self):
         self.read_allowed_paths = defaultdict(set)
         self.write_allowed_paths = defaultdict(set)
@@ -2609,6 +3121,19 @@ class ModularBackend(object):
     def _can_read_object(self, user, account, container, name):
         if user == account:
             return
+        if self.acl_cache is not None:
+            path, access = self._get_object_access(user, account, container,
+                                                   name)
+            if access != NO_ACCESS:
+                return
+            if self.permissions.public_get(
+                    '/'.join((account, container, name))) is not None:
+                return
+            if not path:
+                raise NotAllowedError(
+                    "User does not have access to the object")
+            raise NotAllowedError("User does not have read access "
+                                  "to the object")
         path = '/'.join((account, container, name))
         if self.permissions.public_get(path) is not None:
             return
@@ -2624,7 +3149,16 @@ class ModularBackend(object):
     def _can_write_object(self, user, account, container, name):
         if user == account:
             return
-        path = '/'.join((account, container, name))
+        if self.acl_cache is not None:
+            path, access = self._get_object_access(user, account, container,
+                                                   name)
+            if not path:
+                raise NotAllowedError(
+                    "User does not have access to the object")
+            if access != self.WRITE:
+                raise NotAllowedError("User does not have write access "
+                                      "to the object")
+            return
         path = self._get_permissions_path(account, container, name)
         if not path:
             raise NotAllowedError("User does not have access to the object")
@@ -2652,23 +3186,36 @@ class ModularBackend(object):
 
     @debug_method
     @backend_method
-    def get_domain_objects(self, domain, user=None, check_permissions=True):
+    def get_domain_objects(self, domain, user=None, check_permissions=True,
+                           filters=None, size_range=None, sort_key=None,
+                           reverse=False, marker=None, limit=None):
         """List objects having metadata in the specific domain
 
            If user is provided list only objects accessible to the user.
            Otherwise list all the objects for the specific domain
            ignoring permissions (check_permissions should be False)
 
+           Keyword arguments:
+               'filters': Dict of metadata the objects must have
+                          in the domain
+               'size_range': Tuple of the minimum and maximum object size
+                             (None for no limit)
+               'sort_key': Order the objects by 'path', 'uuid', 'size',
+                           'mtime' or by a metadata key of the domain,
+                           and then by path
+               'reverse': Order the objects in descending order
+               'marker': List the objects after the object with this uuid
+               'limit': Number of objects to return
+
            Raises:
-               NotAllowedError: if check_permissions is True and user has not
-                                access to the object
-               AssertionError: if check_permissions is True but user
+               ItemNotExists: if the marker is not among the objects listed
+               AssertionError: if check_permissions is False but user
                                is provided
         """
         if check_permissions:
-            allowed_paths = self.permissions.access_list_paths(
-                user, include_owned=user is not None, include_containers=False)
-            if not allowed_paths:
+            # Shared objects, along with the objects of the user.
+            allowed_paths = self.permissions.access_list_paths(user)
+            if not allowed_paths and user is None:
                 return []
         else:
             if user is not None:
@@ -2676,11 +3223,21 @@ class ModularBackend(object):
                                      'if user is provided '
                                      'permission check should be enforced.')
             allowed_paths = None
-        obj_list = self.node.domain_object_list(
-            domain, allowed_paths, CLUSTER_NORMAL)
+        args = (domain, allowed_paths, CLUSTER_NORMAL, user, filters,
+                size_range, sort_key)
+        after = None
+        if marker is not None:
+            after = self.node.domain_object_position(domain, marker,
+                                                     *args[1:])
+            if after is None:
+                raise ItemNotExists('Marker does not exist')
+        obj_list = self.node.domain_object_list(*args, reverse=reverse,
+                                                after=after, limit=limit)
+        permissions = self.permissions.access_get_many(
+            [path for path, _, _ in obj_list])
         return [(path,
                  self._build_metadata(props, user_defined_meta),
-                 self.permissions.access_get(path)) for
+                 permissions.get(path, {})) for
                 path, props, user_defined_meta in obj_list]
 
     # util functions
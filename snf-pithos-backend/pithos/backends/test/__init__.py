@@ -13,7 +13,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from pithos.backends.test import common, quota, uuid_methods, snapshots
+from pithos.backends.test import (common, quota, uuid_methods, snapshots,
+                                  checksums, listing, statistics,
+                                  permissions, metadata)
+from pithos.backends.test.filestore import TestFileStore
+from pithos.backends.test.archipelagoblocker import TestArchipelagoBlocker
+from pithos.backends.test.blockcache import TestBlockCache
+from pithos.backends.test.merkle import TestMerkleTree
+from pithos.backends.test.commissions import TestCommissionResolver
+from pithos.backends.test.dbwrapper import TestSQLiteWrapper
 
 from sqlalchemy import create_engine
 
@@ -22,7 +30,12 @@ import time
 
 
 class TestSQLAlchemyBackend(common.CommonMixin, uuid_methods.TestUUIDMixin,
-                            quota.TestQuotaMixin, snapshots.TestSnapshotsMixin):
+                            quota.TestQuotaMixin, snapshots.TestSnapshotsMixin,
+                            checksums.TestChecksumsMixin,
+                            listing.TestListingMixin,
+                            statistics.TestStatisticsMixin,
+                            permissions.TestPermissionsMixin,
+                            metadata.TestMetadataMixin):
     db_module = 'pithos.backends.lib.sqlalchemy'
     db_connection_str = \
         '%(scheme)s://%(user)s:%(pwd)s@%(host)s:%(port)s/%(name)s'
@@ -60,7 +73,12 @@ class TestSQLAlchemyBackend(common.CommonMixin, uuid_methods.TestUUIDMixin,
 
 
 class TestSQLiteBackend(common.CommonMixin, uuid_methods.TestUUIDMixin,
-                        quota.TestQuotaMixin, snapshots.TestSnapshotsMixin):
+                        quota.TestQuotaMixin, snapshots.TestSnapshotsMixin,
+                        checksums.TestChecksumsMixin,
+                        listing.TestListingMixin,
+                        statistics.TestStatisticsMixin,
+                        permissions.TestPermissionsMixin,
+                        metadata.TestMetadataMixin):
     db_module = 'pithos.backends.lib.sqlite'
     db_connection = location = '/tmp/test_pithos_backend.db'
     mapfile_prefix = 'snf_test_pithos_backend_sqlite_%s_' % \
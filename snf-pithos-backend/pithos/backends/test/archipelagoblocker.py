@@ -0,0 +1,140 @@
+# Copyright (C) 2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+from binascii import hexlify
+
+from mock import MagicMock, patch
+
+from pithos.backends.lib.hashfiler import archipelagoblocker
+from pithos.backends.lib.hashfiler.archipelagoblocker import \
+    ArchipelagoBlocker
+
+
+class FakeRequest(object):
+    """An xseg request that records the calls made to it."""
+
+    def __init__(self, requests, name, fail=False, fail_submit=False):
+        self.name = name
+        self.fail = fail
+        self.fail_submit = fail_submit
+        self.submitted = False
+        self.waited = False
+        self.put_back = False
+        requests.append(self)
+
+    def submit(self):
+        if self.fail_submit:
+            raise IOError("Cannot submit request")
+        self.submitted = True
+
+    def wait(self):
+        assert self.submitted
+        self.waited = True
+
+    def success(self):
+        return not self.fail
+
+    def get_data(self, _type=None):
+        return self.name
+
+    def put(self):
+        assert not self.submitted or self.waited, \
+            "Request %s put back in flight" % self.name
+        self.put_back = True
+
+
+class TestArchipelagoBlocker(unittest.TestCase):
+    block_size = 16
+
+    def setUp(self):
+        fd, self.cfile = tempfile.mkstemp(prefix='snf_test_archipelago_')
+        os.write(fd, "[mapperd]\nblockerb_port = 1\n")
+        os.close(fd)
+        self.requests = []
+        self.failing = set()
+        self.failing_submit = set()
+
+        def get_request(ioctx, port, name, size=None):
+            return FakeRequest(self.requests, name,
+                               fail=name in self.failing,
+                               fail_submit=name in self.failing_submit)
+
+        request = MagicMock()
+        request.get_info_request.side_effect = get_request
+        request.get_read_request.side_effect = get_request
+        patches = [
+            patch.object(archipelagoblocker.glue.WorkerGlue, 'ioctx_pool',
+                         MagicMock(), create=True),
+            patch.object(archipelagoblocker, 'Request', request),
+            patch.object(archipelagoblocker, 'string_at',
+                         lambda data, size: data),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.blocker = ArchipelagoBlocker(archipelago_cfile=self.cfile,
+                                          blocksize=self.block_size,
+                                          hashtype='sha256',
+                                          queue_depth=4)
+
+    def tearDown(self):
+        os.remove(self.cfile)
+
+    def assertAllPutBack(self):
+        self.assertTrue(self.requests)
+        for req in self.requests:
+            self.assertTrue(req.put_back, "Request %s leaked" % req.name)
+
+    def test_block_retr(self):
+        hashes = [self.blocker.block_hash(str(i)) for i in range(6)]
+        blocks = self.blocker.block_retr(hashes)
+        self.assertEqual(len(blocks), 6)
+        self.assertEqual(blocks[0].rstrip('\x00'), hexlify(hashes[0]))
+        self.assertAllPutBack()
+
+    def test_block_retr_early_return(self):
+        hashes = [self.blocker.block_hash(str(i)) for i in range(4)]
+        self.failing.add(hexlify(hashes[1]))
+        blocks = self.blocker.block_retr(hashes)
+        self.assertEqual(len(blocks), 1)
+        # The requests submitted after the failed one are waited on before
+        # being put back.
+        self.assertAllPutBack()
+        self.assertTrue(all(req.waited for req in self.requests))
+
+    def test_block_retr_submit_error(self):
+        hashes = [self.blocker.block_hash(str(i)) for i in range(4)]
+        self.failing_submit.add(hexlify(hashes[2]))
+        self.assertRaises(IOError, self.blocker.block_retr, hashes)
+        self.assertEqual(len(self.requests), 3)
+        self.assertAllPutBack()
+
+    def test_block_retr_archipelago_error(self):
+        names = [hexlify(self.blocker.block_hash(str(i))) for i in range(4)]
+        self.failing.add(names[0])
+        self.assertRaises(Exception, self.blocker.block_retr_archipelago,
+                          names)
+        self.assertEqual(len(self.requests), 4)
+        self.assertAllPutBack()
+
+    def test_block_ping(self):
+        hashes = [self.blocker.block_hash(str(i)) for i in range(6)]
+        self.failing.add(hexlify(hashes[3]))
+        self.assertEqual(self.blocker.block_ping(hashes + hashes),
+                         [hashes[3]])
+        self.assertAllPutBack()
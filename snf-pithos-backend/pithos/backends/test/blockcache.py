@@ -0,0 +1,131 @@
+# Copyright (C) 2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import hashlib
+import tempfile
+import unittest
+
+from mock import patch
+
+from pithos.backends.blockcache import BlockCache
+from pithos.backends.test.util import get_random_data
+
+
+class TestBlockCache(unittest.TestCase):
+    block_size = 1024
+    ways = 2
+    nslots = 4
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(prefix='snf_test_block_cache_')
+        os.close(fd)
+        self.cache = self._new_cache()
+
+    def tearDown(self):
+        self.cache.close()
+        os.remove(self.path)
+
+    def _new_cache(self):
+        return BlockCache(self.path, self.nslots * self.block_size,
+                          self.block_size, ways=self.ways)
+
+    def _block(self):
+        data = get_random_data(self.block_size)
+        return hashlib.sha256(data).digest(), data
+
+    def test_admission_on_second_miss(self):
+        key, data = self._block()
+        self.assertEqual(self.cache.get(key), None)
+        self.assertFalse(self.cache.put(key, data))
+        self.assertEqual(self.cache.get(key), None)
+        self.assertTrue(self.cache.put(key, data))
+        self.assertEqual(self.cache.get(key), data)
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['hit_bytes'], self.block_size)
+        self.assertEqual(stats['admissions'], 1)
+        self.assertEqual(stats['capacity'], self.nslots * self.block_size)
+
+    def test_shared_between_instances(self):
+        key, data = self._block()
+        self.cache.put(key, data)
+        self.cache.put(key, data)
+        other = self._new_cache()
+        try:
+            self.assertEqual(other.get(key), data)
+            self.assertEqual(other.stats()['hits'], 1)
+        finally:
+            other.close()
+
+    def test_eviction(self):
+        blocks = [self._block() for _ in range(self.nslots * 4)]
+        for key, data in blocks:
+            self.cache.put(key, data)
+            self.cache.put(key, data)
+        cached = [k for k, d in blocks if self.cache.get(k) is not None]
+        per_set = {}
+        for k, d in blocks:
+            s = self.cache._set_of(k)
+            per_set[s] = min(per_set.get(s, 0) + 1, self.ways)
+        self.assertEqual(len(cached), sum(per_set.values()))
+        self.assertTrue(self.cache.stats()['evictions'] > 0)
+
+    def test_geometry_change(self):
+        key, data = self._block()
+        self.cache.put(key, data)
+        self.cache.put(key, data)
+        old_size = os.path.getsize(self.path)
+        other = BlockCache(self.path, self.nslots * self.block_size * 2,
+                           self.block_size, ways=self.ways)
+        try:
+            # The file mapped by the old cache is replaced, not truncated.
+            self.assertEqual(self.cache.get(key), data)
+            self.assertEqual(os.fstat(self.cache.fd).st_size, old_size)
+            self.assertEqual(other.get(key), None)
+            self.assertTrue(os.path.getsize(self.path) > old_size)
+        finally:
+            other.close()
+
+    def test_replaced_after_open(self):
+        # A process that opened the file before another one replaced it must
+        # use the new file instead of replacing it again.
+        stale_fd = os.open(self.path, os.O_RDWR)
+        size = self.nslots * self.block_size * 2
+        other = BlockCache(self.path, size, self.block_size, ways=self.ways)
+        ino = os.stat(self.path).st_ino
+        fds = [stale_fd]
+        real_open = os.open
+
+        def open_(*args):
+            return fds.pop() if fds else real_open(*args)
+
+        try:
+            with patch('pithos.backends.blockcache.os.open', open_):
+                late = BlockCache(self.path, size, self.block_size,
+                                  ways=self.ways)
+            try:
+                self.assertEqual(os.stat(self.path).st_ino, ino)
+                self.assertEqual(os.fstat(late.fd).st_ino, ino)
+                key, data = self._block()
+                other.put(key, data)
+                other.put(key, data)
+                self.assertEqual(late.get(key), data)
+            finally:
+                late.close()
+        finally:
+            other.close()
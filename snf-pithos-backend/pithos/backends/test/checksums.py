@@ -0,0 +1,65 @@
+# Copyright (C) 2014 GRNET S.A.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from pithos.backends.test.util import get_random_data, get_random_name
+
+
+class TestChecksumsMixin(object):
+    def _upload(self, container, data, checksum=''):
+        obj = get_random_name()
+        t = self.account, self.account, container, obj
+        hashmap = [self.b.put_block(data)]
+        self.b.update_object_hashmap(*t, size=len(data), type='',
+                                     hashmap=hashmap, checksum=checksum,
+                                     domain='pithos')
+        return t
+
+    def _checksum(self, t):
+        return self.b.get_object_meta(*t, include_user_defined=False)[
+            'checksum']
+
+    def test_reuse_checksum(self):
+        container = get_random_name()
+        self.b.put_container(self.account, self.account, container)
+        data = get_random_data(100)
+
+        t1 = self._upload(container, data)
+        self.assertEqual(self._checksum(t1), '')
+        meta = self.b.get_object_meta(*t1, include_user_defined=False)
+        self.assertEqual(self.b.lookup_object_checksum(meta['hash'], 100), '')
+
+        self.b.update_object_checksum(*t1, version=meta['version'],
+                                      checksum='abc')
+        self.assertEqual(self._checksum(t1), 'abc')
+        self.assertEqual(self.b.lookup_object_checksum(meta['hash'], 100),
+                         'abc')
+
+        # Objects with the same content get the known checksum.
+        t2 = self._upload(container, data)
+        self.assertEqual(self._checksum(t2), 'abc')
+
+        # Objects with a different size do not.
+        self.assertEqual(self.b.lookup_object_checksum(meta['hash'], 99), '')
+        t3 = self._upload(container, data + '\x00')
+        self.assertEqual(self._checksum(t3), '')
+
+    def test_register_checksum_on_upload(self):
+        container = get_random_name()
+        self.b.put_container(self.account, self.account, container)
+        data = get_random_data(100)
+
+        self._upload(container, data, checksum='def')
+        t = self._upload(container, data)
+        self.assertEqual(self._checksum(t), 'def')
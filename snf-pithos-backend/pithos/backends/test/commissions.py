@@ -0,0 +1,96 @@
+# Copyright (C) 2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import threading
+import unittest
+
+from mock import MagicMock
+
+from pithos.backends.lib import sqlite
+from pithos.backends.commissions import CommissionResolver
+
+
+def _resolve(accept_serials, reject_serials):
+    return {'accepted': accept_serials, 'rejected': reject_serials,
+            'failed': []}
+
+
+class TestCommissionResolver(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(prefix='snf_test_commissions_')
+        os.close(fd)
+        self.wrapper = sqlite.DBWrapper(self.path)
+        self.serials = sqlite.QuotaholderSerial(wrapper=self.wrapper)
+        self.astakosclient = MagicMock()
+        self.astakosclient.resolve_commissions.side_effect = _resolve
+
+    def tearDown(self):
+        self.wrapper.close()
+        os.remove(self.path)
+
+    def _register(self, serials):
+        self.wrapper.execute()
+        self.serials.insert_many(serials)
+        self.wrapper.commit()
+
+    def _resolver(self, batch_size=100):
+        return CommissionResolver(sqlite, self.path, self.astakosclient,
+                                  batch_size)
+
+    def test_batches(self):
+        self._register(range(1, 11))
+        # Keep the worker busy so that the serials queue up behind it.
+        started, release = threading.Event(), threading.Event()
+
+        def block(accept_serials, reject_serials):
+            started.set()
+            release.wait()
+            return _resolve(accept_serials, reject_serials)
+        self.astakosclient.resolve_commissions.side_effect = block
+
+        resolver = self._resolver(batch_size=4)
+        resolver.accept([1])
+        started.wait()
+        self.astakosclient.resolve_commissions.side_effect = _resolve
+        for serial in range(2, 11):
+            resolver.accept([serial])
+        resolver.reject([11])
+        release.set()
+        resolver.flush()
+
+        resolve_commissions = self.astakosclient.resolve_commissions
+        calls = [(c[1]['accept_serials'], c[1]['reject_serials'])
+                 for c in resolve_commissions.call_args_list]
+        self.assertEqual(calls, [([1], []),
+                                 ([2, 3, 4, 5], []),
+                                 ([6, 7, 8, 9], []),
+                                 ([10], [11])])
+        self.assertEqual(self.serials.lookup(range(1, 12)), [])
+
+    def test_failure_keeps_serials_registered(self):
+        self._register([1, 2])
+        self.astakosclient.resolve_commissions.side_effect = Exception()
+        resolver = self._resolver()
+        resolver.accept([1, 2])
+        resolver.flush()
+        self.assertEqual(sorted(self.serials.lookup([1, 2])), [1, 2])
+
+        # The worker survives the failure.
+        self.astakosclient.resolve_commissions.side_effect = _resolve
+        resolver.accept([1, 2])
+        resolver.flush()
+        self.assertEqual(self.serials.lookup([1, 2]), [])
@@ -0,0 +1,59 @@
+# Copyright (C) 2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pithos.backends.lib import sqlite
+
+
+class TestSQLiteWrapper(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='snf_test_dbwrapper_')
+        path = os.path.join(self.dir, 'db')
+        self.writer = sqlite.DBWrapper(path)
+        self.reader = sqlite.DBWrapper(path)
+
+    def tearDown(self):
+        self.writer.close()
+        self.reader.close()
+        shutil.rmtree(self.dir)
+
+    def test_readers_do_not_block_writers(self):
+        mode = self.writer.conn.execute('pragma journal_mode').fetchone()[0]
+        self.assertEqual(mode, 'wal')
+        self.writer.conn.execute('create table t (x integer)')
+        self.writer.conn.commit()
+
+        self.reader.execute()
+        self.assertEqual(
+            self.reader.conn.execute('select count(*) from t').fetchone(),
+            (0,))
+        # The writer commits while the reader is in a transaction.
+        self.writer.execute()
+        self.writer.conn.execute('insert into t values (1)')
+        self.writer.commit()
+        # The reader keeps its snapshot until its transaction ends.
+        self.assertEqual(
+            self.reader.conn.execute('select count(*) from t').fetchone(),
+            (0,))
+        self.assertTrue(self.reader.in_transaction())
+        self.reader.commit()
+        self.assertFalse(self.reader.in_transaction())
+        self.assertEqual(
+            self.reader.conn.execute('select count(*) from t').fetchone(),
+            (1,))
@@ -0,0 +1,83 @@
+# Copyright (C) 2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+from binascii import hexlify
+
+from pithos.backends.lib.hashfiler.filestore import Store
+from pithos.backends.test.util import get_random_data
+
+
+class TestFileStore(unittest.TestCase):
+    block_size = 1024
+    hash_algorithm = 'sha256'
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='snf_test_pithos_filestore_')
+        self.store = Store(block_size=self.block_size,
+                           hash_algorithm=self.hash_algorithm,
+                           path=self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_block_put_get(self):
+        data = get_random_data(self.block_size / 2)
+        h = self.store.block_put(data)
+        block = self.store.block_get(h)
+        self.assertEqual(len(block), self.block_size)
+        self.assertEqual(block.rstrip('\x00'), data)
+        self.assertEqual(self.store.block_get_archipelago(hexlify(h)), block)
+
+        # blocks are sharded by their hash prefix
+        hexh = hexlify(h)
+        self.assertTrue(os.path.exists(os.path.join(
+            self.path, 'blocks', hexh[:2], hexh[2:4], hexh)))
+
+        # storing the same block again is a no-op
+        self.assertEqual(self.store.block_put(data), h)
+
+    def test_block_search(self):
+        present = self.store.block_put(get_random_data(10))
+        absent = self.store.blocker.block_hash(get_random_data(10))
+        missing = self.store.block_search([present, absent, absent])
+        self.assertEqual(missing, [absent])
+        self.assertEqual(self.store.block_get(absent), None)
+
+    def test_block_update(self):
+        data = get_random_data(self.block_size)
+        h = self.store.block_put(data)
+        h2 = self.store.block_update(h, 10, 'abc')
+        block = self.store.block_get(h2)
+        self.assertEqual(block, data[:10] + 'abc' + data[13:])
+
+    def test_map_put_get(self):
+        hashes = [hexlify(self.store.block_put(get_random_data(100)))
+                  for _ in range(3)]
+        self.store.map_put('snf_file_test', hashes, 300, self.block_size)
+        self.assertEqual(self.store.map_get('snf_file_test', 300), hashes)
+        self.assertRaises(Exception, self.store.map_get, 'snf_file_none', 0)
+
+    def test_map_put_invalid(self):
+        h = hexlify(self.store.block_put(get_random_data(100)))
+        for name in ('archip_volume', h[:-2], h + '00'):
+            self.assertRaises(ValueError, self.store.map_put,
+                              'snf_file_test', [h, name], 200,
+                              self.block_size)
+        # Nothing is stored for the rejected maps
+        self.assertRaises(Exception, self.store.map_get, 'snf_file_test', 0)
@@ -0,0 +1,75 @@
+# Copyright (C) 2014 GRNET S.A.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from mock import patch
+
+from pithos.backends.test.util import get_random_name
+
+
+class TestListingMixin(object):
+    paths = ['a', 'a/', 'a/1', 'a/2', 'a/b/1', 'a/b/2', 'a/c/', 'a0', 'a0/1',
+             'b', 'b/1', 'b/2/3', 'c/', 'd']
+
+    def _create_tree(self):
+        self.container = get_random_name()
+        self.b.put_container(self.account, self.account, self.container)
+        for p in self.paths:
+            self.upload_object(self.account, self.account, self.container, p,
+                               length=1)
+
+    def _list(self, **kwargs):
+        return [o[0] for o in self.b.list_objects(
+            self.account, self.account, self.container, **kwargs)]
+
+    def _expected(self, prefix, delimiter):
+        # Objects ending with the delimiter are listed both as objects and
+        # as common prefixes (if there are objects under them).
+        objects, prefixes = [], set()
+        for p in self.paths:
+            if not p.startswith(prefix):
+                continue
+            idx = p.find(delimiter, len(prefix))
+            if idx < 0 or idx + len(delimiter) == len(p):
+                objects.append(p)
+            else:
+                prefixes.add(p[:idx + len(delimiter)])
+        return sorted(objects + list(prefixes))
+
+    def _check_delimiter(self):
+        for prefix in ('', 'a/', 'a', 'b/'):
+            self.assertEqual(self._list(prefix=prefix, delimiter='/'),
+                             self._expected(prefix, '/'))
+
+    def test_list_delimiter(self):
+        self._create_tree()
+        self._check_delimiter()
+        # Only the SQLAlchemy backend fetches delimited listings in pages.
+        if self.db_module == 'pithos.backends.lib.sqlalchemy':
+            for page_size in (2, 3):
+                with patch('pithos.backends.lib.sqlalchemy.node.'
+                           'LISTING_PAGE_SIZE', page_size):
+                    self._check_delimiter()
+
+    def test_list_limit(self):
+        self._create_tree()
+        objects = []
+        marker = None
+        while True:
+            page = self._list(marker=marker, limit=4)
+            objects.extend(page)
+            if len(page) < 4:
+                break
+            marker = page[-1]
+        self.assertEqual(objects, sorted(self.paths))
@@ -0,0 +1,105 @@
+# Copyright (C) 2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import hashlib
+import unittest
+from multiprocessing.pool import ThreadPool
+
+from synnefo.lib.merkle import (MerkleTree, MerkleTreeCache, hash_blocks,
+                                block_hash)
+from pithos.backends.test.util import get_random_data
+
+
+def _hash(v):
+    return hashlib.sha256(v).digest()
+
+
+def naive_merkle(hashes):
+    if len(hashes) == 0:
+        return _hash('')
+    if len(hashes) == 1:
+        return hashes[0]
+    h = list(hashes)
+    s = 2
+    while s < len(h):
+        s = s * 2
+    h += [('\x00' * len(h[0]))] * (s - len(h))
+    while len(h) > 1:
+        h = [_hash(h[x] + h[x + 1]) for x in range(0, len(h), 2)]
+    return h[0]
+
+
+class TestMerkleTree(unittest.TestCase):
+    def _hashes(self, n):
+        return [_hash(get_random_data(8)) for _ in xrange(n)]
+
+    def test_root(self):
+        for n in range(0, 20):
+            hashes = self._hashes(n)
+            tree = MerkleTree('sha256', hashes)
+            self.assertEqual(tree.root(), naive_merkle(hashes))
+
+    def test_update(self):
+        hashes = self._hashes(11)
+        tree = MerkleTree('sha256', hashes)
+        for i in (0, 5, 10):
+            hashes[i] = _hash(get_random_data(8))
+            tree.update(i, hashes[i])
+            self.assertEqual(tree.root(), naive_merkle(hashes))
+        self.assertRaises(IndexError, tree.update, 11, hashes[0])
+
+    def test_append(self):
+        tree = MerkleTree('sha256')
+        hashes = []
+        for h in self._hashes(9):
+            hashes.append(h)
+            tree.append(h)
+            self.assertEqual(tree.root(), naive_merkle(hashes))
+
+    def test_update_leaves(self):
+        hashes = self._hashes(13)
+        tree = MerkleTree('sha256', hashes)
+        for n in (13, 16, 20, 9, 1, 0, 7):
+            # Keep about half of the original hashes.
+            new = [random.choice(hashes) for _ in xrange(n // 2)]
+            new += self._hashes(n - len(new))
+            tree.update_leaves(new)
+            self.assertEqual(tree.root(), naive_merkle(new))
+            self.assertEqual(tree.leaves(), new)
+
+    def test_cache(self):
+        cache = MerkleTreeCache(10)
+        tree = MerkleTree('sha256', self._hashes(6))
+        cache.put(tree)
+        cached = cache.get(tree.root())
+        self.assertEqual(cached.root(), tree.root())
+        cached.update(0, _hash('x'))
+        self.assertEqual(cache.get(tree.root()).root(), tree.root())
+
+        cache.put(MerkleTree('sha256', self._hashes(6)))
+        self.assertEqual(cache.get(tree.root()), None)
+
+    def test_hash_blocks(self):
+        blocks = [get_random_data(100) + '\x00' * 10 for _ in xrange(20)]
+        expected = [block_hash('sha256', b) for b in blocks]
+        self.assertEqual(expected[0], _hash(blocks[0][:100]))
+        pool = ThreadPool(4)
+        try:
+            self.assertEqual(list(hash_blocks(iter(blocks), 'sha256', pool)),
+                             expected)
+        finally:
+            pool.close()
+        self.assertEqual(list(hash_blocks(blocks, 'sha256')), expected)
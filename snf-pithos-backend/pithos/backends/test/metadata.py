@@ -0,0 +1,85 @@
+# Copyright (C) 2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from pithos.backends.test.util import get_random_name
+
+DOMAINS = ('pithos', 'plankton')
+
+
+class TestMetadataMixin(object):
+    def _set_meta(self, container, name):
+        for domain in DOMAINS:
+            self.b.update_object_meta(
+                self.account, self.account, container, name, domain,
+                {'%s-key' % domain: '%s-%s' % (domain, name)})
+
+    def _get_meta(self, container, name):
+        meta = {}
+        for domain in DOMAINS:
+            key = '%s-key' % domain
+            m = self.b.get_object_meta(self.account, self.account, container,
+                                       name, domain)
+            meta[domain] = m.get(key)
+        return meta
+
+    def test_update_keeps_other_domains(self):
+        container, name = get_random_name(), get_random_name()
+        self.b.put_container(self.account, self.account, container)
+        self.upload_object(self.account, self.account, container, name)
+        self._set_meta(container, name)
+
+        self.b.update_object_meta(self.account, self.account, container,
+                                  name, 'pithos', {'other': 'value'})
+        self.assertEqual(self._get_meta(container, name),
+                         {'pithos': 'pithos-%s' % name,
+                          'plankton': 'plankton-%s' % name})
+
+        self.b.copy_object(self.account, self.account, container, name,
+                           self.account, container, 'copy',
+                           'application/octet-stream', 'pithos',
+                           meta={'other': 'value'}, replace_meta=True)
+        self.assertEqual(self._get_meta(container, 'copy'),
+                         {'pithos': None,
+                          'plankton': 'plankton-%s' % name})
+
+    def _test_copy_dir(self, versioning):
+        container = get_random_name()
+        self.b.put_container(self.account, self.account, container,
+                             policy={'versioning': versioning})
+        self.create_folder(self.account, self.account, container, 'folder')
+        names = ['folder/a', 'folder/b', 'folder/b/c']
+        for name in names:
+            self.upload_object(self.account, self.account, container, name)
+            self._set_meta(container, name)
+
+        self.b.copy_object(self.account, self.account, container, 'folder',
+                           self.account, container, 'other',
+                           'application/directory', 'pithos',
+                           delimiter='/')
+        for name in names:
+            meta = self._get_meta(container,
+                                  name.replace('folder', 'other', 1))
+            self.assertEqual(meta, {'pithos': 'pithos-%s' % name,
+                                    'plankton': 'plankton-%s' % name})
+            # The source keeps its metadata.
+            self.assertEqual(self._get_meta(container, name),
+                             {'pithos': 'pithos-%s' % name,
+                              'plankton': 'plankton-%s' % name})
+
+    def test_copy_dir(self):
+        self._test_copy_dir('auto')
+
+    def test_copy_dir_without_versioning(self):
+        self._test_copy_dir('none')
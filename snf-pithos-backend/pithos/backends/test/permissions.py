@@ -0,0 +1,95 @@
+# Copyright (C) 2016 GRNET S.A. and individual contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from mock import patch
+
+from pithos.backends.exceptions import NotAllowedError
+from pithos.backends.test.util import get_random_name
+
+
+class TestPermissionsMixin(object):
+    def _access(self, user, container, name):
+        t = user, self.account, container, name
+        access = []
+        for check in (self.b._can_read_object, self.b._can_write_object):
+            self.b._reset_allowed_paths()
+            try:
+                check(*t)
+            except NotAllowedError:
+                access.append(False)
+            else:
+                access.append(True)
+        return tuple(access)
+
+    def _assert_access(self, user, container, name, access):
+        self.assertEqual(self._access(user, container, name), access)
+        # The cached permissions agree with the database.
+        acl_cache, self.b.acl_cache = self.b.acl_cache, None
+        try:
+            self.assertEqual(self._access(user, container, name), access)
+        finally:
+            self.b.acl_cache = acl_cache
+
+    def _upload(self, container, name, type_='application/octet-stream',
+                permissions=None):
+        self.upload_object(self.account, self.account, container, name,
+                           data='', length=0, type_=type_,
+                           permissions=permissions)
+
+    def test_inherited_permissions(self):
+        other, third = get_random_name(), get_random_name()
+        container = get_random_name()
+        self.b.put_container(self.account, self.account, container)
+        self._upload(container, 'folder', type_='application/directory',
+                     permissions={'read': [other], 'write': [third]})
+        self._upload(container, 'folder/a')
+        self._upload(container, 'folder/b', permissions={'read': [third]})
+        self._upload(container, 'file', permissions={'read': ['*']})
+        self._upload(container, 'file/c')
+
+        self._assert_access(other, container, 'folder', (True, False))
+        self._assert_access(third, container, 'folder', (True, True))
+        self._assert_access(other, container, 'folder/a', (True, False))
+        self._assert_access(third, container, 'folder/a', (True, True))
+        # Permissions of a deeper path override the inherited ones.
+        self._assert_access(other, container, 'folder/b', (False, False))
+        self._assert_access(third, container, 'folder/b', (True, False))
+        self._assert_access(other, container, 'file', (True, False))
+        # Only folders share what is under them.
+        self._assert_access(other, container, 'file/c', (False, False))
+
+    def test_invalidation(self):
+        other = get_random_name()
+        container = get_random_name()
+        self.b.put_container(self.account, self.account, container)
+        self._upload(container, 'object')
+        self._assert_access(other, container, 'object', (False, False))
+
+        self.b.update_object_permissions(
+            self.account, self.account, container, 'object',
+            {'write': ['%s:group' % self.account]})
+        self._assert_access(other, container, 'object', (False, False))
+        self.b.update_account_groups(self.account, self.account,
+                                     {'group': [other]})
+        self._assert_access(other, container, 'object', (True, True))
+
+        # The access of the user is loaded once, until permissions change.
+        with patch.object(self.b.permissions, 'access_list_prefix') as m:
+            self._access(other, container, 'object')
+            self.assertFalse(m.called)
+
+        self.b.update_object_permissions(
+            self.account, self.account, container, 'object', {})
+        self._assert_access(other, container, 'object', (False, False))
@@ -228,14 +228,9 @@ class TestQuotaMixin(object):
         self.expected_issue_commission_calls += [
             call.issue_one_commissions(
                 holder=account,
-                provisions={(account, 'pithos.diskspace'): len(data1)},
-                name='/'.join([account, container,
-                               obj1.replace(folder, other_folder, 1)])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): len(data2)},
-                name='/'.join([account, container,
-                               obj2.replace(folder, other_folder, 1)]))]
+                provisions={(account, 'pithos.diskspace'):
+                            len(data1) + len(data2)},
+                name='/'.join([account, container, other_folder]))]
 
     @assert_issue_commission_calls
     def test_copy_dir_to_other_container(self):
@@ -264,12 +259,9 @@ class TestQuotaMixin(object):
         self.expected_issue_commission_calls += [
             call.issue_one_commissions(
                 holder=account,
-                provisions={(account, 'pithos.diskspace'): len(data1)},
-                name='/'.join([account, container2, obj1])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): len(data2)},
-                name='/'.join([account, container2, obj2]))]
+                provisions={(account, 'pithos.diskspace'):
+                            len(data1) + len(data2)},
+                name='/'.join([account, container2, folder]))]
 
     @assert_issue_commission_calls
     def test_copy_dir_to_other_account(self):
@@ -299,12 +291,9 @@ class TestQuotaMixin(object):
         self.expected_issue_commission_calls += [
             call.issue_one_commissions(
                 holder=other_account,
-                provisions={(other_account, 'pithos.diskspace'): len(data1)},
-                name='/'.join([other_account, container, obj1])),
-            call.issue_one_commissions(
-                holder=other_account,
-                provisions={(other_account, 'pithos.diskspace'): len(data2)},
-                name='/'.join([other_account, container, obj2]))]
+                provisions={(other_account, 'pithos.diskspace'):
+                            len(data1) + len(data2)},
+                name='/'.join([other_account, container, folder]))]
 
     @assert_issue_commission_calls
     def test_copy_dir_to_existing_path(self):
@@ -341,13 +330,8 @@ class TestQuotaMixin(object):
             call.issue_one_commissions(
                 holder=account,
                 provisions={(account, 'pithos.diskspace'):
-                            len(data1) - len(data3)},
-                name='/'.join([account, container, obj3])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): len(data2)},
-                name='/'.join([account, container,
-                               obj2.replace(folder, other_folder, 1)]))]
+                            len(data1) + len(data2) - len(data3)},
+                name='/'.join([account, container, other_folder]))]
 
     @assert_issue_commission_calls
     def test_copy_dir_to_other_project(self):
@@ -387,13 +371,8 @@ class TestQuotaMixin(object):
             call.issue_one_commissions(
                 holder=account,
                 provisions={(project, 'pithos.diskspace'):
-                            len(data1) - len(data3)},
-                name='/'.join([account, other_container, obj3])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(project, 'pithos.diskspace'): len(data2)},
-                name='/'.join([account, other_container,
-                               obj2.replace(folder, other_folder, 1)]))]
+                            len(data1) + len(data2) - len(data3)},
+                name='/'.join([account, other_container, other_folder]))]
 
     @assert_issue_commission_calls
     def test_move_obj(self):
@@ -557,6 +536,27 @@ class TestQuotaMixin(object):
                            domain='pithos',
                            delimiter='/')
 
+    @assert_issue_commission_calls
+    def test_move_dir_in_chunks(self):
+        account = self.account
+        container = get_random_name()
+        self.b.put_container(account, account, container)
+        self.create_folder(account, account, container, 'folder')
+        names = ['folder/a', 'folder/b', 'folder/b/c']
+        for name in names:
+            self._upload_object(account, account, container, name)
+
+        progress = list(self.b.copy_tree(
+            account, account, container, 'folder',
+            account, container, 'other', is_move=True, chunk_size=3))
+        # The folder itself is moved along with the objects under it.
+        self.assertEqual(progress, [(3, 4), (4, 4)])
+        listed = self.b.list_objects(account, account, container,
+                                     prefix='', delimiter=None)
+        self.assertEqual([o[0] for o in listed],
+                         ['other', 'other/a', 'other/b', 'other/b/c'])
+        # No issued commissions
+
     @assert_issue_commission_calls
     def test_move_dir_to_other_container(self):
         account = self.account
@@ -656,21 +656,13 @@ class TestQuotaMixin(object):
             call.issue_one_commissions(
                 holder=account,
                 provisions={(project, 'pithos.diskspace'):
-                            len(data1) - len(data3)},
-                name='/'.join([account, other_container, obj3])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): -len(data1)},
-                name='/'.join([account, container, obj1])),
+                            len(data1) + len(data2) - len(data3)},
+                name='/'.join([account, other_container, other_folder])),
             call.issue_one_commissions(
                 holder=account,
-                provisions={(project, 'pithos.diskspace'): len(data2)},
-                name='/'.join([account, other_container,
-                               obj2.replace(folder, other_folder, 1)])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): -len(data2)},
-                name='/'.join([account, container, obj2]))]
+                provisions={(account, 'pithos.diskspace'):
+                            -len(data1) - len(data2)},
+                name='/'.join([account, other_container, other_folder]))]
 
     @assert_issue_commission_calls
     def test_move_dir_to_other_account(self):
@@ -701,20 +693,14 @@ class TestQuotaMixin(object):
         self.expected_issue_commission_calls += [
             call.issue_one_commissions(
                 holder=other_account,
-                provisions={(other_account, 'pithos.diskspace'): len(data1)},
-                name='/'.join([other_account, container, obj1])),
+                provisions={(other_account, 'pithos.diskspace'):
+                            len(data1) + len(data2)},
+                name='/'.join([other_account, container, folder])),
             call.issue_one_commissions(
                 holder=account,
-                provisions={(account, 'pithos.diskspace'): -len(data1)},
-                name='/'.join([account, container, obj1])),
-            call.issue_one_commissions(
-                holder=other_account,
-                provisions={(other_account, 'pithos.diskspace'): len(data2)},
-                name='/'.join([other_account, container, obj2])),
-            call.issue_one_commissions(
-                holder=account,
-                provisions={(account, 'pithos.diskspace'): -len(data2)},
-                name='/'.join([account, container, obj2]))]
+                provisions={(account, 'pithos.diskspace'):
+                            -len(data1) - len(data2)},
+                name='/'.join([other_account, container, folder]))]
 
     @assert_issue_commission_calls
     def test_delete_container_contents(self):
@@ -194,3 +194,47 @@ class TestSnapshotsMixin(object):
                           domain='test',
                           user='somebody_else',
                           check_permissions=False)
+
+    def test_get_domain_objects_listing(self):
+        other = 'other_%s' % uuidlib.uuid4().hex
+        self.b.put_account(other, other)
+        objects = {'a': (self.account, 10, {'name': 'c', 'format': 'raw'}),
+                   'b': (self.account, 20, {'name': 'a', 'format': 'qcow'}),
+                   'c': (other, 30, {'name': 'b', 'format': 'raw'}),
+                   'd': (other, 40, {'name': 'd', 'format': 'raw'})}
+        for account in (self.account, other):
+            self.b.put_container(account, account, 'images')
+        for name, (account, size, meta) in objects.iteritems():
+            permissions = {'read': [self.account]} if name == 'c' else None
+            self.upload_object(account, account, 'images', name,
+                               length=size, permissions=permissions)
+            self.b.update_object_meta(account, account, 'images', name,
+                                      'test', meta)
+
+        def names(**kwargs):
+            l = self.b.get_domain_objects(domain='test', user=self.account,
+                                          **kwargs)
+            return [path.rsplit('/', 1)[1] for path, _, _ in l]
+
+        # Own and shared objects, ordered by path.
+        l = self.b.get_domain_objects(domain='test', user=self.account)
+        self.assertEqual(sorted(p for p, _, _ in l), [p for p, _, _ in l])
+        self.assertEqual(sorted(names()), ['a', 'b', 'c'])
+        permissions = dict((p.rsplit('/', 1)[1], perms) for p, _, perms in l)
+        self.assertEqual(permissions['a'], {})
+        self.assertEqual(permissions['c'], {'read': [self.account]})
+
+        self.assertEqual(sorted(names(filters={'format': 'raw'})),
+                         ['a', 'c'])
+        self.assertEqual(sorted(names(size_range=(15, None))), ['b', 'c'])
+        self.assertEqual(sorted(names(size_range=(None, 25))), ['a', 'b'])
+        self.assertEqual(names(sort_key='name'), ['b', 'c', 'a'])
+        self.assertEqual(names(sort_key='size', reverse=True), ['c', 'b', 'a'])
+
+        uuid = self.b.get_object_meta(self.account, self.account, 'images',
+                                      'b', include_user_defined=False)['uuid']
+        self.assertEqual(names(sort_key='name', marker=uuid, limit=1), ['c'])
+        self.assertEqual(names(sort_key='size', reverse=True, marker=uuid),
+                         ['a'])
+        self.assertRaises(ItemNotExists, names, marker=uuid,
+                          filters={'format': 'raw'})
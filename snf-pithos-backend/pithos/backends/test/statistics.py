@@ -0,0 +1,180 @@
+# Copyright (C) 2014 GRNET S.A.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+from mock import patch
+
+from pithos.backends.modular import CLUSTER_NORMAL, CLUSTER_DELETED
+from pithos.backends.test.util import get_random_data, get_random_name
+
+
+class TestStatisticsMixin(object):
+    def _account_statistics(self):
+        _, node = self.b._lookup_account(self.account)
+        return self.b._get_statistics(node)[:2]
+
+    def _assert_in_sync(self):
+        self.assertEqual(self.b.reconcile_statistics([self.account]), [])
+        _, node = self.b._lookup_account(self.account)
+        stats = self.b.node.statistics_latest(node,
+                                              except_cluster=CLUSTER_DELETED)
+        self.assertEqual(self._account_statistics(), stats[:2])
+
+    def test_account_statistics(self):
+        self.assertEqual(self.b.reconcile_statistics([self.account]), [])
+        c1, c2 = get_random_name(), get_random_name()
+        self.b.put_container(self.account, self.account, c1)
+        self.b.put_container(self.account, self.account, c2)
+        self._assert_in_sync()
+
+        names = [get_random_name() for _ in range(3)]
+        for i, name in enumerate(names):
+            data = get_random_data(10 * (i + 1))
+            self.upload_object(self.account, self.account, c1, name,
+                               data=data, length=len(data))
+        self.upload_object(self.account, self.account, c2, names[0],
+                           data='abc', length=3)
+        self._assert_in_sync()
+        self.assertEqual(self._account_statistics(), (2, 63))
+
+        # New versions, metadata updates and deletions.
+        self.upload_object(self.account, self.account, c1, names[0],
+                           data='x', length=1)
+        self.b.update_object_meta(self.account, self.account, c1, names[1],
+                                  'pithos', {'k': 'v'})
+        self.b.update_container_meta(self.account, self.account, c2,
+                                     'pithos', {'k': 'v'})
+        self.b.delete_object(self.account, self.account, c1, names[2])
+        self._assert_in_sync()
+        self.assertEqual(self._account_statistics(), (2, 24))
+
+        # Purges and container removal.
+        self.b.delete_container(self.account, self.account, c1,
+                                until=time.time() + 1)
+        self.b.delete_object(self.account, self.account, c2, names[0])
+        self.b.delete_container(self.account, self.account, c2)
+        self._assert_in_sync()
+        self.assertEqual(self._account_statistics(), (1, 21))
+
+    def test_reconcile_statistics(self):
+        container = get_random_name()
+        self.b.put_container(self.account, self.account, container)
+        self.upload_object(self.account, self.account, container,
+                           get_random_name(), data='abc', length=3)
+        _, node = self.b._lookup_account(self.account)
+        self.b.node.statistics_update(node, 1, 100, 0, CLUSTER_NORMAL)
+
+        unsynced = self.b.reconcile_statistics([self.account])
+        self.assertEqual(unsynced, [(self.account, CLUSTER_NORMAL,
+                                     (2, 103), (1, 3))])
+        self.assertEqual(self.b.reconcile_statistics([self.account]),
+                         unsynced)
+        self.b.reconcile_statistics([self.account], fix=True)
+        self.assertEqual(self.b.reconcile_statistics([self.account]), [])
+        self.assertEqual(self._account_statistics(), (1, 3))
+
+    def test_batched_statistics_updates(self):
+        container = get_random_name()
+        self.b.put_container(self.account, self.account, container)
+        names = [get_random_name() for _ in range(5)]
+        for name in names:
+            self.upload_object(self.account, self.account, container, name,
+                               data='abc', length=3)
+        _, container_node = self.b._lookup_container(self.account, container)
+
+        self.b.pre_exec()
+        try:
+            for name in names:
+                self.b.delete_object(self.account, self.account, container,
+                                     name)
+            # The merged deltas are written before the statistics are read.
+            stats = self.b.node.statistics_get(container_node,
+                                               CLUSTER_NORMAL)
+            self.assertEqual(tuple(stats[:2]), (0, 0))
+        except:
+            self.b.post_exec(False)
+            raise
+        else:
+            self.b.post_exec(True)
+        self._assert_in_sync()
+        self.assertEqual(self._account_statistics(), (1, 0))
+
+    def test_failed_statistics_flush(self):
+        container = get_random_name()
+        self.b.put_container(self.account, self.account, container)
+        name = get_random_name()
+        self.upload_object(self.account, self.account, container, name,
+                           data='abc', length=3)
+        statistics = self._account_statistics()
+
+        self.b.pre_exec()
+        self.b.delete_object(self.account, self.account, container, name)
+        with patch.object(self.b.node, 'statistics_flush',
+                          side_effect=Exception):
+            self.assertRaises(Exception, self.b.post_exec, True)
+        self.assertFalse(self.b.in_transaction)
+
+        # Neither the deletion nor its pending deltas survive.
+        self._assert_in_sync()
+        self.assertEqual(self._account_statistics(), statistics)
+        self.assertEqual([o[0] for o in self.b.list_objects(
+            self.account, self.account, container)], [name])
+
+    def test_purge_container(self):
+        container = get_random_name()
+        self.b.put_container(self.account, self.account, container)
+        names = [get_random_name() for _ in range(3)]
+        for name in names:
+            self.upload_object(self.account, self.account, container, name,
+                               data='abc', length=3)
+        # A new version moves the previous one to history.
+        self.upload_object(self.account, self.account, container, names[0],
+                           data='x', length=1)
+
+        progress = list(self.b.purge_container(
+            self.account, self.account, container, until=time.time() + 1,
+            chunk_size=2))
+        self.assertEqual(progress, [(0, 1)])
+        self._assert_in_sync()
+
+        progress = list(self.b.purge_container(
+            self.account, self.account, container, chunk_size=2))
+        # Objects are deleted, then their history and deletions purged.
+        self.assertEqual(progress, [(2, 0), (3, 0), (3, 2), (3, 3),
+                                    (3, 5), (3, 6)])
+        self.assertEqual(self.b.list_containers(self.account, self.account),
+                         [])
+        self._assert_in_sync()
+        self.assertEqual(self._account_statistics(), (0, 0))
+
+    def test_purge_container_deleted_meanwhile(self):
+        container = get_random_name()
+        self.b.put_container(self.account, self.account, container)
+        names = sorted(get_random_name() for _ in range(3))
+        for name in names:
+            self.upload_object(self.account, self.account, container, name,
+                               data='abc', length=3)
+
+        progress = self.b.purge_container(
+            self.account, self.account, container, chunk_size=2)
+        self.assertEqual(next(progress), (2, 0))
+        self.b.delete_object(self.account, self.account, container, names[2])
+        # The object deleted meanwhile is not counted.
+        self.assertEqual(next(progress), (2, 0))
+        list(progress)
+        self.assertEqual(self.b.list_containers(self.account, self.account),
+                         [])
+        self._assert_in_sync()
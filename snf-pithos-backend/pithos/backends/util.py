@@ -13,6 +13,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+
 from objpool import ObjectPool
 from new import instancemethod
 from select import select
@@ -39,11 +41,15 @@ class PithosBackendPool(ObjectPool):
 
     def _pool_verify(self, backend):
         wrapper = backend.wrapper
-        conn = wrapper.conn
-        if conn.closed:
+        if wrapper.pid != os.getpid():
+            # Every process opens its own connections.
             return False
 
-        if conn.in_transaction():
+        if wrapper.closed:
+            return False
+
+        conn = wrapper.conn
+        if wrapper.in_transaction():
             conn.close()
             return False
 
@@ -73,8 +79,7 @@ class PithosBackendPool(ObjectPool):
         backend._use_count = c
         wrapper = backend.wrapper
         if wrapper.trans is not None:
-            conn = wrapper.conn
-            if conn.closed:
+            if wrapper.closed:
                 wrapper.trans = None
             else:
                 wrapper.rollback()